@@ -2,6 +2,11 @@ import pkg_resources
 import pandas as pd
 
 from caterpillard.caterpillar import CaterpillarDiagram
+from caterpillard.model import CaterpillarModel
+from caterpillard.multimetric import MultiMetricDiagram
+from caterpillard.pipeline import CaterpillarPipeline
+from caterpillard.profiling import Profiler
+from caterpillard.ragged import RaggedPanel
 
 
 def load_dataframe():
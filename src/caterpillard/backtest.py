@@ -0,0 +1,165 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.kernels import classify, difference_of_differences
+from caterpillard.markov import COLORS, transition_probabilities
+
+logger = logging.getLogger(__name__)
+
+
+def color_codes(data):
+    """Color code (0 to 6) of every cohort of a wide panel.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame or Pandas Series
+        Wide format panel, missing values are taken as zero
+
+    Returns
+    -------
+    codes : numpy.ndarray
+        Array of shape ``(n_entities, n_cohorts)``, codes in the
+        order of the colors
+    """
+    frame = data.to_frame().T if isinstance(data, pd.Series) else data
+    values = np.atleast_2d(frame.to_numpy(dtype=np.float64, na_value=np.nan, copy=True))
+    values[np.isnan(values)] = 0
+    n_color = classify(*difference_of_differences(values))
+    if (n_color == 0).any():
+        raise ValueError("Fatal:\tSign combination Not Captured\n")
+    return n_color - 1
+
+
+class RollingBacktest:
+    """Rolling-origin backtest of next-color forecasts.
+
+    The cohort colors of the panel are computed once. A cut-off
+    (origin) at cohort ``k`` knows the colors of cohorts ``0`` to
+    ``k`` of every entity, its transition matrix holds the
+    transitions between them, counted within each entity. The counts
+    of every cut-off are read from a prefix sum over the time axis of
+    the per-cohort transition counts, so no cut-off is recomputed
+    from scratch.
+
+    The ``h`` step forecast of an entity is the row of its color at
+    the cut-off in the ``h``-th power of the transition matrix, the
+    powers of all cut-offs being evaluated as batched matrix
+    products. The predicted color is the most likely one (ties go to
+    the first color), scored against the actual color of cohort
+    ``k + h`` for every entity and cut-off at once.
+
+    Results are stored in :attr:`summary` (accuracy, log-loss and
+    accuracy of the persistence forecast per horizon),
+    :attr:`by_origin` (the same per horizon and cut-off) and
+    :attr:`confusion` (actual vs predicted colors per horizon).
+    """
+
+    def __init__(self, data, max_horizon=3, first_origin=1, alpha=0.0, eps=1e-15):
+        """Constructor
+
+        Parameters
+        ----------
+        data : Pandas DataFrame or Pandas Series
+            Wide format panel
+        max_horizon : int
+            Horizons ``1`` to ``max_horizon`` are scored
+        first_origin : int
+            Index (from 0) of the cohort of the first cut-off, at
+            least 1 so that every cut-off knows a transition
+        alpha : float
+            Pseudo-count added to every transition count. Colors
+            never left before a cut-off are forecast to persist.
+        eps : float
+            Probabilities are clipped to ``[eps, 1 - eps]`` in the
+            log-loss
+        """
+        if not isinstance(data, (pd.DataFrame, pd.Series)):
+            raise TypeError("data should be a Pandas DataFrame or Series")
+        if type(max_horizon) is not int or max_horizon < 1:
+            raise ValueError("max_horizon should be a positive integer")
+        self.codes = color_codes(data)
+        n_entities, n_cohorts = self.codes.shape
+        if not 1 <= first_origin <= n_cohorts - 2:
+            raise ValueError(f"first_origin should be between 1 and {n_cohorts - 2}")
+        self.max_horizon = max_horizon
+
+        # transitions counted at the position of their first cohort
+        position = np.broadcast_to(
+            np.arange(n_cohorts - 1), (n_entities, n_cohorts - 1)
+        )
+        counts = np.bincount(
+            (position * 49 + self.codes[:, :-1] * 7 + self.codes[:, 1:]).ravel(),
+            minlength=(n_cohorts - 1) * 49,
+        ).reshape(-1, 7, 7)
+        # cumulative[k] holds the transitions among cohorts 0 to k
+        cumulative = np.zeros((n_cohorts, 7, 7), dtype=np.int64)
+        np.cumsum(counts, axis=0, out=cumulative[1:])
+
+        origins = np.arange(first_origin, n_cohorts - 1)
+        self.transition_counts = cumulative[origins]
+        prob = transition_probabilities(self.transition_counts + alpha)
+        unseen = prob.sum(axis=-1) == 0
+        prob[unseen] = np.eye(7)[np.nonzero(unseen)[1]]
+        powers = np.empty((len(origins), max_horizon, 7, 7))
+        powers[:, 0] = prob
+        for h in range(1, max_horizon):
+            powers[:, h] = powers[:, h - 1] @ prob
+        predicted = powers.argmax(axis=-1)
+
+        # the last period of cohort k labels the cut-off
+        periods = data.index if isinstance(data, pd.Series) else data.columns
+        self.origins = pd.Index(periods[origins + 2], name="origin")
+
+        summary, by_origin, self.confusion = [], [], {}
+        for h in range(1, max_horizon + 1):
+            scored = np.flatnonzero(origins + h <= n_cohorts - 1)
+            if not len(scored):
+                break
+            last = self.codes[:, origins[scored]]
+            actual = self.codes[:, origins[scored] + h]
+            # one column per cut-off, one row per entity
+            forecast = predicted[scored, h - 1, last]
+            p_actual = powers[scored, h - 1, last, actual]
+            loss = -np.log(np.clip(p_actual, eps, 1 - eps))
+            hit = forecast == actual
+            stay = last == actual
+
+            summary.append((h, hit.size, hit.mean(), loss.mean(), stay.mean()))
+            by_origin.append(
+                pd.DataFrame(
+                    {
+                        "horizon": h,
+                        "origin": self.origins[scored],
+                        "n": n_entities,
+                        "accuracy": hit.mean(axis=0),
+                        "log_loss": loss.mean(axis=0),
+                        "persistence_accuracy": stay.mean(axis=0),
+                    }
+                )
+            )
+            self.confusion[h] = pd.DataFrame(
+                np.bincount((actual * 7 + forecast).ravel(), minlength=49).reshape(
+                    7, 7
+                ),
+                index=pd.Index(COLORS, name="actual"),
+                columns=pd.Index(COLORS, name="predicted"),
+            )
+            logger.info(
+                f"Horizon {h}: accuracy {hit.mean():.4f}, log-loss {loss.mean():.4f}"
+            )
+
+        self.summary = pd.DataFrame(
+            summary,
+            columns=["horizon", "n", "accuracy", "log_loss", "persistence_accuracy"],
+        ).set_index("horizon")
+        self.by_origin = pd.concat(by_origin).set_index(["horizon", "origin"])
+
+    def transition_mat(self, origin):
+        """Transition counts known at a cut-off, labelled by color"""
+        return pd.DataFrame(
+            self.transition_counts[self.origins.get_loc(origin)],
+            index=COLORS,
+            columns=COLORS,
+        )
@@ -4,7 +4,6 @@ import os
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import pandas.api.types as ptypes
 
 from collections import Counter
@@ -12,6 +11,14 @@ from pathlib import Path
 from time import sleep
 from progressbar import progressbar
 
+from caterpillard.dedup import dedup_stats, row_groups, unique_apply, weighted_pairs
+from caterpillard.kernels import assign_radius, entity_matrix
+from caterpillard.kernels import radius_thresholds as radius_thresholds_of
+from caterpillard.grouping import entity_codes, group_transition_counts, rollup
+from caterpillard.markov import COLORS, stationary_power, transition_probabilities
+from caterpillard.profiling import NULL_STAGE, profiled
+from caterpillard.ragged import RaggedPanel
+
 
 class CaterpillarDiagram:
     """Main class for generating Caterpillar Diagram and subsequent forecasting
@@ -19,7 +26,10 @@ class CaterpillarDiagram:
     
     """
 
-    def __init__(self, data, relative: bool, output_path=None) -> None:
+    @profiled("__init__", rows=lambda self: len(self.data))
+    def __init__(
+        self, data, relative: bool, output_path=None, profiler=None, horizon=None
+    ) -> None:
         """Constructor
 
         The class constructor will initialize the ``data`` 
@@ -34,7 +44,7 @@ class CaterpillarDiagram:
 
         Parameters
         ----------
-        data : Pandas Series or DataFrame
+        data : Pandas Series or DataFrame or RaggedPanel
             Univariate data as an input for the package
              in wide format.
 
@@ -44,6 +54,11 @@ class CaterpillarDiagram:
             in the dataset. Refer to the example dataset or
             tutorial section for further details. 
 
+            Long format data is accepted as a
+            :class:`caterpillard.ragged.RaggedPanel` for
+            relative analysis, see
+            :meth:`caterpillar.CaterpillarDiagram.from_long`
+
         relative : bool
             Boolean argument for executing a relative analysis
             or an individual analysis
@@ -53,6 +68,13 @@ class CaterpillarDiagram:
             When user doesn't specify an output path, the 
             constructor will create a ``caterpillard_output``
             directory in the current working directory.
+        profiler : caterpillard.profiling.Profiler
+            Records wall time, CPU time, peak memory and rows of
+            every stage and file written. Disabled by default.
+        horizon : int
+            Only the last ``horizon`` cohorts of every entity are
+            classified and sized, from the last ``horizon + 2``
+            periods of the input. All cohorts by default.
         
         Returns
         -------
@@ -60,8 +82,20 @@ class CaterpillarDiagram:
 
         """
         self.logger = logging.getLogger(__name__)
+        self.profiler = profiler
+
+        if horizon is not None and type(horizon) is not int:
+            raise TypeError("Parameter horizon must be an integer")
+        if horizon is not None and horizon < 1:
+            sys.exit("Parameter horizon must be at least one cohort")
+        self.horizon = horizon
 
         # Raise exceptions for non-compliant inputs from user
+        if isinstance(data, pd.DataFrame) and data.columns.nlevels > 1:
+            raise TypeError(
+                "Multi-metric panels should be analysed with "
+                "caterpillard.MultiMetricDiagram"
+            )
         if isinstance(data, pd.DataFrame) or isinstance(data, pd.Series):
             self.logger.info("Input Data type is correct")
             self.data = data
@@ -74,6 +108,16 @@ class CaterpillarDiagram:
             except AssertionError as e:
                 sys.exit(e)
 
+        elif isinstance(data, RaggedPanel):
+            self.logger.info("Long format input received as ragged panel")
+            self.data = data
+            try:
+                assert (
+                    data.n_periods >= 3
+                ), "Inappropriate number of periods in long format input data"
+            except AssertionError as e:
+                sys.exit(e)
+
         else:
             raise TypeError(
                 "Input parameter 'data' should be Pandas Series or Pandas DataFrame"
@@ -149,12 +193,12 @@ class CaterpillarDiagram:
                 )
                 self.output_path = out_path
 
-        if relative and isinstance(self.data, pd.DataFrame):
+        if relative and isinstance(self.data, (pd.DataFrame, RaggedPanel)):
             self.logger.debug(
                 "\nInitial Check:\tCorrect form of data input for relative analysis\n"
             )
 
-        elif not relative and not isinstance(self.data, pd.DataFrame):
+        elif not relative and isinstance(self.data, pd.Series):
             self.logger.debug(
                 "\nInitial Check:\tCorrect form of data input for Individual analysis\n"
             )
@@ -162,6 +206,93 @@ class CaterpillarDiagram:
         else:
             sys.exit("\nError:\tData input type mismatched with type of analysis\n")
 
+    @classmethod
+    def from_long(
+        cls,
+        data,
+        entity="entity",
+        period="period",
+        value="value",
+        gap="split",
+        period_axis=None,
+        output_path=None,
+        profiler=None,
+        horizon=None,
+    ):
+        """Constructor for long format data
+
+        Stores every entity as a ragged segment of its observed
+        periods instead of pivoting the data to wide format, see
+        :class:`caterpillard.ragged.RaggedPanel`. The analysis is
+        always relative.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame
+            Long format input with one row per entity and period
+        entity : str
+            Column holding the entity identifier
+        period : str
+            Column holding the period
+        value : str
+            Column holding the observed value
+        gap : str
+            Handling of periods in which an entity was not observed.
+            ``split`` forms cohorts only from consecutive observed
+            periods, ``bridge`` ignores the gaps and ``zero`` fills
+            the gaps inside the observed span with zero.
+        period_axis : array-like
+            Complete ordered list of periods
+        output_path : str
+            User-defined path for output data
+        profiler : caterpillard.profiling.Profiler
+            Per-stage instrumentation, disabled by default
+        horizon : int
+            Number of last cohorts computed, all by default
+
+        Returns
+        -------
+        CaterpillarDiagram
+        """
+        panel = RaggedPanel.from_long(
+            data,
+            entity=entity,
+            period=period,
+            value=value,
+            period_axis=period_axis,
+            gap=gap,
+        )
+        return cls(
+            panel,
+            relative=True,
+            output_path=output_path,
+            profiler=profiler,
+            horizon=horizon,
+        )
+
+    def _stage(self, name, rows=None):
+        """Profiler stage, or a no-op context when profiling is disabled"""
+        if self.profiler is None:
+            return NULL_STAGE
+        return self.profiler.stage(name, rows=rows)
+
+    def _windowed(self):
+        """Input data restricted to the last ``horizon + 2`` periods"""
+        if self.horizon is None:
+            return self.data
+        n_periods = self.horizon + 2
+        if isinstance(self.data, RaggedPanel):
+            return self.data.tail(n_periods)
+        if isinstance(self.data, pd.DataFrame):
+            return self.data.iloc[:, -n_periods:]
+        return self.data.iloc[-n_periods:]
+
+    def _write_csv(self, df, file_name, **kwargs):
+        """Write ``df`` to the output path as a profiled stage"""
+        with self._stage(f"write {file_name}", rows=len(df)):
+            df.to_csv(f"{self.output_path}/{file_name}", **kwargs)
+
+    @profiled("data_summary", rows=lambda self: len(self.data))
     def data_summary(self):
         """Initial data summary
 
@@ -189,6 +320,18 @@ class CaterpillarDiagram:
         """
         self.logger.debug("Summarizing Data")
         print("Summarizing Data")
+        if isinstance(self.data, RaggedPanel):
+            self.logger.info(
+                f"Ragged panel: {len(self.data)} entities, "
+                f"{self.data.n_observations} observations, "
+                f"{self.data.nbytes} bytes"
+            )
+            self.logger.debug(f"Length of data: {self.data.n_periods}")
+            self.n_cohorts = self.data.n_periods - 2
+            if self.horizon is not None:
+                self.n_cohorts = min(self.n_cohorts, self.horizon)
+            self.logger.debug(f"Number of cohorts in caterpillar: {self.n_cohorts}")
+            return
         if self.relative:
             self.logger.info(self.data.info())
             self.logger.debug(f"Length of data: {len(self.data.T)}")
@@ -199,6 +342,9 @@ class CaterpillarDiagram:
 
         self.logger.debug(f"Number of cohorts in caterpillar: {len(self.data.T) - 2}")
         self.n_cohorts = len(self.data.T) - 2
+        if self.horizon is not None:
+            # windowed mode, only the last cohorts are computed
+            self.n_cohorts = min(self.n_cohorts, self.horizon)
 
         return
 
@@ -338,7 +484,8 @@ class CaterpillarDiagram:
             return n_color
             # {"level": level, "color": color, "n_color": n_color}
 
-    def color_schema(self):
+    @profiled("color_schema", rows=lambda self: len(self.complete_cohort_df))
+    def color_schema(self, deduplicate=True):
         """Generate the color schema using DoD
 
         This method will generate the color schema using
@@ -351,6 +498,11 @@ class CaterpillarDiagram:
         Pre-processing: NAs in the input data will get 
         filled with zero
 
+        Long format input (a
+        :class:`caterpillard.ragged.RaggedPanel`) is never pivoted
+        or filled, its cohorts are formed only over observed
+        periods as per the ``gap`` option of the panel.
+
         This method utilizes 
         :meth:`caterpillar.CaterpillarDiagram.schema()`
         to assign a color and level to the combination of 
@@ -359,18 +511,42 @@ class CaterpillarDiagram:
         Writes complete cohort details to the filesystem
         at the given output_path
         
+        In relative analysis, identical series and constant series
+        (for instance all missing) are grouped first, see
+        :func:`caterpillard.dedup.row_groups`. Every group is
+        classified once and its cohorts are shared by all its
+        entities, the cohort details are the same as without
+        deduplication.
+
         :ivar cohort_df: Pandas DataFrame
 
             Stores all cohort details like color of the cohort,
             level of the cohort, and the respective first and 
             second differences for each cohort in a class variable
+
+        :ivar dedup_stats: dictionary
+
+            Number of entities, of distinct and of constant series
+            and the share of entities not classified (dedup ratio),
+            in relative analysis
+
+        Parameters
+        ----------
+        deduplicate : bool
+            Classify identical and constant series once
         """
         self.logger.debug("Generating Schema")
-        if isinstance(self.data, pd.DataFrame):
+        if isinstance(self.data, RaggedPanel):
+            self.logger.debug("Ragged panel received, skipping the wide pivot")
+            self.complete_cohort_df = self._windowed().cohorts()
+            self._write_csv(self.complete_cohort_df, "cohort_df.csv", index=False)
+        elif isinstance(self.data, pd.DataFrame):
             self.logger.debug("DataFrame received")  # Log
             self.logger.debug("Filling NAs with zero")
-            self.data = self.data.fillna(value=0)
-            d11 = self.data.diff(periods=1, axis=1).iloc[:, 1:]
+            # cohorts before the horizon are never differenced or filled
+            data = self._windowed().fillna(value=0)
+            first_cohort = self.data.shape[1] - data.shape[1]
+            d11 = data.diff(periods=1, axis=1).iloc[:, 1:]
             d12 = d11.shift(periods=-1, axis=1).iloc[:, :-1]
             d2 = d11.diff(periods=1, axis=1).iloc[:, 1:]
 
@@ -383,11 +559,22 @@ class CaterpillarDiagram:
             self.logger.debug(f"d2 len:\t {len(d2)}")  # log
 
             self.logger.debug(f"shape: {d11.shape}")
+            # identical series share their cohorts and constant series
+            # only have grey cohorts, each group is classified once
+            if deduplicate:
+                representative, constant = row_groups(data.to_numpy(dtype=np.float64))
+            else:
+                representative = np.arange(len(data))
+                constant = np.zeros(len(data), dtype=bool)
+            self.dedup_stats = dedup_stats(representative, constant)
+            self.logger.info(f"Deduplication: {self.dedup_stats}")
+
             cohort_df = []
             # in relative analysis, d11, d12 and d2 is a
-            # dataframe. So, iter as many times as there are
-            # unique index rows in d11. So, d11.shape[0]-1
-            for i in range(d11.shape[0]):
+            # dataframe. So, iter once for every distinct
+            # series (the first row of every group)
+            unique_rows = np.flatnonzero(representative == np.arange(len(data)))
+            for i in unique_rows:
                 cohort_data = pd.concat(
                     [
                         pd.Series(d11.iloc[i, :-1].values),
@@ -398,9 +585,19 @@ class CaterpillarDiagram:
                     axis=1,
                 )
                 cohort_data.loc[:, "data_index"] = d11.iloc[i, :].name
-                cohort_name_list = [f"Cohort{i+1}" for i in range(len(cohort_data))]
+                cohort_name_list = [
+                    f"Cohort{first_cohort + i + 1}" for i in range(len(cohort_data))
+                ]
                 cohort_data.loc[:, "Cohort"] = cohort_name_list
 
+                if constant[i]:
+                    # every cohort has the color of the first one
+                    first = cohort_data.iloc[0]
+                    for out in ["color", "level", "n_color"]:
+                        cohort_data.loc[:, out] = self.schema(first, out=out)
+                    cohort_df.append(cohort_data)
+                    continue
+
                 cohort_data.loc[:, "color"] = cohort_data.apply(
                     lambda x: self.schema(x, out="color"), axis=1,
                 )
@@ -414,12 +611,32 @@ class CaterpillarDiagram:
                 )
                 cohort_df.append(cohort_data)
 
-            self.complete_cohort_df = pd.concat(cohort_df, axis=0)
+            # one frame of the distinct series, the rows of every entity
+            # are taken from the rows of its representative
+            n_cohorts = d12.shape[1]
+            slot = np.searchsorted(unique_rows, representative)
+            rows = (slot[:, None] * n_cohorts + np.arange(n_cohorts)).ravel()
+            self.complete_cohort_df = pd.concat(cohort_df, axis=0).take(rows)
+            self.complete_cohort_df["data_index"] = np.repeat(
+                d11.index.to_numpy(), n_cohorts
+            )
+            # kept for schema_transitions while the cohorts are unchanged
+            self._cohort_groups = {
+                "cohorts": self.complete_cohort_df,
+                "rows": unique_rows,
+                "slot": slot,
+                "codes": np.stack(
+                    [
+                        frame["n_color"].to_numpy(dtype=np.int64) - 1
+                        for frame in cohort_df
+                    ]
+                ),
+            }
             self.logger.debug(
                 f"Complete_cohort info:\n{self.complete_cohort_df.info()}"
             )
-            self.complete_cohort_df.to_csv(
-                f"{self.output_path}/cohort_df.csv", index=False,
+            self._write_csv(
+                self.complete_cohort_df, "cohort_df.csv", index=False
             )  # log
             # self.complete_cohort_df = pd.concat(cohort_df)
             # self.logger.debug(
@@ -429,8 +646,9 @@ class CaterpillarDiagram:
         else:
             self.logger.debug("Not a Dataframe... Converting to Pandas series")  # log
             self.logger.debug("Filling NAs with zero")
-            self.data.fillna(value=0, inplace=True)
-            d11 = self.data.diff(periods=1).iloc[1:]
+            data = self._windowed().fillna(value=0)
+            first_cohort = len(self.data) - len(data)
+            d11 = data.diff(periods=1).iloc[1:]
             d12 = d11.shift(periods=-1).iloc[:-1]
             d2 = d11.diff(periods=1).iloc[1:]
 
@@ -450,7 +668,9 @@ class CaterpillarDiagram:
                 axis=1,
             )
             # cohort_data.loc[:, "data_index"] = d11.name
-            cohort_name_list = [f"Cohort{i+1}" for i in range(len(cohort_data))]
+            cohort_name_list = [
+                f"Cohort{first_cohort + i + 1}" for i in range(len(cohort_data))
+            ]
             cohort_data.loc[:, "Cohort"] = cohort_name_list
 
             cohort_data.loc[:, "color"] = cohort_data.apply(
@@ -467,9 +687,7 @@ class CaterpillarDiagram:
             cohort_df.append(cohort_data)
 
             try:
-                pd.concat(cohort_df).to_csv(
-                    f"{self.output_path}/cohort_df.csv", index=False,
-                )
+                self._write_csv(pd.concat(cohort_df), "cohort_df.csv", index=False)
             except Exception as e:
                 sys.exit(e)
             else:
@@ -533,7 +751,8 @@ class CaterpillarDiagram:
 
         # return d11_radius, d12_radius, final_radius
 
-    def caterpillar_size(self):
+    @profiled("caterpillar_size", rows=lambda self: len(self.complete_cohort_df))
+    def caterpillar_size(self, per_entity=False, thresholds=None):
         """
         This method will provide the size to each
         cohort of the caterpillar diagram based on
@@ -553,10 +772,38 @@ class CaterpillarDiagram:
         The method will write the `complete_cohort_df` attribute to
         the filesystem as per the `output_path`
 
+        By default the box-plot thresholds are evaluated over the
+        first differences of all entities together. With
+        ``per_entity=True`` every ``data_index`` gets its own
+        thresholds, which is the same as running an individual
+        analysis on every row of the input DataFrame at once.
+        The thresholds are then evaluated with one
+        ``np.quantile(..., axis=1)`` over the entities and the
+        radii with one broadcast comparison, see
+        :func:`caterpillard.kernels.assign_radius`.
+
         :ivar complete_cohort_df: Pandas DataFrame
 
             The `complete_cohort_df` is an instance attribute that
             contains the color and radius for each cohort
+
+        :ivar radius_thresholds: dictionary
+
+            Box-plot thresholds of :math:`d_{11}` and
+            :math:`d_{12}`. With ``per_entity=True`` these are
+            DataFrames with one row per ``data_index``.
+
+        Parameters
+        ----------
+        per_entity : bool
+            Evaluate the radius thresholds separately for every
+            ``data_index``
+        thresholds : str or dictionary
+            Fixed thresholds instead of the ones of the computed
+            cohorts: ``"history"`` for the full-history thresholds of
+            :meth:`caterpillar.CaterpillarDiagram.history_thresholds`
+            (useful with a ``horizon``), or ``d11`` and ``d12``
+            thresholds such as a cached ``radius_thresholds``
         """
         # Check if complete cohort df is available
         try:
@@ -565,6 +812,214 @@ class CaterpillarDiagram:
             sys.exit(e)
         self.logger.debug("Calculating sizes for each cohort")
         print("Calculating sizes for each cohort")
+        if thresholds is not None:
+            if isinstance(thresholds, str) and thresholds == "history":
+                thresholds = self.history_thresholds()
+            self._caterpillar_size_fixed(thresholds)
+        elif per_entity and "data_index" in self.complete_cohort_df:
+            self._caterpillar_size_per_entity()
+        else:
+            self._caterpillar_size_pooled()
+
+        self.logger.debug(self.complete_cohort_df["final_cohort_radius"])
+        self.logger.info(
+            f"ccd length before writing:\n" f"{len(self.complete_cohort_df)}"
+        )
+        try:
+            self._write_csv(self.complete_cohort_df, "complete_cohort_details.csv")
+        except Exception as e:
+            sys.exit(e)
+        else:
+            self.logger.info("Complete cohort details saved to filesystem\n")
+        # a summary of earlier radii is rebuilt on demand
+        self.entity_summary_df = None
+
+    def save_results(self, path=None, metadata=None):
+        """
+        This method will store the cohort details, the transition and
+        stationary matrices available and the settings of this run
+        in an indexed SQLite result store, see
+        :class:`caterpillard.store.ResultStore`. The cohorts of a
+        single entity are then read back with
+        :meth:`caterpillard.store.ResultStore.cohorts` without
+        parsing the complete cohort details.
+
+        Parameters
+        ----------
+        path : str
+            SQLite file, ``results.sqlite`` in the output path by
+            default. Every call adds a new run to the file.
+        metadata : dictionary
+            Additional details of the run
+
+        Returns
+        -------
+        run_id : int
+        """
+        from caterpillard.store import ResultStore
+
+        # Check if complete cohort df is available
+        try:
+            self.complete_cohort_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        if path is None:
+            path = f"{self.output_path}/results.sqlite"
+        with self._stage("write results store", rows=len(self.complete_cohort_df)):
+            with ResultStore(path) as store:
+                run_id = store.write_diagram(self, metadata=metadata)
+        self.logger.info(f"Results stored as run {run_id} in {path}")
+        return run_id
+
+    def summarize_entities(self, window=10):
+        """
+        This method will materialize a compact summary with one row
+        per ``data_index``, see
+        :func:`caterpillard.summary.entity_summary`, and write it to
+        the filesystem next to the complete cohort details. It is
+        run by :meth:`caterpillar.CaterpillarDiagram.query_entities`
+        when no summary is available.
+
+        :ivar entity_summary_df: Pandas DataFrame
+
+            Latest color, current run length, color counts and
+            radius statistics of every entity
+
+        Parameters
+        ----------
+        window : int
+            Number of last cohorts counted in the ``<color>_recent``
+            columns
+
+        Returns
+        -------
+        entity_summary_df : Pandas DataFrame
+        """
+        from caterpillard.summary import entity_summary
+
+        # Check if complete cohort df is available
+        try:
+            self.complete_cohort_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        self.entity_summary_df = entity_summary(self.complete_cohort_df, window=window)
+        try:
+            self._write_csv(self.entity_summary_df, "entity_summary.csv")
+        except Exception as e:
+            sys.exit(e)
+        else:
+            self.logger.info("Entity summary saved to filesystem\n")
+        return self.entity_summary_df
+
+    def query_entities(self, by=None, k=None, ascending=False, **filters):
+        """
+        This method will filter and rank the entities of the entity
+        summary, see :func:`caterpillard.summary.select`. The summary
+        is built by
+        :meth:`caterpillar.CaterpillarDiagram.summarize_entities`
+        on the first call.
+
+        Parameters
+        ----------
+        by : str
+            Summary column to rank on, for instance ``mean_radius``
+        k : int
+            Number of entities returned
+        ascending : bool
+            Rank the smallest values first
+        filters : dict
+            Column conditions, for instance ``latest_color="red"``
+            or ``green_recent=(3, None)``
+
+        Returns
+        -------
+        selection : Pandas DataFrame
+        """
+        from caterpillard.summary import select
+
+        if getattr(self, "entity_summary_df", None) is None:
+            self.summarize_entities()
+        return select(
+            self.entity_summary_df, by=by, k=k, ascending=ascending, **filters
+        )
+
+    def _caterpillar_size_per_entity(self):
+        """Radius of every cohort with thresholds per ``data_index``"""
+        entity, entities = pd.factorize(self.complete_cohort_df["data_index"])
+        radius_thresholds = {}
+        for diff in ["d11", "d12"]:
+            abs_diff, rank = entity_matrix(
+                entity, self.complete_cohort_df[diff].abs().to_numpy(), len(entities)
+            )
+            thresholds = radius_thresholds_of(abs_diff, axis=1)
+            radius = assign_radius(
+                abs_diff, {key: value[:, None] for key, value in thresholds.items()}
+            )[entity, rank]
+            if np.isfinite(radius).all():
+                radius = radius.astype(np.int64)
+            self.complete_cohort_df.loc[:, f"{diff}_radius"] = radius
+            radius_thresholds[diff] = pd.DataFrame(thresholds, index=entities)
+            self.logger.info(radius_thresholds[diff])
+
+        self.radius_thresholds = radius_thresholds
+        self.complete_cohort_df.loc[:, "final_cohort_radius"] = (
+            self.complete_cohort_df["d11_radius"].to_numpy(dtype=np.float64)
+            + self.complete_cohort_df["d12_radius"].to_numpy(dtype=np.float64)
+        ) / 2
+
+    def _caterpillar_size_fixed(self, thresholds):
+        """Radius of every cohort with given thresholds"""
+        for diff in ["d11", "d12"]:
+            radius = assign_radius(
+                self.complete_cohort_df[diff].abs().to_numpy(), thresholds[diff]
+            )
+            if np.isfinite(radius).all():
+                radius = radius.astype(np.int64)
+            self.complete_cohort_df.loc[:, f"{diff}_radius"] = radius
+
+        self.radius_thresholds = thresholds
+        self.complete_cohort_df.loc[:, "final_cohort_radius"] = (
+            self.complete_cohort_df["d11_radius"].to_numpy(dtype=np.float64)
+            + self.complete_cohort_df["d12_radius"].to_numpy(dtype=np.float64)
+        ) / 2
+
+    def history_thresholds(self):
+        """
+        This method evaluates the pooled radius thresholds over the
+        complete history of the input data, ignoring the
+        ``horizon``. Only the absolute first differences are
+        needed, no cohort is classified. The result is cached.
+
+        :ivar history_radius_thresholds: dictionary
+
+            ``min``, ``25%``, ``50%``, ``75%`` and ``max`` thresholds
+            of :math:`d_{11}` and :math:`d_{12}`
+
+        Returns
+        -------
+        history_radius_thresholds : dictionary
+        """
+        if getattr(self, "history_radius_thresholds", None) is not None:
+            return self.history_radius_thresholds
+
+        if isinstance(self.data, RaggedPanel):
+            d11, d12 = np.abs(self.data.first_differences())
+        else:
+            values = self.data.fillna(value=0).to_numpy(dtype=np.float64)
+            abs_diff = np.abs(np.diff(np.atleast_2d(values), axis=1))
+            d11, d12 = abs_diff[:, :-1], abs_diff[:, 1:]
+
+        self.history_radius_thresholds = {
+            "d11": radius_thresholds_of(d11),
+            "d12": radius_thresholds_of(d12),
+        }
+        self.logger.info(f"History thresholds:\n{self.history_radius_thresholds}")
+        return self.history_radius_thresholds
+
+    def _caterpillar_size_pooled(self):
+        """Radius of every cohort with thresholds over all entities"""
         quartiles_description_d11 = pd.Series(
             self.complete_cohort_df["d11"].abs().values.reshape(-1)
         ).describe()
@@ -574,49 +1029,94 @@ class CaterpillarDiagram:
         self.logger.info(quartiles_description_d11)
         self.logger.info(quartiles_description_d12)
         self.logger.debug(f"length check 1: {len(self.complete_cohort_df)}")
-        self.complete_cohort_df.loc[:, "d11_radius"] = self.complete_cohort_df[
-            "d11"
-        ].apply(
+        # the radius only depends on the difference, it is assigned
+        # once per distinct value
+        self.complete_cohort_df.loc[:, "d11_radius"] = unique_apply(
+            self.complete_cohort_df["d11"],
             lambda x: self.caterpillar_assign_radius(
                 diff=abs(x), quartiles_threshold=quartiles_description_d11
-            )
+            ),
         )
         self.logger.debug(self.complete_cohort_df["d11_radius"])  # log
 
-        self.complete_cohort_df.loc[:, "d12_radius"] = self.complete_cohort_df[
-            "d12"
-        ].apply(
+        self.complete_cohort_df.loc[:, "d12_radius"] = unique_apply(
+            self.complete_cohort_df["d12"],
             lambda x: self.caterpillar_assign_radius(
                 diff=abs(x), quartiles_threshold=quartiles_description_d12
-            )
+            ),
         )
         self.logger.debug(self.complete_cohort_df["d12_radius"])  # log
 
-        self.complete_cohort_df.loc[
-            :, "final_cohort_radius"
-        ] = self.complete_cohort_df.apply(
-            lambda x: np.mean([x["d11_radius"], x["d12_radius"]]), axis=1
-        )
-
-        self.logger.debug(self.complete_cohort_df["final_cohort_radius"])
-        self.logger.info(
-            f"ccd length before writing:\n" f"{len(self.complete_cohort_df)}"
-        )
-        try:
-            self.complete_cohort_df.to_csv(
-                f"{self.output_path}/complete_cohort_details.csv",
+        self.complete_cohort_df.loc[:, "final_cohort_radius"] = (
+            self.complete_cohort_df["d11_radius"].to_numpy(dtype=np.float64)
+            + self.complete_cohort_df["d12_radius"].to_numpy(dtype=np.float64)
+        ) / 2
+        self.radius_thresholds = {
+            "d11": quartiles_description_d11,
+            "d12": quartiles_description_d12,
+        }
+
+    def _transition_count(self, within_entities):
+        """Counter of the consecutive color pairs of the cohort table"""
+        temp_x = self.complete_cohort_df["color"]
+        code = pd.Categorical(temp_x, categories=COLORS).codes.astype(np.int64)
+        # whether two consecutive cohorts form a transition
+        same = np.ones(max(len(code) - 1, 0), dtype=bool)
+        if "segment" in self.complete_cohort_df:
+            # Cohorts from a ragged panel are consecutive only within
+            # a segment, transitions across gaps are not counted
+            segment = self.complete_cohort_df["segment"].to_numpy()
+            same &= segment[:-1] == segment[1:]
+        if within_entities:
+            entity = entity_codes(self.complete_cohort_df)[0]
+            same &= entity[:-1] == entity[1:]
+
+        if (code >= 0).all():
+            # consecutive pairs counted in one pass, in order of first
+            # appearance as the Counter below
+            pair = (code[:-1] * 7 + code[1:])[same]
+            counts = np.bincount(pair, minlength=49)
+            keys, first = np.unique(pair, return_index=True)
+            return Counter(
+                {
+                    (COLORS[key // 7], COLORS[key % 7]): int(counts[key])
+                    for key in keys[np.argsort(first)]
+                }
             )
-        except Exception as e:
-            sys.exit(e)
-        else:
-            self.logger.info("Complete cohort details saved to filesystem\n")
+        temp_y = temp_x.shift(periods=-1)
+        temp_z = list(zip(temp_x, temp_y))[:-1]
+        return Counter([pair for pair, keep in zip(temp_z, same) if keep])
 
-    def schema_transitions(self):
+    @profiled("schema_transitions", rows=lambda self: len(self.complete_cohort_df))
+    def schema_transitions(self, group_by=None, within_entities=True):
         """
         This method will collect the consecutive
         transitions between each cohort for complete
         dataset
 
+        By default only transitions between cohorts of the same
+        entity are counted, which is how the grouped matrices,
+        :meth:`surprise` scores,
+        :class:`caterpillard.model.CaterpillarModel`,
+        :class:`caterpillard.streaming.StreamingClassifier` and
+        :class:`caterpillard.multimetric.MultiMetricDiagram` count
+        them. With ``within_entities=False`` the last cohort of an
+        entity and the first cohort of the next one also count as
+        a transition, as in earlier versions.
+
+        After :meth:`color_schema`, the transitions of every distinct
+        series are counted once and weighted by the number of
+        entities sharing it, see :func:`caterpillard.dedup.weighted_pairs`.
+
+        When ``group_by`` is given, the transitions of every
+        group are additionally counted in one pass by
+        :func:`caterpillard.grouping.group_transition_counts`
+        (within each entity) and rolled up to every parent
+        level of tuple group keys by
+        :func:`caterpillard.grouping.rollup`. The matrices of all
+        the groups add up to ``transition_mat`` (for entities that
+        all have a group) unless ``within_entities`` is False.
+
         :ivar transition_count: dictionary
 
             It contains the number of times a particular transition
@@ -626,6 +1126,21 @@ class CaterpillarDiagram:
         
             Stores the consecutive color transitions as a
             Pandas Dataframe 
+
+        :ivar group_transition_mats: dictionary
+
+            Transition matrix of every group and parent group,
+            keyed by the group key. Only set when ``group_by``
+            is given.
+
+        Parameters
+        ----------
+        group_by : dict or Pandas Series
+            Mapping from ``data_index`` to a group key, for
+            instance ``(region, sector)`` tuples
+        within_entities : bool
+            Do not count transitions across two entities, pass
+            False for the counts of earlier versions
         """
         # Check if complete cohort df is available
         try:
@@ -636,11 +1151,29 @@ class CaterpillarDiagram:
         self.logger.debug("Finding transitions")
         print("Finding transitions")
 
-        temp_x = self.complete_cohort_df["color"]
-        temp_y = temp_x.shift(periods=-1)
-        temp_z = list(zip(temp_x, temp_y))[:-1]
-
-        self.transition_count = Counter(temp_z)
+        groups = getattr(self, "_cohort_groups", None)
+        if (
+            groups is not None
+            and groups["cohorts"] is self.complete_cohort_df
+            and (groups["codes"] >= 0).all()
+        ):
+            # deduplicated cohorts, the transitions of every distinct
+            # series are counted once and weighted by its entities
+            pair, position, weight = weighted_pairs(
+                groups["codes"], groups["rows"], groups["slot"], within_entities
+            )
+            counts = np.bincount(pair, weights=weight, minlength=49).astype(np.int64)
+            first = np.full(49, len(self.complete_cohort_df))
+            np.minimum.at(first, pair, position)
+            keys = np.flatnonzero(counts)
+            self.transition_count = Counter(
+                {
+                    (COLORS[key // 7], COLORS[key % 7]): int(counts[key])
+                    for key in keys[np.argsort(first[keys], kind="stable")]
+                }
+            )
+        else:
+            self.transition_count = self._transition_count(within_entities)
         self.logger.debug(self.transition_count)  # log
 
         self.transition_mat = pd.DataFrame(
@@ -654,6 +1187,22 @@ class CaterpillarDiagram:
         self.transition_mat.fillna(value=0, inplace=True)
         self.logger.info(f"Transition matrix:\n{self.transition_mat}")
 
+        self.group_transition_counts = None
+        if group_by is not None:
+            keys, counts = group_transition_counts(self.complete_cohort_df, group_by)
+            parent_keys, parent_counts = rollup(keys, counts)
+            self.group_keys = keys + parent_keys
+            self.group_transition_counts = np.concatenate([counts, parent_counts])
+            self.group_transition_mats = {
+                key: pd.DataFrame(count, index=COLORS, columns=COLORS)
+                for key, count in zip(self.group_keys, self.group_transition_counts)
+            }
+            self.logger.info(
+                f"Transition matrices evaluated for {len(keys)} groups "
+                f"and {len(parent_keys)} parent groups"
+            )
+
+    @profiled("stationary_matrix")
     def stationary_matrix(self, n_sim_iter=10 ** 4):
         """
         This method will generate the stationary
@@ -664,6 +1213,13 @@ class CaterpillarDiagram:
             Stores the probability of color transitions in a 
             DataFrame 
 
+        :ivar group_stationary_mats: dictionary
+
+            Stationary matrix of every group and parent group,
+            evaluated in one batched call when
+            :meth:`caterpillar.CaterpillarDiagram.schema_transitions`
+            received a ``group_by`` mapping
+
         Parameters
         ----------
         n_sim_iter : int
@@ -723,116 +1279,741 @@ class CaterpillarDiagram:
         )
         self.logger.debug(f"\nStationary Matrix:\n{self.stationary_mat_final_df}")
 
+        if getattr(self, "group_transition_counts", None) is not None:
+            # One batched evaluation for every group and parent group
+            group_stationary = stationary_power(
+                transition_probabilities(self.group_transition_counts), n_sim_iter
+            )
+            self.group_stationary_mats = {
+                key: pd.DataFrame(mat, index=COLORS, columns=COLORS)
+                for key, mat in zip(self.group_keys, group_stationary)
+            }
+
         return self.stationary_mat_final_df
 
-    def generate(self, data_index=None, n_last_cohorts=None):
+    def stationary_matrix_ci(
+        self,
+        n_replicates=2000,
+        ci=0.95,
+        method="dirichlet",
+        prior=0.5,
+        n_sim_iter=10 ** 4,
+        seed=None,
+        n_workers=1,
+    ):
         """
-        This method fetches the specified 
-        data and creates the caterpillar visualization. It will
-        evaluate the X axis coordinates for the cohort 
-        circles and the start & end coordinates of the lines
-        in-between cohorts circle.
+        This method will evaluate percentile bands for every
+        cell of the transition probability matrix and of the
+        stationary matrix by resampling the transition counts
+        and utilizes
+        :func:`caterpillard.uncertainty.resample_transition_matrices`
 
-        This method will write the Caterpillar image to the filesystem
-        and provides the figure object as instance attribute for
-        any downstream application by the user. 
+        :ivar stationary_mat_ci: dictionary
 
-        :ivar lx_s:
+            Lower, median and upper percentile DataFrames for the
+            ``transition`` and ``stationary`` matrices
 
-            List of coordinates of start of lines in Caterpillar
+        Parameters
+        ----------
+        n_replicates : int
+            Number of resampled transition matrices
+        ci : float
+            Width of the percentile band, between 0 and 1
+        method : str
+            ``dirichlet`` for posterior draws or ``bootstrap`` for
+            a parametric bootstrap of the counts
+        prior : float
+            Dirichlet concentration added to every transition count
+        n_sim_iter : int
+            Number of iterations for finding the stationary matrices
+        seed : int
+            Seed for reproducible resampling
+        n_workers : int
+            Number of worker processes
 
-        :ivar lx_e:
+        Returns
+        -------
+        stationary_mat_ci : dictionary
+
+        Raises
+        ------
+        TypeError
+            When ``n_sim_iter`` is not an integer
+        ValueError
+            When an argument is out of its range
+        """
+        from caterpillard.uncertainty import resample_transition_matrices
 
-            List of coordinates of end of lines in Caterpillar
-        
-        :ivar cx:
+        if not isinstance(n_sim_iter, int):
+            raise TypeError("n_sim_iter must be an integer")
+        if n_sim_iter < 1:
+            raise ValueError("n_sim_iter must be a positive integer")
 
-            List of coordinates for center point of Caterpillar
+        # Check if transition matrix is available
+        try:
+            self.transition_mat
+        except AttributeError as e:
+            sys.exit(e)
 
-        :ivar caterpillar_fig:
+        self.logger.debug("Resampling transition matrices")
+        self.stationary_mat_ci = resample_transition_matrices(
+            self.transition_mat,
+            n_replicates=n_replicates,
+            ci=ci,
+            method=method,
+            prior=prior,
+            n_sim_iter=n_sim_iter,
+            seed=seed,
+            n_workers=n_workers,
+        )
+        self.logger.info(
+            f"Stationary matrix lower band:\n"
+            f"{self.stationary_mat_ci['stationary']['lower']}"
+        )
+        self.logger.info(
+            f"Stationary matrix upper band:\n"
+            f"{self.stationary_mat_ci['stationary']['upper']}"
+        )
+
+        return self.stationary_mat_ci
+
+    def simulate(
+        self, start, n_steps, n_paths=10 ** 5, target=None, seed=None, n_workers=1
+    ):
+        """
+        This method will simulate future color paths using the
+        transition probabilities evaluated by
+        :meth:`caterpillar.CaterpillarDiagram.stationary_matrix`
+        and utilizes :func:`caterpillard.simulation.simulate_paths`
+
+        :ivar simulation_summary: dictionary
 
-            Caterpillar figure object
+            Summary statistics of the simulated paths
 
         Parameters
         ----------
+        start : str or array-like
+            Starting color, or a probability distribution over the
+            seven colors
+        n_steps : int
+            Number of future periods to simulate
+        n_paths : int
+            Number of simulated paths
+        target : str or list of str
+            Color(s) for which the probability of being reached
+            within each number of periods is reported
+        seed : int
+            Seed for reproducible simulation
+        n_workers : int
+            Number of worker processes
 
-        data_index : int
-
-            Choose the row for which Caterpillar Diagram needs to
-            be generated. In case of individual analysis, this
-            parameter is not required.
-        
-        n_last_cohorts : int
-        
-            Specify the number of last cohorts for which the
-            Caterpillar Diagram
-            needs to be generated 
+        Returns
+        -------
+        simulation_summary : dictionary
+            Per-step color occupancy probabilities and, when a
+            ``target`` is given, the probability of reaching it
         """
-        try:
-            err_msg = "data_index should be an integer"
-            assert type(data_index) is int or data_index is None, err_msg
-        except AssertionError as e:
-            sys.exit(f"data_index parameter error \n {e}")
-        else:
-            self.logger.debug("data_index parameter Type correct")
+        from caterpillard.simulation import simulate_paths
 
+        # Check if transition probabilities are available
         try:
-            err_msg = "n_last_cohort should be an integer"
-            assert type(n_last_cohorts) is int or n_last_cohorts is None, err_msg
-        except AssertionError as e:
-            sys.exit(f"n_last_cohort parameter error \n {e}")
-        else:
-            self.logger.debug("n_last_cohort parameter Type correct")
+            self.trans_mat_prob
+        except AttributeError as e:
+            sys.exit(e)
 
-        self.logger.debug("Generating caterpillar diagram")
-        # Initialize
-        # cx and cy are the initial center of the first cohort
-        cx = [0]
-        cy = [0]
-        # number of cohorts, n, calculated earlier as per input data
-        # n = 7
-        if n_last_cohorts is None:
-            # all cohorts will be used for generating caterpillar
-            n = self.n_cohorts
-        else:
-            try:
-                err_msg = (
-                    "User-defined n_last_cohorts integer is more than available cohorts"
-                )
-                assert self.n_cohorts >= n_last_cohorts, err_msg
-            except AssertionError as e:
-                sys.exit(e)
-            else:
-                self.logger.debug("n_last_cohorts value checked")
-                n = n_last_cohorts
+        self.logger.debug("Simulating color paths")
+        self.simulation_summary = simulate_paths(
+            self.trans_mat_prob,
+            start=start,
+            n_steps=n_steps,
+            n_paths=n_paths,
+            target=target,
+            seed=seed,
+            n_workers=n_workers,
+        )
+        self.logger.info(
+            f"Simulated occupancy:\n{self.simulation_summary['occupancy']}"
+        )
 
-        if self.relative and data_index is not None:
-            """
-            When the input data is a dataframe then
-            the following code will allow to choose
-            an index from the data to create caterpillar
-            """
-            sleep(1)
-            self.logger.info(f"ccd length:\n" f"{len(self.complete_cohort_df)}")
-            sleep(1)
-            self.logger.info(
-                f"Available options:\n"
-                f"{self.complete_cohort_df['data_index'].unique()}"
-            )
-            self.logger.info(f"Chosen:\t{data_index}")
-            sleep(0.7)
-            # TODO: ask the user to choose the index
+        return self.simulation_summary
 
-            try:
-                err_msg = "chosen data index is not in processed cohort details"
-                assert (
-                    data_index in self.complete_cohort_df["data_index"].unique()
-                ), err_msg
-            except AssertionError as e:
-                sys.exit(e)
-            else:
-                chosen_subset = self.complete_cohort_df[
-                    self.complete_cohort_df["data_index"] == data_index
+    def surprise(self, k=None, window=10, metric="kl"):
+        """
+        This method will score how unusual the latest color
+        transition of every entity is under the learned chain and
+        utilizes :func:`caterpillard.scoring.surprise_scores`
+
+        Only transitions within an entity are scored, so the chain
+        should come from :meth:`schema_transitions` with the default
+        ``within_entities``.
+
+        :ivar surprise_df: Pandas DataFrame
+
+            Surprise and divergence scores of every entity
+
+        Parameters
+        ----------
+        k : int
+            Return only the ``k`` most surprising entities
+        window : int
+            Number of last cohorts compared with the stationary
+            distribution
+        metric : str
+            ``kl`` or ``js`` divergence
+
+        Returns
+        -------
+        scores : Pandas DataFrame
+            Scores of every entity, or of the top ``k`` ranked by
+            surprise
+        """
+        from caterpillard.scoring import surprise_scores, top_k
+
+        # Check if the stationary matrix is available
+        try:
+            self.stationary_mat_final_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        self.logger.debug("Scoring latest transitions")
+        self.surprise_df = surprise_scores(
+            self.complete_cohort_df,
+            self.trans_mat_prob,
+            stationary=self.stationary_mat_final_df,
+            window=window,
+            metric=metric,
+        )
+        if k is None:
+            return self.surprise_df
+        return top_k(self.surprise_df, k)
+
+    def similarity_index(self, length=None):
+        """
+        This method will index the color sequence of every entity
+        for nearest-neighbour queries, see
+        :class:`caterpillard.similarity.SimilarityIndex`
+
+        :ivar sequence_index: SimilarityIndex
+
+            Index over the last ``length`` colors of every entity
+
+        Parameters
+        ----------
+        length : int
+            Number of last cohorts compared, all cohorts by default
+
+        Returns
+        -------
+        sequence_index : SimilarityIndex
+        """
+        from caterpillard.similarity import SimilarityIndex
+
+        # Check if complete cohort df is available
+        try:
+            self.complete_cohort_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        self.sequence_index = SimilarityIndex.from_cohorts(
+            self.complete_cohort_df, length=length
+        )
+        self.logger.info(f"{len(self.sequence_index)} color sequences indexed")
+        return self.sequence_index
+
+    def higher_order_transitions(self, order=2, backoff=True):
+        """
+        This method will estimate an order-k chain where the next
+        color depends on the ``order`` previous colors of the same
+        entity, see :class:`caterpillard.higher_order.HigherOrderChain`
+
+        :ivar higher_order_chain: HigherOrderChain
+
+            Fitted chain, its ``predict_next`` method gives the
+            next color distribution of every entity
+
+        Parameters
+        ----------
+        order : int
+            Number of previous colors in the context
+        backoff : bool
+            Fall back to lower orders for unseen contexts
+
+        Returns
+        -------
+        higher_order_mat : Pandas DataFrame
+            Transition probabilities of every observed context
+        """
+        from caterpillard.higher_order import HigherOrderChain
+
+        # Check if complete cohort df is available
+        try:
+            self.complete_cohort_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        self.logger.debug(f"Finding order {order} transitions")
+        self.higher_order_chain = HigherOrderChain(order=order, backoff=backoff).fit(
+            self.complete_cohort_df
+        )
+        self.higher_order_mat = self.higher_order_chain.transition_table()
+        self.logger.info(
+            f"Order {order} transitions:\n{self.higher_order_mat}"
+        )
+        return self.higher_order_mat
+
+    def nearest_entities(
+        self, k=5, metric="js", memory_budget=None, n_workers=1
+    ):
+        """
+        This method will find the ``k`` entities whose transition
+        matrices are closest to the one of every entity, without
+        storing the distances of every pair, see
+        :func:`caterpillard.clustering.pairwise_distances`
+
+        Parameters
+        ----------
+        k : int
+            Number of neighbours of every entity
+        metric : str
+            ``js`` or ``hellinger``
+        memory_budget : int
+            Bytes available for the temporary arrays of a block,
+            :data:`caterpillard.clustering.MEMORY_BUDGET` by default
+        n_workers : int or None
+            Number of worker processes
+
+        Returns
+        -------
+        nearest_entities_df : Pandas DataFrame
+            ``rank``, ``neighbour`` and ``distance`` of the nearest
+            entities of every ``data_index``
+        """
+        from caterpillard.clustering import (
+            MEMORY_BUDGET,
+            entity_transition_probabilities,
+            nearest_frame,
+            pairwise_distances,
+        )
+
+        # Check if complete cohort df is available
+        try:
+            self.complete_cohort_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        if memory_budget is None:
+            memory_budget = MEMORY_BUDGET
+        entities, probabilities = entity_transition_probabilities(
+            self.complete_cohort_df
+        )
+        nearest, distances = pairwise_distances(
+            probabilities,
+            metric=metric,
+            k=k,
+            memory_budget=memory_budget,
+            n_workers=n_workers,
+        )
+        self.nearest_entities_df = nearest_frame(entities, nearest, distances)
+        return self.nearest_entities_df
+
+    def cluster_entities(
+        self,
+        n_clusters,
+        metric="js",
+        memory_budget=None,
+        n_workers=1,
+        seed=None,
+    ):
+        """
+        This method will segment the entities by the behaviour of
+        their colors: the distances between the transition matrices
+        of every pair of entities are evaluated block by block, see
+        :func:`caterpillard.clustering.pairwise_distances`, and
+        clustered with :func:`caterpillard.clustering.k_medoids`
+
+        :ivar entity_distance_mat: Pandas DataFrame
+
+            Distances between the transition matrices of every pair
+            of entities
+
+        :ivar entity_clusters: Pandas Series
+
+            Cluster of every ``data_index``
+
+        :ivar cluster_medoids: list
+
+            ``data_index`` of the medoid of every cluster
+
+        Parameters
+        ----------
+        n_clusters : int
+            Number of clusters
+        metric : str
+            ``js`` or ``hellinger``
+        memory_budget : int
+            Bytes available for the temporary arrays of a block,
+            :data:`caterpillard.clustering.MEMORY_BUDGET` by default
+        n_workers : int or None
+            Number of worker processes
+        seed : int
+            Seed of the initial medoids
+
+        Returns
+        -------
+        entity_clusters : Pandas Series
+        """
+        from caterpillard.clustering import (
+            MEMORY_BUDGET,
+            entity_transition_probabilities,
+            k_medoids,
+            pairwise_distances,
+        )
+
+        # Check if complete cohort df is available
+        try:
+            self.complete_cohort_df
+        except AttributeError as e:
+            sys.exit(e)
+
+        if memory_budget is None:
+            memory_budget = MEMORY_BUDGET
+        entities, probabilities = entity_transition_probabilities(
+            self.complete_cohort_df
+        )
+        distances = pairwise_distances(
+            probabilities,
+            metric=metric,
+            memory_budget=memory_budget,
+            n_workers=n_workers,
+        )
+        labels, medoids, inertia = k_medoids(distances, n_clusters, seed=seed)
+        index = pd.Index(entities, name="data_index")
+        self.entity_distance_mat = pd.DataFrame(distances, index=index, columns=index)
+        self.entity_clusters = pd.Series(labels, index=index, name="cluster")
+        self.cluster_medoids = list(entities[medoids])
+        self.logger.info(
+            f"{len(entities)} entities in {n_clusters} clusters, inertia {inertia}"
+        )
+        self._write_csv(self.entity_clusters, "entity_clusters.csv")
+        return self.entity_clusters
+
+    def plan_resources(
+        self, memory=None, n_cpus=None, calibration=None, render_cohorts=None, dpi=400
+    ):
+        """
+        This method plans the execution of a run from the shape,
+        dtype and share of missing values of the input data and the
+        memory and CPUs available, see
+        :func:`caterpillard.planner.plan_resources`. The plan can be
+        inspected before it is run by
+        :meth:`caterpillar.CaterpillarDiagram.execute_plan`.
+
+        :ivar resource_plan: caterpillard.planner.ResourcePlan
+
+            Chosen settings with the estimated peak memory and
+            runtime of every stage
+
+        Parameters
+        ----------
+        memory : int
+            Bytes available, detected by default
+        n_cpus : int
+            CPUs available, detected by default
+        calibration : dictionary
+            Per-cohort costs, see :func:`caterpillard.planner.calibrate`
+        render_cohorts : int
+            Number of cohorts of the rendered diagram, all by default
+        dpi : int
+            Resolution of the rendered diagram
+
+        Returns
+        -------
+        resource_plan : caterpillard.planner.ResourcePlan
+        """
+        from caterpillard.planner import plan_resources
+
+        data = self._windowed()
+        if isinstance(data, RaggedPanel):
+            shape = (len(data), data.n_periods)
+            dtype = data.values.dtype
+            nan_ratio = 1 - data.n_observations / (shape[0] * shape[1])
+        else:
+            shape = (1, len(data)) if isinstance(data, pd.Series) else data.shape
+            try:
+                dtype = np.result_type(*np.atleast_1d(data.dtypes))
+            except TypeError:
+                dtype = np.float64
+            nan_ratio = float(np.asarray(data.isna().sum()).sum()) / max(data.size, 1)
+        if render_cohorts is None and self.horizon is not None:
+            render_cohorts = min(self.horizon, shape[1] - 2)
+        self.resource_plan = plan_resources(
+            shape,
+            dtype=dtype,
+            nan_ratio=nan_ratio,
+            memory=memory,
+            n_cpus=n_cpus,
+            calibration=calibration,
+            render_cohorts=render_cohorts,
+            dpi=dpi,
+        )
+        return self.resource_plan
+
+    def execute_plan(self, plan=None, data_index=None, n_sim_iter=10 ** 4):
+        """
+        This method runs the analysis with the settings of a
+        resource plan: the cohorts are computed in chunks of entities
+        over the planned number of workers and in the planned dtype,
+        followed by
+        :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`,
+        :meth:`caterpillar.CaterpillarDiagram.schema_transitions`,
+        :meth:`caterpillar.CaterpillarDiagram.stationary_matrix` and
+        the diagram, drawn by
+        :meth:`caterpillar.CaterpillarDiagram.generate` or
+        :meth:`caterpillar.CaterpillarDiagram.generate_tiles` as per
+        the planned rendering mode.
+
+        Parameters
+        ----------
+        plan : caterpillard.planner.ResourcePlan
+            Plan to run, :attr:`resource_plan` or a new plan by
+            default
+        data_index : int
+            Entity drawn, not required in individual analysis
+        n_sim_iter : int
+            Number of iterations for the stationary matrix
+
+        Returns
+        -------
+        None
+        """
+        from caterpillard.planner import planned_cohorts
+
+        if plan is None:
+            plan = getattr(self, "resource_plan", None) or self.plan_resources()
+        settings = plan.settings
+        self.resource_plan = plan
+
+        self.data_summary()
+        if isinstance(self.data, RaggedPanel):
+            self.color_schema()
+        else:
+            with self._stage("color_schema", rows=plan.inputs["n_rows"]):
+                data = self._windowed()
+                self.complete_cohort_df = planned_cohorts(
+                    data,
+                    settings["chunk_size"],
+                    dtype=settings["dtype"],
+                    n_workers=settings["n_workers"],
+                    first_cohort=self.data.shape[-1] - data.shape[-1],
+                )
+            self._write_csv(self.complete_cohort_df, "cohort_df.csv", index=False)
+        self.caterpillar_size()
+        self.schema_transitions()
+        self.stationary_matrix(n_sim_iter=n_sim_iter)
+
+        n_last_cohorts = plan.inputs.get("render_cohorts")
+        if settings["render_mode"] == "tiles":
+            self.generate_tiles(
+                data_index=data_index,
+                n_last_cohorts=n_last_cohorts,
+                cohorts_per_tile=settings["cohorts_per_tile"],
+                dpi=settings["dpi"],
+            )
+        else:
+            self.generate(data_index=data_index, n_last_cohorts=n_last_cohorts)
+        return
+
+    def backtest(self, max_horizon=3, first_origin=1, alpha=0.0):
+        """
+        This method validates the next-color forecasts of the color
+        chain with a rolling-origin backtest over every cut-off of
+        the input data, see :class:`caterpillard.backtest.RollingBacktest`.
+        The colors are computed once and the transition matrix of
+        every cut-off is read from cumulative counts.
+
+        Writes the accuracy, log-loss and accuracy of the persistence
+        forecast per horizon to the filesystem at the given
+        output_path
+
+        :ivar rolling_backtest: caterpillard.backtest.RollingBacktest
+
+            Scores per horizon and cut-off and confusion matrices
+
+        Parameters
+        ----------
+        max_horizon : int
+            Horizons ``1`` to ``max_horizon`` are scored
+        first_origin : int
+            Index (from 0) of the cohort of the first cut-off
+        alpha : float
+            Pseudo-count added to every transition count
+
+        Returns
+        -------
+        summary : Pandas DataFrame
+            Scores per horizon
+        """
+        from caterpillard.backtest import RollingBacktest
+
+        if isinstance(self.data, RaggedPanel):
+            raise TypeError("A backtest needs the input data in wide format")
+
+        self.rolling_backtest = RollingBacktest(
+            self._windowed(),
+            max_horizon=max_horizon,
+            first_origin=first_origin,
+            alpha=alpha,
+        )
+        self._write_csv(self.rolling_backtest.summary, "backtest_summary.csv")
+        return self.rolling_backtest.summary
+
+    def build_pyramid(self, factors, how="sum"):
+        """
+        This method aggregates the input data once into coarser time
+        resolutions and evaluates the cohorts, radii and transitions
+        of every level in the same pass, see
+        :class:`caterpillard.pyramid.TemporalPyramid`. The cohort
+        details of every level are written to the filesystem.
+
+        :meth:`caterpillar.CaterpillarDiagram.generate` then draws
+        any level with its ``resolution`` parameter, without any
+        recomputation. The ``horizon`` is not applied to the levels.
+
+        :ivar pyramid: TemporalPyramid
+
+            Cohorts, radius thresholds and transition counts of
+            every level
+
+        Parameters
+        ----------
+        factors : dictionary
+            Number of input periods in a period of every level, for
+            instance ``{"monthly": 1, "quarterly": 3, "yearly": 12}``
+        how : str
+            Aggregation of the values of a block of periods, ``sum``,
+            ``mean`` or ``last``
+
+        Returns
+        -------
+        pyramid : TemporalPyramid
+        """
+        from caterpillard.pyramid import TemporalPyramid
+
+        if isinstance(self.data, RaggedPanel):
+            raise TypeError("A pyramid needs the input data in wide format")
+
+        self.logger.debug(f"Building pyramid of levels {list(factors)}")
+        self.pyramid = TemporalPyramid(self.data, factors, how=how)
+        for name, level in self.pyramid.levels.items():
+            self._write_csv(level["cohort_df"], f"complete_cohort_details_{name}.csv")
+        return self.pyramid
+
+    def geometry(self, data_index=None, n_last_cohorts=None, resolution=None):
+        """
+        This method evaluates the geometry of the Caterpillar Diagram
+        without drawing it, so it does not need matplotlib. The
+        geometry can be drawn with :func:`caterpillard.svg.write_svg`
+        or serialised with :func:`caterpillard.geometry.to_json`.
+
+        Parameters
+        ----------
+
+        data_index : int
+
+            Choose the row for which Caterpillar Diagram needs to
+            be generated. In case of individual analysis, this
+            parameter is not required.
+
+        n_last_cohorts : int
+
+            Specify the number of last cohorts for which the
+            Caterpillar Diagram
+            needs to be generated
+
+        resolution : str
+
+            Level of the temporal pyramid built by
+            :meth:`caterpillar.CaterpillarDiagram.build_pyramid` to
+            draw, the cohorts of the input data by default
+
+        Returns
+        -------
+
+        geometry : dictionary
+
+            ``cx``, ``lx_s``, ``lx_e``, ``radii`` and ``colors`` of
+            the diagram, see
+            :func:`caterpillard.geometry.caterpillar_geometry`
+        """
+        from caterpillard.geometry import caterpillar_geometry
+
+        try:
+            err_msg = "data_index should be an integer"
+            assert type(data_index) is int or data_index is None, err_msg
+        except AssertionError as e:
+            sys.exit(f"data_index parameter error \n {e}")
+        else:
+            self.logger.debug("data_index parameter Type correct")
+
+        try:
+            err_msg = "n_last_cohort should be an integer"
+            assert type(n_last_cohorts) is int or n_last_cohorts is None, err_msg
+        except AssertionError as e:
+            sys.exit(f"n_last_cohort parameter error \n {e}")
+        else:
+            self.logger.debug("n_last_cohort parameter Type correct")
+
+        if resolution is None:
+            complete_cohort_df, n_cohorts = self.complete_cohort_df, self.n_cohorts
+        else:
+            try:
+                level = self.pyramid[resolution]
+            except (AttributeError, KeyError) as e:
+                sys.exit(f"Resolution not available in the pyramid: {e}")
+            complete_cohort_df, n_cohorts = level["cohort_df"], level["n_cohorts"]
+
+        self.logger.debug("Evaluating caterpillar geometry")
+        # number of cohorts, n, calculated earlier as per input data
+        # n = 7
+        if n_last_cohorts is None:
+            # all cohorts will be used for generating caterpillar
+            n = n_cohorts
+        else:
+            try:
+                err_msg = (
+                    "User-defined n_last_cohorts integer is more than available cohorts"
+                )
+                assert n_cohorts >= n_last_cohorts, err_msg
+            except AssertionError as e:
+                sys.exit(e)
+            else:
+                self.logger.debug("n_last_cohorts value checked")
+                n = n_last_cohorts
+
+        if self.relative and data_index is not None:
+            """
+            When the input data is a dataframe then
+            the following code will allow to choose
+            an index from the data to create caterpillar
+            """
+            self.logger.info(f"ccd length:\n" f"{len(complete_cohort_df)}")
+            self.logger.info(
+                f"Available options:\n"
+                f"{complete_cohort_df['data_index'].unique()}"
+            )
+            self.logger.info(f"Chosen:\t{data_index}")
+            # TODO: ask the user to choose the index
+
+            try:
+                err_msg = "chosen data index is not in processed cohort details"
+                assert (
+                    data_index in complete_cohort_df["data_index"].unique()
+                ), err_msg
+            except AssertionError as e:
+                sys.exit(e)
+            else:
+                chosen_subset = complete_cohort_df[
+                    complete_cohort_df["data_index"] == data_index
                 ].copy()
 
             # radii will use the list of radius of each consecutive
@@ -854,81 +2035,276 @@ class CaterpillarDiagram:
             # radii will use the list of radius of each consecutive
             # cohort calculated earlier
             # radii = [4, 2, 6, 8, 2, 2, 6]
-            radii = self.complete_cohort_df["final_cohort_radius"][-n:].to_list()
+            radii = complete_cohort_df["final_cohort_radius"][-n:].to_list()
 
             # list of colors
             # colors = ["red", "green", "cyan", "yellow", "orange", "red", "red"]
-            colors = self.complete_cohort_df["color"][-n:].to_list()
+            colors = complete_cohort_df["color"][-n:].to_list()
 
-        # lx_s is a list of initiating coordinate of the line
-        # between each cohort
-        lx_s = []
+        geometry = caterpillar_geometry(radii, colors)
+        self.logger.debug(f"Radius list:\n{radii}")
+        return geometry
 
-        # ll is the length of line between each cohort
+    def export_geometry(self, path, n_last_cohorts=None):
+        """
+        This method writes the geometry of the Caterpillar Diagram of
+        every entity to ``path`` (``.json`` or ``.npz``), see
+        :func:`caterpillard.geometry.entity_geometries`.
 
-        ll = 1  # line length between cohorts circle
+        Parameters
+        ----------
 
-        # lx_e is the list of ending coordinates for line
-        # between each cohort
-        lx_e = []
-        self.logger.debug(f"Radius list:\n{radii}")
-        # Process
-        for i in range(n):
-            if i < n - 1:
-                cx.append(cx[i] + radii[i] + ll + radii[i + 1])
-                lx_s.append(cx[i] + radii[i])
-                lx_e.append(lx_s[i] + ll)
-            else:
-                break
+        path : str
 
-        self.logger.info(f"Circle X-coordinate list:\n{cx}")
-        self.logger.info(f"Line Start X-coordinate list:\n{lx_s}")
-        self.logger.info(f"Line End X-coordinate list:\n{lx_e}")
+            Output file
 
-        cy = ly = 0
+        n_last_cohorts : int
 
-        # Preparing figure
-        fig, ax = plt.subplots(figsize=(n / 5 * 7, 9))
-        ax.set_facecolor("white")
-        circle_patch = []
-        style_cohort = dict(
-            size=7, color="black", rotation=90, fontfamily="Palatino Linotype",
-        )
-        style_radii = dict(
-            size=5, color="black", rotation=0, fontfamily="Palatino Linotype",
+            Keep only the last cohorts of every entity
+        """
+        from caterpillard.geometry import entity_geometries, save_geometries
+
+        if not hasattr(self, "complete_cohort_df") or (
+            "final_cohort_radius" not in self.complete_cohort_df
+        ):
+            sys.exit("Evaluate caterpillar_size before exporting the geometry")
+        geometries = entity_geometries(self.complete_cohort_df, n_last_cohorts)
+        save_geometries(geometries, path)
+        self.logger.info(f"Geometry written to {path}")
+        return geometries
+
+    @profiled("generate", rows=lambda self: len(self.cx))
+    def generate(
+        self,
+        data_index=None,
+        n_last_cohorts=None,
+        figure=None,
+        keep_figure=True,
+        resolution=None,
+    ):
+        """
+        This method fetches the specified 
+        data and creates the caterpillar visualization. It will
+        evaluate the X axis coordinates for the cohort 
+        circles and the start & end coordinates of the lines
+        in-between cohorts circle.
+
+        This method will write the Caterpillar image to the filesystem
+        and provides the figure object as instance attribute for
+        any downstream application by the user. 
+
+        :ivar lx_s:
+
+            List of coordinates of start of lines in Caterpillar
+
+        :ivar lx_e:
+
+            List of coordinates of end of lines in Caterpillar
+        
+        :ivar cx:
+
+            List of coordinates for center point of Caterpillar
+
+        :ivar caterpillar_fig:
+
+            Caterpillar figure object, ``None`` when ``keep_figure``
+            is false
+
+        Parameters
+        ----------
+
+        data_index : int
+
+            Choose the row for which Caterpillar Diagram needs to
+            be generated. In case of individual analysis, this
+            parameter is not required.
+        
+        n_last_cohorts : int
+        
+            Specify the number of last cohorts for which the
+            Caterpillar Diagram
+            needs to be generated 
+
+        figure : matplotlib Figure
+
+            Figure to clear and draw on, instead of creating a new one
+
+        keep_figure : bool
+
+            Keep a reference to the figure in ``caterpillar_fig``
+
+        resolution : str
+
+            Level of the temporal pyramid to draw, see
+            :meth:`caterpillar.CaterpillarDiagram.build_pyramid`
+        """
+        from caterpillard.render import render_figure
+
+        # matplotlib is only needed for drawing the diagram
+        self.logger.debug("Generating caterpillar diagram")
+        geometry = self.geometry(
+            data_index=data_index, n_last_cohorts=n_last_cohorts, resolution=resolution
         )
+        cx = geometry["cx"].tolist()
+        lx_s = geometry["lx_s"].tolist()
+        lx_e = geometry["lx_e"].tolist()
 
-        for i in range(n):
-            circle_patch.append(
-                plt.Circle((cx[i], cy), radii[i], facecolor=colors[i], edgecolor="None")
-            )
-            ax.text(
-                cx[i] - 0.5, -18, f"Cohort {i+1}", **style_cohort,
+        self.logger.info(f"Circle X-coordinate list:\n{cx}")
+        self.logger.info(f"Line Start X-coordinate list:\n{lx_s}")
+        self.logger.info(f"Line End X-coordinate list:\n{lx_e}")
+
+        # The figure is not registered with pyplot, it is released
+        # together with the last reference to it
+        fig = render_figure(geometry, figure=figure)
+        with self._stage("write caterpillar.jpeg", rows=len(cx)):
+            fig.savefig(
+                f"{self.output_path}/caterpillar.jpeg", dpi=400,
             )
-            ax.text(cx[i] - 1, cy + 1, f"R={radii[i]}", **style_radii)
-            ax.add_patch(circle_patch[i])
-            if i != n - 1:
-                ax.plot(
-                    [lx_s[i], lx_e[i]],
-                    [ly, ly],
-                    color="black",
-                    linewidth=0.5,
-                    linestyle="-",
-                )
-            else:
-                pass
-        ax.autoscale_view()
-        ax.set_aspect(1)
-        plt.grid(False)
-        plt.axis("off")
-        plt.savefig(
-            f"{self.output_path}/caterpillar.jpeg", dpi=400,
-        )
 
-        self.caterpillar_fig = fig
+        self.caterpillar_fig = fig if keep_figure else None
         self.cx = cx
         self.lx_e = lx_e
         self.lx_s = lx_s
 
         return
 
+    @profiled("generate_tiles", rows=lambda self: self.tile_index["n_cohorts"])
+    def generate_tiles(
+        self,
+        data_index=None,
+        n_last_cohorts=None,
+        cohorts_per_tile=25,
+        format="jpeg",
+        dpi=400,
+        resolution=None,
+    ):
+        """
+        This method draws the Caterpillar Diagram as a row of tiles
+        of at most ``cohorts_per_tile`` cohorts, written to the
+        ``caterpillar_tiles`` directory of the output path together
+        with an ``index.json``, see
+        :func:`caterpillard.render.render_tiles`. Every tile is
+        written as it is drawn, so the memory needed does not grow
+        with the number of cohorts as with
+        :meth:`caterpillar.CaterpillarDiagram.generate`.
+
+        :ivar tile_index:
+
+            Content of the ``index.json`` of the tiles
+
+        Parameters
+        ----------
+
+        data_index : int
+
+            Choose the row for which Caterpillar Diagram needs to
+            be generated. In case of individual analysis, this
+            parameter is not required.
+
+        n_last_cohorts : int
+
+            Specify the number of last cohorts for which the
+            Caterpillar Diagram
+            needs to be generated
+
+        cohorts_per_tile : int
+
+            Number of cohorts drawn in a tile
+
+        format : str
+
+            Image format of the tiles
+
+        dpi : int
+
+            Resolution of the tiles
+
+        resolution : str
+
+            Level of the temporal pyramid to draw, see
+            :meth:`caterpillar.CaterpillarDiagram.build_pyramid`
+
+        Returns
+        -------
+
+        tile_index : dictionary
+        """
+        from caterpillard.render import render_tiles
+
+        geometry = self.geometry(
+            data_index=data_index, n_last_cohorts=n_last_cohorts, resolution=resolution
+        )
+        self.tile_index = render_tiles(
+            geometry,
+            f"{self.output_path}/caterpillar_tiles",
+            cohorts_per_tile=cohorts_per_tile,
+            format=format,
+            dpi=dpi,
+        )
+        self.logger.info(
+            f"{len(self.tile_index['tiles'])} tiles written to "
+            f"{self.output_path}/caterpillar_tiles"
+        )
+        return self.tile_index
+
+    def render(
+        self,
+        data_index=None,
+        n_last_cohorts=None,
+        format="png",
+        dpi=400,
+        figure=None,
+        resolution=None,
+    ):
+        """
+        This method renders the Caterpillar Diagram to an in-memory
+        image. Nothing is written to the filesystem and no reference
+        to the figure is kept, which suits long-running services
+        rendering many diagrams, possibly from several threads.
+
+        Parameters
+        ----------
+
+        data_index : int
+
+            Choose the row for which Caterpillar Diagram needs to
+            be generated. In case of individual analysis, this
+            parameter is not required.
+
+        n_last_cohorts : int
+
+            Specify the number of last cohorts for which the
+            Caterpillar Diagram
+            needs to be generated
+
+        format : str
+
+            Image format, for instance ``png``, ``jpeg`` or ``svg``
+
+        dpi : int
+
+            Resolution of the image
+
+        figure : matplotlib Figure
+
+            Figure to clear and draw on, see
+            :class:`caterpillard.render.Renderer` for reusing one
+            figure per thread
+
+        resolution : str
+
+            Level of the temporal pyramid to draw, see
+            :meth:`caterpillar.CaterpillarDiagram.build_pyramid`
+
+        Returns
+        -------
+
+        image : bytes
+        """
+        from caterpillard.render import render_bytes
+
+        geometry = self.geometry(
+            data_index=data_index, n_last_cohorts=n_last_cohorts, resolution=resolution
+        )
+        return render_bytes(geometry, format=format, dpi=dpi, figure=figure)
+
@@ -0,0 +1,258 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import contextlib
+
+import pandas as pd
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from caterpillard.parallel import resolve_workers
+
+# Marker written once every output of an input file is complete
+SUCCESS_MARKER = "_SUCCESS.json"
+
+
+def expand_inputs(patterns):
+    """Expand file names and glob patterns into a sorted list of files.
+
+    Parameters
+    ----------
+    patterns : list of str
+        File names or glob patterns (``**`` is supported)
+
+    Returns
+    -------
+    paths : list of pathlib.Path
+    """
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        paths.update(Path(match) for match in matches if Path(match).is_file())
+    return sorted(paths)
+
+
+def output_dirs(paths, output_root):
+    """Assign every input file its own output subdirectory.
+
+    The subdirectory is named after the file stem. Stems shared by
+    several inputs get a short hash of the absolute path appended,
+    so that concurrent runs never write into the same directory.
+    """
+    stems = Counter(path.stem for path in paths)
+    dirs = []
+    for path in paths:
+        name = path.stem
+        if stems[name] > 1:
+            digest = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:8]
+            name = f"{name}-{digest}"
+        dirs.append(Path(output_root) / name)
+    return dirs
+
+
+def _fingerprint(path):
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _is_complete(input_path, out_dir):
+    marker = Path(out_dir) / SUCCESS_MARKER
+    if not marker.is_file():
+        return False
+    try:
+        with open(marker) as f:
+            return json.load(f).get("fingerprint") == _fingerprint(input_path)
+    except (OSError, ValueError):
+        return False
+
+
+def _write_json_atomic(path, content):
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(content, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_pipeline(
+    input_path,
+    out_dir,
+    relative=True,
+    data_index=None,
+    n_last_cohorts=None,
+    n_sim_iter=10 ** 4,
+    force=False,
+):
+    """Run the complete Caterpillar Diagram pipeline on one CSV file.
+
+    The input is read like the example dataset (first column as
+    index). Outputs go to ``out_dir`` together with a ``run.log``
+    holding everything the pipeline printed. A success marker is
+    written last, so an interrupted run is simply redone.
+
+    Returns
+    -------
+    record : dictionary
+        Status and timing of the run
+    """
+    from caterpillard.caterpillar import CaterpillarDiagram
+
+    record = {"input": str(input_path), "output": str(out_dir)}
+    if not force and _is_complete(input_path, out_dir):
+        record.update(status="skipped", seconds=0.0)
+        return record
+
+    start = time.perf_counter()
+    stages = {}
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    marker = Path(out_dir) / SUCCESS_MARKER
+    if marker.exists():
+        marker.unlink()
+
+    def timed(name, func, *args, **kwargs):
+        tic = time.perf_counter()
+        result = func(*args, **kwargs)
+        stages[name] = round(time.perf_counter() - tic, 6)
+        return result
+
+    try:
+        with open(Path(out_dir) / "run.log", "w") as log, contextlib.redirect_stdout(
+            log
+        ), contextlib.redirect_stderr(log):
+            data = timed("read", pd.read_csv, input_path, index_col=[0])
+            chosen = data.index[0] if data_index is None else data_index
+            chosen = int(chosen) if pd.api.types.is_integer(chosen) else chosen
+            if not relative:
+                data = data.loc[chosen]
+
+            cd = timed(
+                "__init__",
+                CaterpillarDiagram,
+                data=data,
+                relative=relative,
+                output_path=str(out_dir),
+            )
+            timed("data_summary", cd.data_summary)
+            timed("color_schema", cd.color_schema)
+            timed("caterpillar_size", cd.caterpillar_size)
+            timed("schema_transitions", cd.schema_transitions)
+            timed("stationary_matrix", cd.stationary_matrix, n_sim_iter=n_sim_iter)
+            cd.transition_mat.to_csv(Path(out_dir) / "transition_matrix.csv")
+            cd.stationary_mat_final_df.to_csv(Path(out_dir) / "stationary_matrix.csv")
+            timed(
+                "generate",
+                cd.generate,
+                data_index=chosen if relative else None,
+                n_last_cohorts=n_last_cohorts,
+                keep_figure=False,
+            )
+    except (Exception, SystemExit) as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    else:
+        record.update(status="ok")
+        _write_json_atomic(
+            marker, {"fingerprint": _fingerprint(input_path), "stages": stages}
+        )
+
+    record.update(seconds=round(time.perf_counter() - start, 6), stages=stages)
+    return record
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="caterpillard",
+        description=(
+            "Run the Caterpillar Diagram pipeline on one or many wide format "
+            "CSV files and stream the status of every file as JSON lines."
+        ),
+    )
+    parser.add_argument("inputs", nargs="+", help="CSV files or glob patterns")
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="caterpillard_output",
+        help="Root output directory, every input gets its own subdirectory",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, default=1, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--individual",
+        action="store_true",
+        help="Individual analysis of the row chosen with --data-index",
+    )
+    parser.add_argument(
+        "--data-index",
+        type=int,
+        default=None,
+        help="Row used for the diagram (default: first row)",
+    )
+    parser.add_argument("--n-last-cohorts", type=int, default=None)
+    parser.add_argument("--n-sim-iter", type=int, default=10 ** 4)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Recompute inputs that already completed in a previous run",
+    )
+    return parser
+
+
+def main(argv=None):
+    """Entry point of the ``caterpillard`` console script"""
+    args = build_parser().parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print(json.dumps({"status": "error", "error": "No input files found"}))
+        return 1
+
+    kwargs = dict(
+        relative=not args.individual,
+        data_index=args.data_index,
+        n_last_cohorts=args.n_last_cohorts,
+        n_sim_iter=args.n_sim_iter,
+        force=args.force,
+    )
+    tasks = list(zip(paths, output_dirs(paths, args.output_dir)))
+    n_workers = min(resolve_workers(args.workers), len(tasks))
+
+    failed = 0
+
+    def emit(record):
+        print(json.dumps(record), flush=True)
+        return record["status"] == "error"
+
+    if n_workers <= 1:
+        for path, out_dir in tasks:
+            failed += emit(run_pipeline(path, out_dir, **kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(run_pipeline, path, out_dir, **kwargs): (path, out_dir)
+                for path, out_dir in tasks
+            }
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # a worker died (for instance killed when out of
+                    # memory), its files are reported as failed
+                    path, out_dir = futures[future]
+                    record = {
+                        "input": str(path),
+                        "output": str(out_dir),
+                        "status": "error",
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                failed += emit(record)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import entity_codes, transition_codes
+from caterpillard.markov import transition_probabilities
+from caterpillard.parallel import map_chunks, resolve_workers
+
+logger = logging.getLogger(__name__)
+
+METRICS = ["js", "hellinger"]
+# Default memory budget of the temporary arrays of one row block
+MEMORY_BUDGET = 256 * 2 ** 20
+# Number of float64 (N x 49) temporaries per block row of every metric
+_TEMPORARIES = {"js": 2, "hellinger": 0}
+
+
+def entity_transition_probabilities(cohort_df):
+    """Flattened transition probabilities of every entity.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+
+    Returns
+    -------
+    entities : Pandas Index
+        ``data_index`` values in order of first appearance
+    probabilities : numpy.ndarray
+        Array of shape ``(len(entities), 49)``, row ``i`` being the
+        7x7 transition matrix of entity ``i`` in row-major order.
+        Rows of colors never left by an entity are zeros.
+    """
+    entity, entities = entity_codes(cohort_df)
+    row, from_code, to_code = transition_codes(cohort_df)
+    counts = np.bincount(
+        entity[row] * 49 + from_code * 7 + to_code, minlength=len(entities) * 49
+    ).reshape(-1, 7, 7)
+    return entities, transition_probabilities(counts).reshape(-1, 49)
+
+
+def _block_distances(probabilities, rowwise, start, stop, metric):
+    """Distances between rows ``start`` to ``stop`` and every row
+
+    ``rowwise`` holds the square roots of the probabilities for the
+    Hellinger distance and the sum of ``p log p`` of every row for
+    the Jensen-Shannon distance.
+    """
+    block = probabilities[start:stop]
+    if metric == "hellinger":
+        # sum (sqrt(p) - sqrt(q)) ** 2 = sum p + sum q - 2 sqrt(p).sqrt(q)
+        squared = (
+            block.sum(axis=1)[:, None]
+            + probabilities.sum(axis=1)[None, :]
+            - 2 * rowwise[start:stop] @ rowwise.T
+        )
+        return np.sqrt(np.maximum(squared, 0) / 14)
+
+    # 2 JS(p, q) = sum p log p + sum q log q - sum s log(s / 2), s = p + q,
+    # so only the last sum needs one logarithm per pair and entry
+    pairs = block[:, None, :] + probabilities[None, :, :]
+    logs = np.zeros_like(pairs)
+    np.log2(pairs, out=logs, where=pairs > 0)
+    mixed = np.einsum("ijk,ijk->ij", pairs, logs)
+    own = rowwise + probabilities.sum(axis=1)
+    divergence = own[start:stop, None] + own[None, :] - mixed
+    # average of the divergences of the 7 rows
+    return np.sqrt(np.maximum(divergence / 14, 0))
+
+
+def _nearest(distances, start, k):
+    """Indices and distances of the ``k`` nearest rows, itself excluded"""
+    rows = np.arange(len(distances))
+    distances[rows, start + rows] = np.inf
+    k = min(k, distances.shape[1] - 1)
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    chosen = np.take_along_axis(distances, nearest, axis=1)
+    order = np.argsort(chosen, axis=1, kind="stable")
+    return (
+        np.take_along_axis(nearest, order, axis=1),
+        np.take_along_axis(chosen, order, axis=1),
+    )
+
+
+def _distance_chunk(probabilities, blocks, metric, k):
+    """Evaluate the row blocks of one worker, one block at a time"""
+    if metric == "hellinger":
+        rowwise = np.sqrt(probabilities)
+    else:
+        logs = np.zeros_like(probabilities)
+        np.log2(probabilities, out=logs, where=probabilities > 0)
+        rowwise = (probabilities * logs).sum(axis=1)
+    results = []
+    for start, stop in blocks:
+        distances = _block_distances(probabilities, rowwise, start, stop, metric)
+        results.append(distances if k is None else _nearest(distances, start, k))
+    return results
+
+
+def block_rows(n_rows, metric, memory_budget=MEMORY_BUDGET):
+    """Number of rows of a block that fits in ``memory_budget`` bytes"""
+    per_row = n_rows * 8 * (2 + 49 * _TEMPORARIES[metric])
+    return int(max(1, min(n_rows, memory_budget // per_row)))
+
+
+def pairwise_distances(
+    probabilities, metric="js", k=None, memory_budget=MEMORY_BUDGET, n_workers=1
+):
+    """Distances between the transition matrices of every pair of entities.
+
+    The 7 rows of two transition matrices are compared as
+    distributions and averaged:
+
+    * ``js``, the square root of the Jensen-Shannon divergence
+      (base 2)
+    * ``hellinger``, the Hellinger distance, evaluated for a whole
+      block with one matrix product of the square roots
+
+    Both are metrics in ``[0, 1]`` for matrices whose rows are all
+    distributions.
+
+    Rows are processed in blocks sized so that the temporary arrays
+    of a block fit in ``memory_budget``. The blocks are optionally
+    spread over a process pool, see
+    :func:`caterpillard.parallel.map_chunks`.
+
+    Parameters
+    ----------
+    probabilities : array-like
+        Flattened transition matrices, shape ``(N, 49)``, see
+        :func:`entity_transition_probabilities`
+    metric : str
+        ``js`` or ``hellinger``
+    k : int
+        Only keep the ``k`` nearest entities of every entity, so the
+        ``N x N`` matrix is never stored
+    memory_budget : int
+        Bytes available for the temporary arrays of a block
+    n_workers : int or None
+        Number of worker processes, see
+        :func:`caterpillard.parallel.resolve_workers`
+
+    Returns
+    -------
+    distances : numpy.ndarray
+        ``N x N`` distances, or with ``k`` a tuple of the indices and
+        distances of the nearest entities, both of shape ``(N, k)``
+        and sorted by distance
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric should be one of {METRICS}")
+    probabilities = np.ascontiguousarray(probabilities, dtype=np.float64)
+    n = len(probabilities)
+    size = block_rows(n, metric, memory_budget)
+    blocks = [(start, min(start + size, n)) for start in range(0, n, size)]
+
+    # one task per worker, so the probabilities are sent once to each
+    n_tasks = max(1, min(resolve_workers(n_workers), len(blocks)))
+    tasks = [
+        (probabilities, blocks[i::n_tasks], metric, k)
+        for i in range(n_tasks)
+        if blocks[i::n_tasks]
+    ]
+    logger.debug(f"{len(blocks)} blocks of {size} rows over {len(tasks)} tasks")
+    results = map_chunks(_distance_chunk, tasks, n_workers=n_workers)
+
+    # blocks were dealt round-robin, restore their order
+    ordered = [None] * len(blocks)
+    for i, chunk in enumerate(results):
+        ordered[i :: len(tasks)] = chunk
+    if k is None:
+        return np.concatenate(ordered, axis=0) if ordered else np.zeros((0, 0))
+    return (
+        np.concatenate([block[0] for block in ordered], axis=0),
+        np.concatenate([block[1] for block in ordered], axis=0),
+    )
+
+
+def k_medoids(distances, n_clusters, max_iter=100, seed=None):
+    """Cluster entities around medoids of a distance matrix.
+
+    Alternates between assigning every entity to its closest medoid
+    and moving every medoid to the member of its cluster with the
+    smallest total distance to the other members, starting from a
+    k-means++ style seeding.
+
+    Parameters
+    ----------
+    distances : array-like
+        ``N x N`` distance matrix
+    n_clusters : int
+        Number of clusters
+    max_iter : int
+        Maximum number of iterations
+    seed : int
+        Seed of the initial medoids
+
+    Returns
+    -------
+    labels : numpy.ndarray
+        Cluster of every entity
+    medoids : numpy.ndarray
+        Index of the medoid of every cluster
+    inertia : float
+        Sum of the distances of every entity to its medoid
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    n = len(distances)
+    if not 1 <= n_clusters <= n:
+        raise ValueError("n_clusters should be between 1 and the number of entities")
+    rng = np.random.default_rng(seed)
+
+    medoids = [int(rng.integers(n))]
+    closest = distances[medoids[0]].copy()
+    for _ in range(1, n_clusters):
+        weights = closest ** 2
+        total = weights.sum()
+        if total > 0:
+            candidate = int(rng.choice(n, p=weights / total))
+        else:
+            candidate = int(np.setdiff1d(np.arange(n), medoids)[0])
+        medoids.append(candidate)
+        closest = np.minimum(closest, distances[candidate])
+    medoids = np.array(medoids)
+
+    for _ in range(max_iter):
+        labels = np.argmin(distances[:, medoids], axis=1)
+        # the chosen medoid is always a member of its own cluster
+        labels[medoids] = np.arange(n_clusters)
+        updated = medoids.copy()
+        for cluster in range(n_clusters):
+            members = np.flatnonzero(labels == cluster)
+            cost = distances[np.ix_(members, members)].sum(axis=1)
+            updated[cluster] = members[np.argmin(cost)]
+        if (updated == medoids).all():
+            break
+        medoids = updated
+
+    labels = np.argmin(distances[:, medoids], axis=1)
+    labels[medoids] = np.arange(n_clusters)
+    inertia = float(distances[np.arange(n), medoids[labels]].sum())
+    return labels, medoids, inertia
+
+
+def nearest_frame(entities, nearest, distances):
+    """Nearest entities in long format, one row per neighbour"""
+    k = nearest.shape[1]
+    return pd.DataFrame(
+        {
+            "data_index": np.repeat(np.asarray(entities), k),
+            "rank": np.tile(np.arange(1, k + 1), len(entities)),
+            "neighbour": np.asarray(entities)[nearest.ravel()],
+            "distance": distances.ravel(),
+        }
+    )
@@ -0,0 +1,111 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def row_groups(values):
+    """Group the identical and the constant rows of a panel.
+
+    Rows are hashed with :func:`pandas.util.hash_pandas_object` and
+    rows of equal hash are grouped when they are also identical bit
+    for bit, so hash collisions and ``-0.0``/``0.0`` never merge rows
+    whose cohorts could differ. Rows holding a single finite value
+    have only zero differences whatever the value, they form one
+    group of their own.
+
+    Parameters
+    ----------
+    values : array-like
+        Wide format values, one row per entity, without missing
+        values
+
+    Returns
+    -------
+    representative : numpy.ndarray
+        Index of the first row of the group of every row
+    constant : numpy.ndarray
+        Whether every row is constant
+    """
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    n = len(values)
+    constant = np.isfinite(values).all(axis=1) & (values == values[:, :1]).all(axis=1)
+
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(values), index=False).to_numpy()
+    codes, uniques = pd.factorize(hashes)
+    first = np.empty(len(uniques), dtype=np.int64)
+    # reversed, so the first row of every code is written last
+    first[codes[::-1]] = np.arange(n)[::-1]
+    representative = first[codes]
+
+    bits = values.view(np.uint64)
+    collided = ~(bits == bits[representative]).all(axis=1)
+    representative[collided] = np.flatnonzero(collided)
+    if constant.any():
+        representative[constant] = np.flatnonzero(constant)[0]
+    return representative, constant
+
+
+def dedup_stats(representative, constant):
+    """Number of entities, of distinct series and the dedup ratio.
+
+    The dedup ratio is the share of entities whose cohorts were not
+    classified because an identical (or constant) series was.
+    """
+    n_entities = len(representative)
+    n_unique = int((representative == np.arange(n_entities)).sum())
+    return {
+        "n_entities": n_entities,
+        "n_unique": n_unique,
+        "n_constant": int(np.sum(constant)),
+        "dedup_ratio": 1 - n_unique / n_entities if n_entities else 0.0,
+    }
+
+
+def weighted_pairs(codes, rows, slot, within_entities=True):
+    """Consecutive color pairs of deduplicated cohorts.
+
+    The pairs of every distinct series are listed once, weighted by
+    the number of entities sharing it, instead of once per entity.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Color codes of shape ``(n_unique, n_cohorts)``, one row per
+        distinct series
+    rows : numpy.ndarray
+        Position of the first entity of every distinct series
+    slot : numpy.ndarray
+        Distinct series of every entity
+    within_entities : bool
+        Leave out the pairs formed by the last cohort of an entity
+        and the first cohort of the next one
+
+    Returns
+    -------
+    pair : numpy.ndarray
+        Pair codes, ``from * 7 + to``
+    position : numpy.ndarray
+        Position of the first occurrence of every listed pair in the
+        cohort table of all entities
+    weight : numpy.ndarray
+        Number of occurrences of every listed pair
+    """
+    n_cohorts = codes.shape[1]
+    pair = (codes[:, :-1] * 7 + codes[:, 1:]).ravel()
+    position = (rows[:, None] * n_cohorts + np.arange(n_cohorts - 1)).ravel()
+    weight = np.repeat(np.bincount(slot, minlength=len(codes)), n_cohorts - 1)
+    if not within_entities and len(slot) > 1:
+        pair = np.r_[pair, codes[slot[:-1], -1] * 7 + codes[slot[1:], 0]]
+        position = np.r_[position, np.arange(1, len(slot)) * n_cohorts - 1]
+        weight = np.r_[weight, np.ones(len(slot) - 1, dtype=np.int64)]
+    return pair, position, weight
+
+
+def unique_apply(series, func):
+    """``series.apply(func)`` evaluated once per distinct value"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    results = pd.Series(uniques).apply(func)
+    return pd.Series(results.to_numpy()[codes], index=series.index, name=series.name)
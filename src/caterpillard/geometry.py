@@ -0,0 +1,151 @@
+import json
+import logging
+
+import numpy as np
+
+from caterpillard.grouping import entity_codes
+from caterpillard.kernels import color_names
+
+logger = logging.getLogger(__name__)
+
+# Length of the line between two consecutive cohort circles
+LINE_LENGTH = 1
+
+
+def caterpillar_geometry(radii, colors, line_length=LINE_LENGTH):
+    """Geometry of one Caterpillar Diagram.
+
+    The first circle is centred at the origin and every following
+    circle is placed so that it is ``line_length`` away from the
+    previous one, the same layout as drawn by
+    :meth:`caterpillar.CaterpillarDiagram.generate`.
+
+    Parameters
+    ----------
+    radii : array-like
+        Radius of every cohort
+    colors : list of str
+        Color of every cohort
+    line_length : float
+        Length of the line between consecutive circles
+
+    Returns
+    -------
+    geometry : dictionary
+        ``cx`` (centres), ``lx_s`` and ``lx_e`` (start and end of
+        the lines), ``radii`` and ``colors``
+    """
+    radii = np.asarray(radii, dtype=np.float64)
+    cx = np.zeros(len(radii))
+    np.cumsum(radii[:-1] + line_length + radii[1:], out=cx[1:])
+    lx_s = cx[:-1] + radii[:-1]
+    return {
+        "cx": cx,
+        "lx_s": lx_s,
+        "lx_e": lx_s + line_length,
+        "radii": radii,
+        "colors": list(colors),
+    }
+
+
+def entity_geometries(cohort_df, n_last_cohorts=None, line_length=LINE_LENGTH):
+    """Geometry of the Caterpillar Diagram of every entity at once.
+
+    The circle centres of all entities are evaluated with a single
+    cumulative sum that restarts at every entity. The result is
+    stored in a compact ragged layout: the circles of entity ``i``
+    are ``offsets[i]`` to ``offsets[i + 1]`` of the flat arrays.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details with radii, for instance
+        ``CaterpillarDiagram.complete_cohort_df`` after
+        :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`
+    n_last_cohorts : int
+        Keep only the last cohorts of every entity
+    line_length : float
+        Length of the line between consecutive circles
+
+    Returns
+    -------
+    geometries : dictionary
+        ``data_index`` and ``offsets`` per entity, ``cx``, ``radius``
+        and ``n_color`` per circle
+    """
+    entity, entities = entity_codes(cohort_df)
+    radius = cohort_df["final_cohort_radius"].to_numpy(dtype=np.float64)
+    n_color = cohort_df["n_color"].to_numpy(dtype=np.int8)
+
+    first = np.r_[True, entity[1:] != entity[:-1]]
+    if n_last_cohorts is not None:
+        # position of every cohort counted from the end of its entity
+        last = np.r_[entity[1:] != entity[:-1], True]
+        end = np.flatnonzero(last)
+        from_end = end[np.cumsum(first) - 1] - np.arange(len(entity))
+        keep = from_end < n_last_cohorts
+        entity, radius, n_color = entity[keep], radius[keep], n_color[keep]
+        first = np.r_[True, entity[1:] != entity[:-1]]
+
+    step = np.zeros(len(radius))
+    step[1:] = np.where(first[1:], 0, radius[:-1] + line_length + radius[1:])
+    cumulative = np.cumsum(step)
+    start = np.flatnonzero(first)
+    cx = cumulative - np.repeat(cumulative[start], np.diff(np.r_[start, len(entity)]))
+
+    offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(entity, minlength=len(entities)), out=offsets[1:])
+    logger.debug(f"Geometry evaluated for {len(entities)} entities")
+    return {
+        "data_index": np.asarray(entities),
+        "offsets": offsets,
+        "cx": cx,
+        "radius": radius,
+        "n_color": n_color,
+        "line_length": line_length,
+    }
+
+
+def geometry_of(geometries, i):
+    """Geometry of the ``i``-th entity of :func:`entity_geometries`"""
+    start, end = geometries["offsets"][i], geometries["offsets"][i + 1]
+    cx = geometries["cx"][start:end]
+    radii = geometries["radius"][start:end]
+    lx_s = cx[:-1] + radii[:-1]
+    return {
+        "data_index": geometries["data_index"][i],
+        "cx": cx,
+        "lx_s": lx_s,
+        "lx_e": lx_s + geometries["line_length"],
+        "radii": radii,
+        "colors": list(color_names(geometries["n_color"][start:end])),
+    }
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def to_json(geometry):
+    """Serialise a geometry (single or per-entity) to compact JSON"""
+    return json.dumps(
+        {key: _plain(value) for key, value in geometry.items()},
+        separators=(",", ":"),
+    )
+
+
+def save_geometries(geometries, path):
+    """Write the output of :func:`entity_geometries` to ``.json`` or ``.npz``"""
+    if str(path).endswith(".npz"):
+        arrays = {}
+        for key, value in geometries.items():
+            value = np.asarray(value)
+            arrays[key] = value.astype(str) if value.dtype == object else value
+        np.savez_compressed(path, **arrays)
+    else:
+        with open(path, "w") as f:
+            f.write(to_json(geometries))
@@ -0,0 +1,122 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def entity_codes(cohort_df):
+    """Integer code (from 0) of the entity of every cohort.
+
+    Cohort details of an individual analysis have no ``data_index``
+    and are treated as a single entity labelled ``None``.
+
+    Returns
+    -------
+    entity : numpy.ndarray
+    entities : Pandas Index
+        ``data_index`` values in order of first appearance
+    """
+    if "data_index" not in cohort_df:
+        return np.zeros(len(cohort_df), dtype=np.int64), pd.Index([None])
+    return pd.factorize(cohort_df["data_index"])
+
+
+def transition_codes(cohort_df):
+    """Integer codes of the consecutive color transitions of every entity.
+
+    Transitions are taken between consecutive cohorts of the same
+    ``data_index`` (and of the same ``segment`` for ragged panels),
+    never across two entities.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+
+    Returns
+    -------
+    row : numpy.ndarray
+        Position (in ``cohort_df``) of the cohort each transition
+        starts from
+    from_code, to_code : numpy.ndarray
+        Color codes from 0 (red) to 6 (grey)
+    """
+    code = cohort_df["n_color"].to_numpy(dtype=np.int64) - 1
+    entity = entity_codes(cohort_df)[0]
+    same = entity[1:] == entity[:-1]
+    if "segment" in cohort_df:
+        segment = cohort_df["segment"].to_numpy()
+        same &= segment[1:] == segment[:-1]
+    row = np.flatnonzero(same)
+    return row, code[row], code[row + 1]
+
+
+def group_transition_counts(cohort_df, group_by):
+    """Transition counts of every group in a single ``np.bincount``.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+    group_by : dict or Pandas Series
+        Mapping from ``data_index`` to a group key. Entities without
+        a group are left out.
+
+    Returns
+    -------
+    keys : list
+        Group keys in order of first appearance
+    counts : numpy.ndarray
+        Transition counts of shape ``(len(keys), 7, 7)``
+    """
+    group = pd.Series(cohort_df["data_index"].to_numpy()).map(group_by)
+    group_code, keys = pd.factorize(group)
+    row, from_code, to_code = transition_codes(cohort_df)
+
+    group_code = group_code[row]
+    keep = group_code >= 0
+    flat = group_code[keep] * 49 + from_code[keep] * 7 + to_code[keep]
+    counts = np.bincount(flat, minlength=len(keys) * 49).reshape(-1, 7, 7)
+    logger.debug(f"Transition counts evaluated for {len(keys)} groups")
+    return list(keys), counts
+
+
+def rollup(keys, counts):
+    """Aggregate group counts to every parent level of the hierarchy.
+
+    Group keys that are tuples, such as ``(region, sector)``, are
+    rolled up to each of their prefixes, ``(region,)`` and the total
+    ``()``, by summing the child counts. Other keys are rolled up to
+    the total only.
+
+    Parameters
+    ----------
+    keys : list
+        Group keys
+    counts : numpy.ndarray
+        Counts of shape ``(len(keys), 7, 7)``
+
+    Returns
+    -------
+    parent_keys : list
+    parent_counts : numpy.ndarray
+        Counts of shape ``(len(parent_keys), 7, 7)``
+    """
+    tuples = [key if isinstance(key, tuple) else (key,) for key in keys]
+    depth = max((len(key) for key in tuples), default=1)
+
+    parent_keys = []
+    parent_counts = []
+    for level in range(depth - 1, -1, -1):
+        parent_code, parents = pd.factorize(
+            pd.Series([key[:level] for key in tuples], dtype=object)
+        )
+        summed = np.zeros((len(parents), 7, 7), dtype=counts.dtype)
+        np.add.at(summed, parent_code, counts)
+        parent_keys.extend(parents)
+        parent_counts.append(summed)
+    return parent_keys, np.concatenate(parent_counts, axis=0)
@@ -0,0 +1,263 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import entity_codes
+from caterpillard.markov import COLORS
+from caterpillard.similarity import MISSING, sequence_codes
+
+logger = logging.getLogger(__name__)
+
+# Context codes of order k take values below 7 ** k, which fit in int64
+# up to k = 22
+MAX_ORDER = 22
+
+
+def encode(histories):
+    """Base-7 code of every history (oldest color most significant).
+
+    Parameters
+    ----------
+    histories : array-like
+        Color codes (0 for red to 6 for grey) of shape ``(N, k)``
+
+    Returns
+    -------
+    code : numpy.ndarray
+        Context codes below ``7 ** k``
+    """
+    histories = np.asarray(histories, dtype=np.int64)
+    code = np.zeros(histories.shape[0], dtype=np.int64)
+    for j in range(histories.shape[1]):
+        code = code * 7 + histories[:, j]
+    return code
+
+
+def decode(code, order):
+    """Color names of the histories encoded by :func:`encode`"""
+    code = np.asarray(code, dtype=np.int64)
+    digits = (code[:, None] // 7 ** np.arange(order - 1, -1, -1)) % 7
+    return np.asarray(COLORS, dtype=object)[digits]
+
+
+def context_codes(cohort_df, order):
+    """Context of the ``order`` previous colors of every cohort.
+
+    Contexts only span consecutive cohorts of the same ``data_index``
+    (and of the same ``segment`` for ragged panels).
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+    order : int
+        Number of previous colors in the context
+
+    Returns
+    -------
+    context : numpy.ndarray
+        Base-7 code of the previous colors, see :func:`encode`
+    following : numpy.ndarray
+        Color code of the cohort following every context
+    """
+    code = cohort_df["n_color"].to_numpy(dtype=np.int64) - 1
+    entity = entity_codes(cohort_df)[0]
+    n = len(code)
+    position = np.arange(n)
+
+    boundary = np.r_[True, entity[1:] != entity[:-1]][:n]
+    if "segment" in cohort_df:
+        segment = cohort_df["segment"].to_numpy()
+        boundary[1:] |= segment[1:] != segment[:-1]
+    # a cohort outside the color schema also breaks the history, the
+    # next run starts right after it
+    invalid = code < 0
+    run_start = np.where(boundary, position, 0)
+    run_start[invalid] = position[invalid] + 1
+    run_start = np.maximum.accumulate(run_start)
+    target = np.flatnonzero((position - run_start >= order) & (code >= 0))
+
+    context = np.zeros(len(target), dtype=np.int64)
+    for lag in range(order, 0, -1):
+        # rolling encoding, code = code * 7 + next
+        context = context * 7 + code[target - lag]
+    return context, code[target]
+
+
+def count_contexts(context, following):
+    """Sparse transition table of the observed contexts.
+
+    Counts are accumulated with a single ``np.bincount`` over the
+    observed contexts only, so the table has one row per distinct
+    context instead of ``7 ** k``.
+
+    Returns
+    -------
+    contexts : numpy.ndarray
+        Sorted distinct context codes
+    counts : numpy.ndarray
+        Counts of shape ``(len(contexts), 7)``
+    """
+    contexts, inverse = np.unique(context, return_inverse=True)
+    counts = np.bincount(
+        inverse.ravel() * 7 + following, minlength=len(contexts) * 7
+    ).reshape(-1, 7)
+    return contexts, counts
+
+
+class HigherOrderChain:
+    """Order-k Markov chain over the color schema.
+
+    The probability of the next color depends on the ``order``
+    previous colors. Every history is encoded as a base-7 integer and
+    only the contexts actually observed are stored, as a sorted array
+    of context codes with one row of 7 counts each, so orders up to 5
+    (and beyond) never allocate a dense ``7 ** k`` by ``7 ** k``
+    matrix.
+
+    With ``backoff``, contexts that were never observed fall back to
+    the longest observed suffix of the history, down to the marginal
+    color distribution.
+    """
+
+    def __init__(self, order=2, backoff=True) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        order : int
+            Number of previous colors the next color depends on
+        backoff : bool
+            Fall back to lower orders for unseen contexts
+        """
+        if type(order) is not int or not 1 <= order <= MAX_ORDER:
+            raise ValueError(f"order should be an integer from 1 to {MAX_ORDER}")
+        self.order = order
+        self.backoff = backoff
+        self.tables = {}
+
+    def fit(self, cohort_df):
+        """Count the contexts of every order in ``cohort_df``.
+
+        Parameters
+        ----------
+        cohort_df : Pandas DataFrame
+            Cohort details, for instance
+            ``CaterpillarDiagram.complete_cohort_df``
+
+        Returns
+        -------
+        self : HigherOrderChain
+        """
+        orders = range(self.order, -1, -1) if self.backoff else [self.order]
+        self.tables = {}
+        for order in orders:
+            context, following = context_codes(cohort_df, order)
+            self.tables[order] = count_contexts(context, following)
+            logger.debug(
+                f"Order {order}: {len(self.tables[order][0])} contexts observed"
+            )
+        return self
+
+    def transition_table(self, order=None, normalize=True):
+        """Transition table of the observed contexts.
+
+        Parameters
+        ----------
+        order : int
+            Order of the table, the order of the chain by default
+        normalize : bool
+            Probabilities instead of counts
+
+        Returns
+        -------
+        table : Pandas DataFrame
+            One row per observed context, labelled by its colors
+            (oldest first), and one column per next color
+        """
+        order = self.order if order is None else order
+        contexts, counts = self.tables[order]
+        if order == 0:
+            index = pd.Index(["()"], name="context")
+        else:
+            index = pd.Index(
+                ["-".join(row) for row in decode(contexts, order)], name="context"
+            )
+        table = pd.DataFrame(counts, index=index, columns=COLORS)
+        if normalize:
+            table = table.div(table.sum(axis=1).replace({0: 1}), axis=0)
+        return table
+
+    def predict_proba(self, histories):
+        """Distribution of the next color after every history.
+
+        Parameters
+        ----------
+        histories : array-like
+            Color codes (0 for red to 6 for grey), oldest first, of
+            shape ``(N, m)`` with ``m >= order``. Negative codes mark
+            missing history.
+
+        Returns
+        -------
+        probabilities : numpy.ndarray
+            Array of shape ``(N, 7)``, ``NaN`` when no context
+            matches
+        used_order : numpy.ndarray
+            Order of the context used for every history, ``-1``
+            when none matched
+        """
+        if not self.tables:
+            raise RuntimeError("The chain must be fitted before predicting")
+        histories = np.asarray(histories, dtype=np.int64)
+        n = histories.shape[0]
+        probabilities = np.full((n, 7), np.nan)
+        used_order = np.full(n, -1, dtype=np.int64)
+        pending = np.ones(n, dtype=bool)
+
+        for order in sorted(self.tables, reverse=True):
+            contexts, counts = self.tables[order]
+            if order == 0:
+                found = pending & (counts.sum() > 0)
+                rows = np.zeros(n, dtype=np.int64)
+            else:
+                window = histories[:, -order:]
+                complete = (window >= 0).all(axis=1)
+                context = encode(np.where(complete[:, None], window, 0))
+                rows = np.minimum(np.searchsorted(contexts, context), len(contexts) - 1)
+                found = pending & complete
+                if len(contexts):
+                    found &= contexts[rows] == context
+                else:
+                    found[:] = False
+            chosen = counts[rows[found]]
+            probabilities[found] = chosen / chosen.sum(axis=1, keepdims=True)
+            used_order[found] = order
+            pending &= ~found
+        return probabilities, used_order
+
+    def predict_next(self, cohort_df):
+        """Distribution of the next color of every entity.
+
+        Parameters
+        ----------
+        cohort_df : Pandas DataFrame
+            Cohort details, for instance
+            ``CaterpillarDiagram.complete_cohort_df``
+
+        Returns
+        -------
+        prediction : Pandas DataFrame
+            Probability of every color and the ``order`` of the
+            context used, indexed by ``data_index``
+        """
+        entities, codes = sequence_codes(cohort_df, self.order)
+        histories = np.where(codes == MISSING, -1, codes.astype(np.int64))
+        probabilities, used_order = self.predict_proba(histories)
+        prediction = pd.DataFrame(
+            probabilities, index=pd.Index(entities, name="data_index"), columns=COLORS
+        )
+        prediction["order"] = used_order
+        return prediction
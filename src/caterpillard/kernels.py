@@ -0,0 +1,181 @@
+import numpy as np
+
+from caterpillard.markov import COLORS
+
+LEVELS = ["level1", "level2", "level3", "level4", "level5", "level6", "level7"]
+
+# n_color for every sign combination of (d11, d12, d2), indexed by
+# (sign(d11) + 1) * 9 + (sign(d12) + 1) * 3 + (sign(d2) + 1). Zero marks
+# a combination that is not captured by the color schema.
+_SIGN_TABLE = np.zeros(27, dtype=np.int8)
+for _signs, _n_color in {
+    (0, 0, 0): 7,
+    (1, 1, 1): 1,
+    (1, 1, -1): 2,
+    (-1, 1, 1): 3,
+    (1, -1, -1): 4,
+    (-1, -1, 1): 5,
+    (-1, -1, -1): 6,
+    (0, 1, 1): 1,
+    (0, -1, -1): 6,
+    (-1, 0, 1): 5,
+    (1, 0, -1): 2,
+    (1, 1, 0): 1,
+    (-1, -1, 0): 6,
+}.items():
+    _SIGN_TABLE[(_signs[0] + 1) * 9 + (_signs[1] + 1) * 3 + (_signs[2] + 1)] = _n_color
+
+
+def _floating(values):
+    # float32 inputs stay float32, everything else is computed in float64
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values
+    return values.astype(np.float64, copy=False)
+
+
+def difference_of_differences(values):
+    """First and second differences of every cohort.
+
+    A cohort is made of three consecutive values along the last
+    axis, so ``T`` periods give ``T - 2`` cohorts.
+
+    Parameters
+    ----------
+    values : array-like
+        Values with the time-axis as the last axis
+
+    Returns
+    -------
+    d11, d12, d2 : numpy.ndarray
+        Arrays of shape ``(..., T - 2)``
+    """
+    d1 = np.diff(_floating(values), axis=-1)
+    d11 = d1[..., :-1]
+    d12 = d1[..., 1:]
+    return d11, d12, d12 - d11
+
+
+def classify(d11, d12, d2):
+    """Vectorized counterpart of :meth:`caterpillar.CaterpillarDiagram.schema`.
+
+    Parameters
+    ----------
+    d11, d12, d2 : array-like
+        First and second differences of the cohorts
+
+    Returns
+    -------
+    n_color : numpy.ndarray
+        Color number (1 to 7) of every cohort. Zero marks a sign
+        combination that the color schema does not capture, for
+        instance because of missing values.
+    """
+    d11, d12, d2 = np.broadcast_arrays(_floating(d11), _floating(d12), _floating(d2))
+    valid = ~(np.isnan(d11) | np.isnan(d12) | np.isnan(d2))
+    key = (
+        (np.sign(np.where(valid, d11, 0)).astype(np.int8) + 1) * 9
+        + (np.sign(np.where(valid, d12, 0)).astype(np.int8) + 1) * 3
+        + (np.sign(np.where(valid, d2, 0)).astype(np.int8) + 1)
+    )
+    return np.where(valid, _SIGN_TABLE[key], 0).astype(np.int8)
+
+
+def color_names(n_color):
+    """Map color numbers (1 to 7) to color names."""
+    return np.asarray(COLORS, dtype=object)[np.asarray(n_color) - 1]
+
+
+def level_names(n_color):
+    """Map color numbers (1 to 7) to level names."""
+    return np.asarray(LEVELS, dtype=object)[np.asarray(n_color) - 1]
+
+
+def entity_matrix(entity, values, n_entities=None):
+    """Arrange a per-cohort column as one row per entity.
+
+    Parameters
+    ----------
+    entity : array-like
+        Integer code (from 0) of the entity of every cohort, the
+        cohorts of an entity being stored contiguously and in order
+    values : array-like
+        Value of every cohort
+    n_entities : int
+        Number of entities
+
+    Returns
+    -------
+    matrix : numpy.ndarray
+        Array of shape ``(n_entities, max_cohorts)``, padded with
+        ``NaN`` for entities with fewer cohorts
+    rank : numpy.ndarray
+        Column of every cohort in ``matrix``
+    """
+    entity = np.asarray(entity, dtype=np.int64)
+    if n_entities is None:
+        n_entities = int(entity.max()) + 1 if len(entity) else 0
+    lengths = np.bincount(entity, minlength=n_entities)
+    first = np.zeros(n_entities, dtype=np.int64)
+    present, first_index = np.unique(entity, return_index=True)
+    first[present] = first_index
+    rank = np.arange(len(entity)) - first[entity]
+
+    matrix = np.full((n_entities, lengths.max(initial=0)), np.nan)
+    matrix[entity, rank] = values
+    return matrix, rank
+
+
+def radius_thresholds(abs_diff, axis=None):
+    """Box-plot thresholds used for assigning the radius.
+
+    Gives the same values as the ``describe()`` summary used in
+    :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`, missing
+    values are ignored.
+
+    Parameters
+    ----------
+    abs_diff : array-like
+        Absolute first differences
+    axis : int
+        Axis along which the thresholds are computed. ``None``
+        pools every value.
+
+    Returns
+    -------
+    thresholds : dictionary
+        ``min``, ``25%``, ``50%``, ``75%`` and ``max`` thresholds
+    """
+    abs_diff = np.asarray(abs_diff, dtype=np.float64)
+    # np.nanquantile is much slower, only use it when padding is present
+    quantile = np.nanquantile if np.isnan(abs_diff).any() else np.quantile
+    quantiles = quantile(abs_diff, [0, 0.25, 0.5, 0.75, 1], axis=axis)
+    return dict(zip(["min", "25%", "50%", "75%", "max"], quantiles))
+
+
+def assign_radius(abs_diff, thresholds):
+    """Vectorized counterpart of
+    :meth:`caterpillar.CaterpillarDiagram.caterpillar_assign_radius`.
+
+    Parameters
+    ----------
+    abs_diff : array-like
+        Absolute first differences
+    thresholds : dictionary
+        ``min``, ``25%``, ``50%`` and ``75%`` thresholds. Values may be
+        arrays that broadcast against ``abs_diff``, for instance one
+        threshold per entity.
+
+    Returns
+    -------
+    radius : numpy.ndarray
+        Radius of 2, 4, 6 or 8 units. Values below the minimum or
+        missing values get ``NaN``.
+    """
+    diff = np.asarray(abs_diff, dtype=np.float64)
+    radius = 2.0 + 2.0 * (
+        (diff >= thresholds["25%"]).astype(np.int8)
+        + (diff >= thresholds["50%"])
+        + (diff >= thresholds["75%"])
+    )
+    return np.where(diff >= thresholds["min"], radius, np.nan)
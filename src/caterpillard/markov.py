@@ -0,0 +1,57 @@
+import numpy as np
+
+# Order of the states in every transition and stationary matrix
+COLORS = ["red", "orange", "yellow", "cyan", "blue", "green", "grey"]
+
+
+def transition_probabilities(counts):
+    """Convert transition counts into transition probabilities.
+
+    Works on a single 7x7 count matrix as well as on a stack of
+    them (``(..., 7, 7)``). As in
+    :meth:`caterpillar.CaterpillarDiagram.stationary_matrix`, rows
+    without any transitions are left as zeros.
+
+    Parameters
+    ----------
+    counts : array-like
+        Transition counts, rows are the "from" colors
+
+    Returns
+    -------
+    prob : numpy.ndarray
+        Row-normalised transition probabilities
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    row_sum = counts.sum(axis=-1, keepdims=True)
+    return counts / np.where(row_sum == 0, 1, row_sum)
+
+
+def stationary_power(prob, n_sim_iter=10 ** 4):
+    """Stationary matrix of one or many transition matrices.
+
+    Equivalent to multiplying the transition matrix by itself
+    ``n_sim_iter`` times, as done in
+    :meth:`caterpillar.CaterpillarDiagram.stationary_matrix`, but
+    evaluated by repeated squaring in a single batched
+    :func:`numpy.linalg.matrix_power` call.
+
+    Parameters
+    ----------
+    prob : array-like
+        Transition probabilities of shape ``(7, 7)`` or ``(..., 7, 7)``
+    n_sim_iter : int
+        Number of multiplications
+
+    Returns
+    -------
+    stationary : numpy.ndarray
+
+    Raises
+    ------
+    ValueError
+        When ``n_sim_iter`` is smaller than 1
+    """
+    if n_sim_iter < 1:
+        raise ValueError("n_sim_iter must be a positive integer")
+    return np.linalg.matrix_power(np.asarray(prob, dtype=np.float64), n_sim_iter + 1)
@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import transition_codes
+from caterpillard.kernels import (
+    assign_radius,
+    classify,
+    color_names,
+    difference_of_differences,
+    level_names,
+    radius_thresholds,
+)
+from caterpillard.markov import COLORS, stationary_power, transition_probabilities
+from caterpillard.ragged import RaggedPanel
+from caterpillard.scoring import surprise_scores, top_k
+
+logger = logging.getLogger(__name__)
+
+# Identifies model artifacts, VERSION changes with every incompatible
+# change of the layout
+FORMAT = "caterpillard-model"
+VERSION = 1
+_KEYS = ["min", "25%", "50%", "75%", "max"]
+
+
+def cohorts_of(data, dtype=np.float64, first_cohort=0):
+    """Cohort details of a panel, without the legacy per-row loop.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame, Pandas Series or RaggedPanel
+        Wide format panel with one row per entity, a single series
+        for an individual analysis, or a ragged panel. Missing values
+        are taken as zero, as in
+        :meth:`caterpillar.CaterpillarDiagram.color_schema`.
+    dtype : numpy dtype
+        ``float64``, or ``float32`` to halve the memory taken by the
+        differences. Ragged panels are always computed in ``float64``.
+    first_cohort : int
+        Number of cohorts before the first period of ``data``, used
+        to label the cohorts of a window of the panel
+
+    Returns
+    -------
+    cohort_df : Pandas DataFrame
+        Same columns as ``CaterpillarDiagram.complete_cohort_df``
+        after :meth:`caterpillar.CaterpillarDiagram.color_schema`
+    """
+    if isinstance(data, RaggedPanel):
+        return data.cohorts()
+
+    individual = isinstance(data, pd.Series)
+    frame = data.to_frame().T if individual else data
+    values = np.atleast_2d(frame.to_numpy(dtype=dtype, na_value=np.nan, copy=True))
+    # same as fillna(value=0), without a second copy of the frame
+    values[np.isnan(values)] = 0
+    d11, d12, d2 = difference_of_differences(values)
+    n_color = classify(d11, d12, d2)
+    if (n_color == 0).any():
+        raise ValueError("Fatal:\tSign combination Not Captured\n")
+
+    n_entities, n_cohorts = n_color.shape
+    labels = np.array(
+        [f"Cohort{first_cohort + i + 1}" for i in range(n_cohorts)], dtype=object
+    )
+    n_color = n_color.ravel()
+    columns = {"d11": d11.ravel(), "d12": d12.ravel(), "d2": d2.ravel()}
+    if not individual:
+        columns["data_index"] = np.repeat(frame.index.to_numpy(), n_cohorts)
+    columns.update(
+        {
+            "Cohort": np.tile(labels, n_entities),
+            "color": color_names(n_color),
+            "level": level_names(n_color),
+            "n_color": n_color.astype(np.int64),
+        }
+    )
+    return pd.DataFrame(columns, index=np.tile(np.arange(n_cohorts), n_entities))
+
+
+class CaterpillarModel:
+    """Learned radius thresholds and color chain of a Caterpillar Diagram.
+
+    :meth:`fit` learns the pooled radius thresholds, the transition
+    probabilities and the stationary matrix once. :meth:`transform`
+    and :meth:`score` then apply them to new panels with the
+    vectorized classification and binning only, so radii stay
+    comparable between runs and a handful of new entities is scored
+    without recomputing anything.
+
+    The model is saved by :meth:`save` as a small versioned JSON
+    artifact, :meth:`load` reads it back in well under a millisecond.
+    """
+
+    def __init__(self, thresholds, trans_mat_prob, stationary, metadata=None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        thresholds : dictionary
+            ``d11`` and ``d12`` radius thresholds, each with ``min``,
+            ``25%``, ``50%``, ``75%`` and ``max`` values
+        trans_mat_prob : array-like
+            7x7 transition probabilities, rows and columns in the
+            order of the colors
+        stationary : array-like
+            7x7 stationary matrix
+        metadata : dictionary
+            JSON serializable details of the fit, such as the number
+            of entities and cohorts
+        """
+        self.thresholds = {
+            diff: {key: float(thresholds[diff][key]) for key in _KEYS}
+            for diff in ["d11", "d12"]
+        }
+        self.trans_mat_prob = pd.DataFrame(
+            np.asarray(trans_mat_prob, dtype=np.float64), index=COLORS, columns=COLORS
+        )
+        self.stationary_mat = pd.DataFrame(
+            np.asarray(stationary, dtype=np.float64), index=COLORS, columns=COLORS
+        )
+        if self.trans_mat_prob.shape != (7, 7) or self.stationary_mat.shape != (7, 7):
+            raise ValueError("Transition and stationary matrices should be 7x7")
+        self.metadata = dict(metadata or {})
+
+    @classmethod
+    def fit(cls, data, n_sim_iter=10 ** 4):
+        """Learn a model from a panel.
+
+        The thresholds are pooled over every cohort, as in
+        :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`, and
+        transitions are counted within each entity.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame, Pandas Series or RaggedPanel
+            Panel the model is learned from
+        n_sim_iter : int
+            Number of iterations for the stationary matrix
+
+        Returns
+        -------
+        model : CaterpillarModel
+        """
+        cohort_df = cohorts_of(data)
+        thresholds = {
+            diff: radius_thresholds(cohort_df[diff].abs().to_numpy())
+            for diff in ["d11", "d12"]
+        }
+        logger.info(f"Model fitted on {len(cohort_df)} cohorts")
+        return cls._from_cohorts(cohort_df, thresholds, n_sim_iter)
+
+    @classmethod
+    def from_diagram(cls, cd, n_sim_iter=10 ** 4):
+        """Model of an analysed :class:`caterpillar.CaterpillarDiagram`.
+
+        Uses the pooled ``radius_thresholds`` of ``cd`` unchanged, so
+        :meth:`transform` reproduces its radii. Transitions are
+        recounted within each entity from ``complete_cohort_df``, as
+        in :meth:`fit`, so both give the same chain for the same
+        panel. ``cd.trans_mat_prob`` is not used, it counts the pairs
+        across entity boundaries with ``within_entities=False``.
+
+        Parameters
+        ----------
+        cd : CaterpillarDiagram
+            Diagram after
+            :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`
+            with pooled thresholds
+        n_sim_iter : int
+            Number of iterations for the stationary matrix
+
+        Returns
+        -------
+        model : CaterpillarModel
+        """
+        for diff in ["d11", "d12"]:
+            if isinstance(cd.radius_thresholds[diff], pd.DataFrame):
+                raise ValueError("Pooled radius thresholds are required")
+        return cls._from_cohorts(cd.complete_cohort_df, cd.radius_thresholds, n_sim_iter)
+
+    @classmethod
+    def _from_cohorts(cls, cohort_df, thresholds, n_sim_iter):
+        """Model with the chain of the transitions within each entity"""
+        _, from_code, to_code = transition_codes(cohort_df)
+        counts = np.bincount(from_code * 7 + to_code, minlength=49).reshape(7, 7)
+        prob = transition_probabilities(counts)
+        metadata = {
+            "n_entities": (
+                int(cohort_df["data_index"].nunique())
+                if "data_index" in cohort_df
+                else 1
+            ),
+            "n_cohorts": len(cohort_df),
+            "n_sim_iter": n_sim_iter,
+            "transition_counts": counts.tolist(),
+        }
+        return cls(thresholds, prob, stationary_power(prob, n_sim_iter), metadata)
+
+    def transform(self, data):
+        """Cohort details of a new panel under the learned thresholds.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame, Pandas Series or RaggedPanel
+            New panel
+
+        Returns
+        -------
+        cohort_df : Pandas DataFrame
+            Same columns as ``CaterpillarDiagram.complete_cohort_df``
+            after :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`
+        """
+        cohort_df = cohorts_of(data)
+        for diff in ["d11", "d12"]:
+            radius = assign_radius(
+                cohort_df[diff].abs().to_numpy(), self.thresholds[diff]
+            )
+            if np.isfinite(radius).all():
+                radius = radius.astype(np.int64)
+            cohort_df[f"{diff}_radius"] = radius
+        cohort_df["final_cohort_radius"] = (
+            cohort_df["d11_radius"].to_numpy(dtype=np.float64)
+            + cohort_df["d12_radius"].to_numpy(dtype=np.float64)
+        ) / 2
+        return cohort_df
+
+    def score(self, data, k=None, window=10, metric="kl"):
+        """Surprise of the latest transition of every entity of a new panel.
+
+        See :func:`caterpillard.scoring.surprise_scores`, evaluated
+        with the learned transition probabilities and stationary
+        matrix.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame, Pandas Series, RaggedPanel or cohorts
+            New panel, or cohort details returned by
+            :meth:`transform`
+        k : int
+            Return only the ``k`` most surprising entities
+        window : int
+            Number of last cohorts compared with the stationary
+            distribution
+        metric : str
+            ``kl`` or ``js`` divergence
+
+        Returns
+        -------
+        scores : Pandas DataFrame
+        """
+        if isinstance(data, pd.DataFrame) and "n_color" in data:
+            cohort_df = data
+        else:
+            cohort_df = cohorts_of(data)
+        scores = surprise_scores(
+            cohort_df,
+            self.trans_mat_prob,
+            stationary=self.stationary_mat,
+            window=window,
+            metric=metric,
+        )
+        return scores if k is None else top_k(scores, k)
+
+    def to_dict(self):
+        """JSON serializable content of the artifact"""
+        return {
+            "format": FORMAT,
+            "version": VERSION,
+            "colors": COLORS,
+            "thresholds": self.thresholds,
+            "trans_mat_prob": self.trans_mat_prob.to_numpy().tolist(),
+            "stationary": self.stationary_mat.to_numpy().tolist(),
+            "metadata": self.metadata,
+        }
+
+    @classmethod
+    def from_dict(cls, content):
+        """Model of an artifact read by :meth:`to_dict`
+
+        Raises
+        ------
+        ValueError
+            When the content is not a model artifact of a supported
+            version
+        """
+        if content.get("format") != FORMAT:
+            raise ValueError("Not a caterpillard model artifact")
+        if content.get("version") != VERSION:
+            raise ValueError(
+                f"Unsupported model version {content.get('version')}, "
+                f"expected {VERSION}"
+            )
+        if content.get("colors") != COLORS:
+            raise ValueError("The artifact uses a different color schema")
+        return cls(
+            content["thresholds"],
+            content["trans_mat_prob"],
+            content["stationary"],
+            content.get("metadata"),
+        )
+
+    def save(self, path):
+        """Write the artifact atomically as JSON"""
+        tmp = Path(f"{path}.tmp")
+        tmp.write_text(json.dumps(self.to_dict()))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an artifact written by :meth:`save`"""
+        return cls.from_dict(json.loads(Path(path).read_text()))
@@ -0,0 +1,341 @@
+import logging
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pandas.api.types as ptypes
+
+from caterpillard.caterpillar import CaterpillarDiagram
+from caterpillard.kernels import (
+    assign_radius,
+    classify,
+    color_names,
+    difference_of_differences,
+    level_names,
+    radius_thresholds,
+)
+from caterpillard.markov import COLORS, stationary_power, transition_probabilities
+
+
+class MultiMetricDiagram:
+    """Caterpillar Diagrams of several metrics of the same entities.
+
+    The input is a 3-D panel, entity by metric by period, given as a
+    DataFrame with one row per entity and a two level column
+    MultiIndex ``(metric, period)``. It is validated and converted
+    once to an array of shape ``(entities, metrics, periods)`` and
+    every stage then runs over all metrics at once with broadcast
+    NumPy operations, producing one cohort table and one transition
+    matrix per metric.
+
+    Transitions are counted between consecutive cohorts of the same
+    entity. :meth:`joint_transitions` additionally counts the chain
+    whose state is the combination of the colors of all metrics.
+    """
+
+    def __init__(self, data, output_path=None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        data : Pandas DataFrame
+            Wide format input with a ``(metric, period)`` column
+            MultiIndex and one row per entity
+        output_path : str
+            User-defined path for output data, a
+            ``caterpillard_output`` directory in the current working
+            directory by default
+        """
+        self.logger = logging.getLogger(__name__)
+
+        if not isinstance(data, pd.DataFrame) or data.columns.nlevels != 2:
+            raise TypeError(
+                "Input parameter 'data' should be a Pandas DataFrame with "
+                "(metric, period) MultiIndex columns"
+            )
+        try:
+            assert all(ptypes.is_numeric_dtype(dtype) for dtype in data.dtypes)
+        except AssertionError:
+            sys.exit("Input data values are non-numeric")
+
+        self.metrics = data.columns.get_level_values(0).unique()
+        self.periods = data.columns.get_level_values(1).unique()
+        try:
+            assert len(self.periods) >= 3, "Inappropriate number of periods"
+        except AssertionError as e:
+            sys.exit(e)
+
+        self.data = data
+        self.entities = data.index
+        columns = pd.MultiIndex.from_product([self.metrics, self.periods])
+        # periods missing for a metric are filled with zero, as NAs are
+        self.values = (
+            data.reindex(columns=columns)
+            .fillna(value=0)
+            .to_numpy(dtype=np.float64)
+            .reshape(len(data), len(self.metrics), len(self.periods))
+        )
+        self.logger.info(
+            f"Panel of {len(self.entities)} entities, {len(self.metrics)} metrics "
+            f"and {len(self.periods)} periods"
+        )
+
+        if output_path is None:
+            output_path = Path.cwd() / "caterpillard_output"
+        elif not isinstance(output_path, str):
+            raise TypeError("Parameter output_path must be of String")
+        try:
+            os.makedirs(output_path, exist_ok=True)
+        except OSError as e:
+            sys.exit("Not able to create directory for output path" + str(e))
+        self.output_path = output_path
+        self.n_cohorts = len(self.periods) - 2
+
+    def _write_csv(self, df, file_name, **kwargs):
+        df.to_csv(f"{self.output_path}/{file_name}", **kwargs)
+
+    def color_schema(self):
+        """
+        This method classifies the cohorts of every entity and
+        metric in one broadcast pass, see
+        :func:`caterpillard.kernels.classify`, and writes the cohort
+        table of every metric to the filesystem.
+
+        :ivar n_color: numpy.ndarray
+
+            Color number of every cohort, shape
+            ``(entities, metrics, cohorts)``
+
+        :ivar cohort_dfs: dictionary
+
+            Cohort details of every metric, with the same columns as
+            ``CaterpillarDiagram.complete_cohort_df``
+        """
+        self.logger.debug("Generating Schema for every metric")
+        self.d11, self.d12, self.d2 = difference_of_differences(self.values)
+        self.n_color = classify(self.d11, self.d12, self.d2)
+        try:
+            assert (self.n_color > 0).all(), "Fatal:\tSign combination Not Captured\n"
+        except AssertionError as e:
+            sys.exit(e)
+
+        n_entities, _, n_cohorts = self.n_color.shape
+        labels = np.array([f"Cohort{i + 1}" for i in range(n_cohorts)], dtype=object)
+        self.cohort_dfs = {}
+        for m, metric in enumerate(self.metrics):
+            n_color = self.n_color[:, m].ravel()
+            self.cohort_dfs[metric] = pd.DataFrame(
+                {
+                    "d11": self.d11[:, m].ravel(),
+                    "d12": self.d12[:, m].ravel(),
+                    "d2": self.d2[:, m].ravel(),
+                    "data_index": np.repeat(self.entities.to_numpy(), n_cohorts),
+                    "Cohort": np.tile(labels, n_entities),
+                    "color": color_names(n_color),
+                    "level": level_names(n_color),
+                    "n_color": n_color.astype(np.int64),
+                },
+                index=np.tile(np.arange(n_cohorts), n_entities),
+            )
+            self._write_csv(
+                self.cohort_dfs[metric], f"cohort_df_{metric}.csv", index=False
+            )
+
+    def caterpillar_size(self):
+        """
+        This method assigns the radius of every cohort of every
+        metric. The box-plot thresholds of every metric are pooled
+        over all its entities, as in
+        :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`, and
+        evaluated with one ``np.quantile`` over the metric axis.
+
+        :ivar radius_thresholds: dictionary
+
+            Thresholds of :math:`d_{11}` and :math:`d_{12}` as
+            DataFrames with one row per metric
+
+        :ivar final_cohort_radius: numpy.ndarray
+
+            Radius of every cohort, shape
+            ``(entities, metrics, cohorts)``
+        """
+        try:
+            self.n_color
+        except AttributeError as e:
+            sys.exit(e)
+
+        self.logger.debug("Calculating sizes for every metric")
+        radii = {}
+        self.radius_thresholds = {}
+        for name, diff in [("d11", self.d11), ("d12", self.d12)]:
+            abs_diff = np.abs(diff)
+            # metrics first, every entity and cohort of a metric pooled
+            pooled = abs_diff.transpose(1, 0, 2).reshape(len(self.metrics), -1)
+            thresholds = radius_thresholds(pooled, axis=1)
+            radii[name] = assign_radius(
+                abs_diff,
+                {key: value[None, :, None] for key, value in thresholds.items()},
+            )
+            self.radius_thresholds[name] = pd.DataFrame(
+                thresholds, index=self.metrics
+            )
+        self.final_cohort_radius = (radii["d11"] + radii["d12"]) / 2
+
+        for m, metric in enumerate(self.metrics):
+            cohort_df = self.cohort_dfs[metric]
+            for name in ["d11", "d12"]:
+                radius = radii[name][:, m].ravel()
+                if np.isfinite(radius).all():
+                    radius = radius.astype(np.int64)
+                cohort_df.loc[:, f"{name}_radius"] = radius
+            cohort_df.loc[:, "final_cohort_radius"] = self.final_cohort_radius[
+                :, m
+            ].ravel()
+            self._write_csv(cohort_df, f"complete_cohort_details_{metric}.csv")
+
+    def schema_transitions(self):
+        """
+        This method counts the consecutive color transitions of every
+        metric in a single ``np.bincount``.
+
+        :ivar transition_counts: numpy.ndarray
+
+            Counts of shape ``(metrics, 7, 7)``
+
+        :ivar transition_mats: dictionary
+
+            Transition matrix of every metric
+        """
+        try:
+            self.n_color
+        except AttributeError as e:
+            sys.exit(e)
+
+        code = self.n_color.astype(np.int64) - 1
+        metric = np.arange(len(self.metrics))[None, :, None]
+        flat = metric * 49 + code[..., :-1] * 7 + code[..., 1:]
+        self.transition_counts = np.bincount(
+            flat.ravel(), minlength=len(self.metrics) * 49
+        ).reshape(-1, 7, 7)
+        self.transition_mats = {
+            metric: pd.DataFrame(counts, index=COLORS, columns=COLORS)
+            for metric, counts in zip(self.metrics, self.transition_counts)
+        }
+        for metric, mat in self.transition_mats.items():
+            self.logger.info(f"Transition matrix of {metric}:\n{mat}")
+
+    def stationary_matrix(self, n_sim_iter=10 ** 4):
+        """
+        This method evaluates the stationary matrix of every metric
+        in one batched matrix power.
+
+        :ivar stationary_mats: dictionary
+
+            Stationary matrix of every metric
+
+        Parameters
+        ----------
+        n_sim_iter : int
+            Number of iterations for finding the stationary matrix
+        """
+        try:
+            self.transition_counts
+        except AttributeError as e:
+            sys.exit(e)
+
+        stationary = stationary_power(
+            transition_probabilities(self.transition_counts), n_sim_iter
+        )
+        self.stationary_mats = {
+            metric: pd.DataFrame(mat, index=COLORS, columns=COLORS)
+            for metric, mat in zip(self.metrics, stationary)
+        }
+        return self.stationary_mats
+
+    def joint_transitions(self):
+        """
+        This method counts the transitions of the joint chain, whose
+        state is the combination of the colors of every metric. Only
+        the observed joint states are numbered and only the observed
+        transitions are stored, so the ``7 ** metrics`` by
+        ``7 ** metrics`` matrix is never built and the pair codes fit
+        in int64 for any number of metrics.
+
+        :ivar joint_transition_df: Pandas DataFrame
+
+            One row per observed transition with the ``from_state``
+            and ``to_state`` (colors joined by ``|`` in the order of
+            the metrics), its ``count`` and its ``probability`` given
+            the ``from_state``
+
+        Returns
+        -------
+        joint_transition_df : Pandas DataFrame
+        """
+        try:
+            self.n_color
+        except AttributeError as e:
+            sys.exit(e)
+
+        n_entities, n_metrics, n_cohorts = self.n_color.shape
+        # colors of every metric per entity and cohort, numbered by
+        # the sorted observed joint states (the order of the base-7
+        # codes), so the pair codes stay below n_states ** 2 instead
+        # of 7 ** (2 * metrics), which overflows above 11 metrics
+        code = self.n_color.transpose(0, 2, 1).reshape(-1, n_metrics) - 1
+        states, state = np.unique(code, axis=0, return_inverse=True)
+        state = state.astype(np.int64).reshape(n_entities, n_cohorts)
+        n_states = len(states)
+        pairs, counts = np.unique(
+            (state[:, :-1] * n_states + state[:, 1:]).ravel(), return_counts=True
+        )
+        from_state, to_state = pairs // n_states, pairs % n_states
+        from_total = pd.Series(counts).groupby(from_state).transform("sum")
+        labels = np.array(
+            ["|".join(colors) for colors in np.asarray(COLORS, dtype=object)[states]],
+            dtype=object,
+        )
+
+        self.joint_transition_df = pd.DataFrame(
+            {
+                "from_state": labels[from_state],
+                "to_state": labels[to_state],
+                "count": counts,
+                "probability": counts / from_total.to_numpy(),
+            }
+        )
+        self.logger.info(
+            f"{len(self.joint_transition_df)} joint transitions observed "
+            f"over {n_metrics} metrics"
+        )
+        return self.joint_transition_df
+
+    def diagram(self, metric):
+        """
+        This method gives a
+        :class:`caterpillar.CaterpillarDiagram` of one metric that
+        shares the computed cohorts, for instance to draw it with
+        :meth:`caterpillar.CaterpillarDiagram.generate`.
+
+        Parameters
+        ----------
+        metric : str
+            Name of the metric
+
+        Returns
+        -------
+        CaterpillarDiagram
+        """
+        try:
+            cohort_df = self.cohort_dfs[metric]
+        except (AttributeError, KeyError) as e:
+            sys.exit(e)
+
+        cd = CaterpillarDiagram(
+            self.data[metric], relative=True, output_path=str(self.output_path)
+        )
+        cd.n_cohorts = self.n_cohorts
+        cd.complete_cohort_df = cohort_df
+        return cd
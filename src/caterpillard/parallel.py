@@ -0,0 +1,106 @@
+import os
+import logging
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_workers(n_workers):
+    """Resolve the number of worker processes to use.
+
+    Parameters
+    ----------
+    n_workers : int or None
+        Requested number of workers. ``None`` or a non-positive
+        value selects every available CPU.
+
+    Returns
+    -------
+    n_workers : int
+    """
+    if n_workers is None or n_workers <= 0:
+        return os.cpu_count() or 1
+    return int(n_workers)
+
+
+def chunk_sizes(total, chunk_size):
+    """Split ``total`` items into consecutive chunks.
+
+    Parameters
+    ----------
+    total : int
+        Number of items to split
+    chunk_size : int
+        Maximum number of items in each chunk
+
+    Returns
+    -------
+    sizes : list of int
+        Size of every chunk, in order. The last chunk holds
+        the remainder.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive integer")
+    n_full, remainder = divmod(int(total), int(chunk_size))
+    sizes = [int(chunk_size)] * n_full
+    if remainder:
+        sizes.append(remainder)
+    return sizes
+
+
+def spawn_seeds(seed, n_chunks):
+    """Derive one independent seed sequence per chunk.
+
+    The children are derived from ``seed`` alone, so chunk ``i``
+    always receives the same random stream no matter which worker
+    process ends up executing it.
+
+    Parameters
+    ----------
+    seed : int, None or numpy.random.SeedSequence
+        Root seed of the computation
+    n_chunks : int
+        Number of chunks
+
+    Returns
+    -------
+    seeds : list of numpy.random.SeedSequence
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        root = seed
+    else:
+        root = np.random.SeedSequence(seed)
+    return root.spawn(n_chunks)
+
+
+def map_chunks(func, tasks, n_workers=1):
+    """Run ``func`` over a list of argument tuples.
+
+    With a single worker (or a single task) the tasks run in the
+    current process, otherwise they are distributed across a
+    :class:`concurrent.futures.ProcessPoolExecutor`. Results are
+    always returned in task order.
+
+    Parameters
+    ----------
+    func : callable
+        Module-level (picklable) function
+    tasks : list of tuple
+        Positional arguments for every call
+    n_workers : int or None
+        Number of worker processes, see :func:`resolve_workers`
+
+    Returns
+    -------
+    results : list
+    """
+    n_workers = min(resolve_workers(n_workers), len(tasks))
+    if n_workers <= 1:
+        return [func(*task) for task in tasks]
+
+    logger.debug(f"Distributing {len(tasks)} chunks over {n_workers} workers")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(func, *zip(*tasks)))
@@ -0,0 +1,235 @@
+import logging
+
+from caterpillard.caterpillar import CaterpillarDiagram
+
+logger = logging.getLogger(__name__)
+
+
+class StageError(RuntimeError):
+    """Raised when a stage of the pipeline cannot be computed"""
+
+
+def _summary(cd, params):
+    cd.data_summary()
+
+
+def _cohorts(cd, params):
+    cd.color_schema()
+
+
+def _radii(cd, params):
+    # caterpillar_size adds columns in place, keep the cohorts stage intact
+    cd.complete_cohort_df = cd.complete_cohort_df.copy()
+    cd.caterpillar_size()
+
+
+def _transitions(cd, params):
+    cd.schema_transitions(
+        group_by=params["group_by"], within_entities=params["within_entities"]
+    )
+
+
+def _stationary(cd, params):
+    cd.stationary_matrix(n_sim_iter=params["n_sim_iter"])
+
+
+def _diagram(cd, params):
+    cd.generate(
+        data_index=params["data_index"], n_last_cohorts=params["n_last_cohorts"]
+    )
+
+
+# name: (dependencies, parameters, function, attributes produced)
+STAGES = {
+    "summary": ((), (), _summary, ("n_cohorts",)),
+    "cohorts": ((), (), _cohorts, ("complete_cohort_df",)),
+    "radii": (("cohorts",), (), _radii, ("complete_cohort_df",)),
+    "transitions": (
+        ("cohorts",),
+        ("group_by", "within_entities"),
+        _transitions,
+        (
+            "transition_count",
+            "transition_mat",
+            "group_keys",
+            "group_transition_counts",
+            "group_transition_mats",
+        ),
+    ),
+    "stationary": (
+        ("transitions",),
+        ("n_sim_iter",),
+        _stationary,
+        ("trans_mat_prob", "stationary_mat_final_df", "group_stationary_mats"),
+    ),
+    "diagram": (
+        ("summary", "radii"),
+        ("data_index", "n_last_cohorts"),
+        _diagram,
+        ("caterpillar_fig", "cx", "lx_s", "lx_e"),
+    ),
+}
+
+DEFAULT_PARAMS = {
+    "group_by": None,
+    "within_entities": True,
+    "n_sim_iter": 10 ** 4,
+    "data_index": None,
+    "n_last_cohorts": None,
+}
+
+
+def _same(old, new):
+    if old is new:
+        return True
+    try:
+        return bool(old == new)
+    except (TypeError, ValueError):
+        # Mappings such as a Pandas Series compare element-wise
+        return False
+
+
+class CaterpillarPipeline:
+    """Lazy, memoized view of the Caterpillar Diagram pipeline.
+
+    The stages of :class:`caterpillar.CaterpillarDiagram` form a
+    dependency graph:
+
+    =============== ======================== ==========================
+    stage           depends on               parameters
+    =============== ======================== ==========================
+    ``summary``
+    ``cohorts``
+    ``radii``       ``cohorts``
+    ``transitions`` ``cohorts``              ``group_by``,
+                                             ``within_entities``
+    ``stationary``  ``transitions``          ``n_sim_iter``
+    ``diagram``     ``summary``, ``radii``   ``data_index``,
+                                             ``n_last_cohorts``
+    =============== ======================== ==========================
+
+    Requesting a stage computes only the stages it depends on and
+    memoizes every result. Changing a parameter or the input data
+    invalidates the affected stages and everything downstream of
+    them. Errors are raised as :class:`StageError` instead of
+    exiting the process.
+    """
+
+    def __init__(self, data, relative: bool, output_path=None, **params) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        data : Pandas Series or DataFrame or RaggedPanel
+            Input data, as for
+            :meth:`caterpillar.CaterpillarDiagram.__init__`
+        relative : bool
+            Relative or individual analysis
+        output_path : str
+            User-defined path for output data
+        params : dict
+            Initial values of ``group_by``, ``within_entities``,
+            ``n_sim_iter``, ``data_index`` and ``n_last_cohorts``
+        """
+        self.output_path = output_path
+        self.params = dict(DEFAULT_PARAMS)
+        self._values = {}
+        self.set_data(data, relative)
+        self.set_params(**params)
+
+    def _run(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except SystemExit as e:
+            raise StageError(str(e)) from None
+
+    def set_data(self, data, relative=None):
+        """Replace the input data and invalidate every stage"""
+        if relative is None:
+            relative = self.relative
+        self._diagram = self._run(
+            CaterpillarDiagram, data, relative=relative, output_path=self.output_path
+        )
+        self.relative = relative
+        self._values.clear()
+
+    def set_params(self, **params):
+        """Update parameters and invalidate the stages that use them"""
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown pipeline parameters: {sorted(unknown)}")
+        for name, value in params.items():
+            if _same(self.params[name], value):
+                continue
+            self.params[name] = value
+            for stage, (_, stage_params, _, _) in STAGES.items():
+                if name in stage_params:
+                    self.invalidate(stage)
+
+    def invalidate(self, stage):
+        """Drop a memoized stage and every stage depending on it"""
+        self._values.pop(stage, None)
+        for other, (deps, _, _, _) in STAGES.items():
+            if stage in deps and other in self._values:
+                self.invalidate(other)
+
+    @property
+    def computed(self):
+        """Names of the stages currently memoized"""
+        return list(self._values)
+
+    def get(self, stage):
+        """Compute (or fetch) a stage and return its outputs.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+
+        Returns
+        -------
+        outputs : dictionary
+            Attributes of :class:`caterpillar.CaterpillarDiagram`
+            produced by the stage
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}', choose from {list(STAGES)}")
+        if stage in self._values:
+            return self._values[stage]
+
+        deps, _, func, produces = STAGES[stage]
+        for dep in deps:
+            self.get(dep)
+
+        cd = self._diagram
+        for dep in deps:
+            for attr, value in self._values[dep].items():
+                setattr(cd, attr, value)
+
+        logger.debug(f"Computing stage {stage}")
+        self._run(func, cd, self.params)
+        self._values[stage] = {attr: getattr(cd, attr, None) for attr in produces}
+        return self._values[stage]
+
+    def __getitem__(self, stage):
+        return self.get(stage)
+
+    @property
+    def cohort_details(self):
+        """Cohort details with colors and radii"""
+        return self.get("radii")["complete_cohort_df"]
+
+    @property
+    def transition_matrix(self):
+        """Transition counts"""
+        return self.get("transitions")["transition_mat"]
+
+    @property
+    def stationary_matrix(self):
+        """Stationary matrix"""
+        return self.get("stationary")["stationary_mat_final_df"]
+
+    def diagram(self, data_index=None, n_last_cohorts=None):
+        """Caterpillar figure for the chosen entity and number of cohorts"""
+        self.set_params(data_index=data_index, n_last_cohorts=n_last_cohorts)
+        return self.get("diagram")["caterpillar_fig"]
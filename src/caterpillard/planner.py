@@ -0,0 +1,517 @@
+import logging
+import math
+import os
+import pickle
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import transition_codes
+from caterpillard.kernels import assign_radius, radius_thresholds
+from caterpillard.model import cohorts_of
+from caterpillard.parallel import chunk_sizes, map_chunks, resolve_workers
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["cohorts", "radii", "transitions", "render"]
+# Compute dtypes in order of preference
+COMPUTE_DTYPES = ["float64", "float32"]
+RENDER_MODES = ["figure", "tiles"]
+# Largest width or height, in pixels, of an Agg canvas
+AGG_MAX_PIXELS = 2 ** 16
+# Bytes held per pixel while a figure is drawn and saved: the RGBA
+# buffer of the canvas and the converted copy written by savefig
+BYTES_PER_PIXEL = 8
+# Area of a figure per cohort in square inches, see
+# caterpillard.render.figure_size
+_INCHES_PER_COHORT = (7 / 5, 9)
+_TILE_COHORTS = 25
+
+# Calibration of the running process, measured once
+_calibration = None
+
+
+def available_memory():
+    """Memory available to the process, in bytes.
+
+    The smallest of the available system memory and of the room
+    left under the memory limit of the cgroup (container) of the
+    process, ``None`` when neither can be read.
+    """
+    limits = []
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    limits.append(int(line.split()[1]) * 1024)
+    except OSError:
+        pass
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit != "max":
+            used = int(Path("/sys/fs/cgroup/memory.current").read_text())
+            limits.append(int(limit) - used)
+    except (OSError, ValueError):
+        pass
+    if not limits:
+        try:
+            limits.append(os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+        except (AttributeError, OSError, ValueError):
+            return None
+    return max(0, min(limits))
+
+
+def available_cpus():
+    """Number of CPUs the process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return resolve_workers(None)
+
+
+def _best_of(func, repeats=3):
+    """Smallest wall time of ``repeats`` calls of ``func``"""
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_of(func):
+    """Peak memory, in bytes, allocated by a call of ``func``"""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    if not tracing:
+        tracemalloc.stop()
+    return max(0, peak)
+
+
+def _radii(cohort_df):
+    # pooled radii, as in CaterpillarDiagram.caterpillar_size
+    radii = [
+        assign_radius(abs_diff, radius_thresholds(abs_diff))
+        for abs_diff in (cohort_df[diff].abs().to_numpy() for diff in ["d11", "d12"])
+    ]
+    return (radii[0] + radii[1]) / 2
+
+
+def _transitions(cohort_df):
+    _, from_code, to_code = transition_codes(cohort_df)
+    return np.bincount(from_code * 7 + to_code, minlength=49)
+
+
+def _noop():
+    return None
+
+
+def calibrate(n_rows=2048, n_periods=34, seed=0, refresh=False):
+    """Per-cohort costs of every stage, measured on a synthetic panel.
+
+    The vectorized stages are timed (best of three runs) and their
+    peak memory traced with ``tracemalloc`` on a random walk panel of
+    ``n_rows`` entities, once per compute dtype, as well as the
+    pickling of a chunk and of its cohorts. Rendering is timed
+    per megapixel on a small diagram when matplotlib is installed,
+    and the start of a process pool is timed once.
+
+    The result is kept for the process, later calls return it unless
+    ``refresh`` is true.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of entities of the benchmark panel
+    n_periods : int
+        Number of periods of the benchmark panel
+    seed : int
+        Seed of the benchmark panel
+    refresh : bool
+        Measure again
+
+    Returns
+    -------
+    calibration : dictionary
+        ``seconds`` and ``bytes`` per cohort of every stage for every
+        compute dtype, ``table_bytes`` per cohort of the cohort
+        table, ``transfer_seconds`` per cohort sent to and back from
+        a worker, ``render_seconds_per_megapixel`` (``None`` without
+        matplotlib) and ``worker_startup_seconds``
+    """
+    global _calibration
+    if _calibration is not None and not refresh:
+        return _calibration
+
+    rng = np.random.default_rng(seed)
+    panel = pd.DataFrame(
+        rng.normal(size=(n_rows, n_periods)).cumsum(axis=1).round(2),
+        columns=[str(period) for period in range(n_periods)],
+    )
+    n_cohorts = n_rows * (n_periods - 2)
+    calibration = {}
+    for dtype in COMPUTE_DTYPES:
+        cohort_df = cohorts_of(panel, dtype=dtype)
+        stages = {
+            "cohorts": lambda: cohorts_of(panel, dtype=dtype),
+            "radii": lambda: _radii(cohort_df),
+            "transitions": lambda: _transitions(cohort_df),
+        }
+        calibration[dtype] = {
+            stage: {
+                "seconds": _best_of(func) / n_cohorts,
+                "bytes": _peak_of(func) / n_cohorts,
+            }
+            for stage, func in stages.items()
+        }
+        calibration[dtype]["table_bytes"] = (
+            cohort_df.memory_usage(deep=True).sum() / n_cohorts
+        )
+        # a chunk goes to a worker and its cohorts come back pickled
+        calibration[dtype]["transfer_seconds"] = (
+            _best_of(lambda: pickle.loads(pickle.dumps((panel, cohort_df), -1)))
+            / n_cohorts
+        )
+
+    try:
+        from caterpillard.geometry import caterpillar_geometry
+        from caterpillard.render import figure_size, render_bytes
+    except ImportError:
+        calibration["render_seconds_per_megapixel"] = None
+    else:
+        n, dpi = 10, 40
+        geometry = caterpillar_geometry(
+            rng.integers(1, 5, size=n) / 2, ["red", "green"] * (n // 2)
+        )
+        width, height = figure_size(n)
+        megapixels = width * height * dpi ** 2 / 10 ** 6
+        seconds = _best_of(lambda: render_bytes(geometry, format="png", dpi=dpi))
+        calibration["render_seconds_per_megapixel"] = seconds / megapixels
+
+    calibration["worker_startup_seconds"] = _best_of(
+        lambda: map_chunks(_noop, [(), ()], n_workers=2), repeats=1
+    )
+    logger.info(f"Calibration: {calibration}")
+    _calibration = calibration
+    return calibration
+
+
+class ResourcePlan:
+    """Execution settings of a run and the estimates they rest on.
+
+    :attr:`settings` holds the chosen ``chunk_size`` (entities per
+    chunk of the cohort stage), ``dtype`` (compute dtype),
+    ``n_workers``, ``render_mode`` (``figure`` or ``tiles``),
+    ``cohorts_per_tile`` and ``dpi``. :attr:`estimates` holds the
+    estimated peak memory and runtime of every stage, :attr:`inputs`
+    the shape, memory and CPUs the plan was made for and
+    :attr:`notes` the reasons behind the choices.
+    """
+
+    def __init__(self, inputs, settings, estimates, notes=None) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        inputs : dictionary
+            Description of the input and of the resources
+        settings : dictionary
+            Chosen execution settings
+        estimates : Pandas DataFrame
+            ``peak_memory_bytes`` and ``seconds`` of every stage
+        notes : list of str
+            Reasons behind the choices
+        """
+        self.inputs = dict(inputs)
+        self.settings = dict(settings)
+        self.estimates = estimates
+        self.notes = list(notes or [])
+
+    @property
+    def peak_memory_bytes(self):
+        """Estimated peak memory of the whole run"""
+        return int(self.estimates["peak_memory_bytes"].max())
+
+    @property
+    def seconds(self):
+        """Estimated runtime of the whole run"""
+        return float(self.estimates["seconds"].sum())
+
+    @property
+    def fits(self):
+        """Whether the estimated peak memory fits in the budget"""
+        return self.peak_memory_bytes <= self.inputs["memory_budget"]
+
+    def to_dict(self):
+        """JSON serializable content of the plan"""
+        return {
+            "inputs": self.inputs,
+            "settings": self.settings,
+            "estimates": {
+                stage: {key: float(value) for key, value in row.items()}
+                for stage, row in self.estimates.to_dict(orient="index").items()
+            },
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "seconds": self.seconds,
+            "fits": self.fits,
+            "notes": self.notes,
+        }
+
+
+def _pixels(n_cohorts, dpi):
+    """Width and height, in pixels, of a figure of ``n_cohorts`` circles"""
+    return (
+        n_cohorts * _INCHES_PER_COHORT[0] * dpi,
+        _INCHES_PER_COHORT[1] * dpi,
+    )
+
+
+def _cohort_stage(n_rows, n_cohorts, costs, n_workers, chunk_size, baseline):
+    """Peak memory of the cohort stage with ``n_workers`` chunks in flight"""
+    # the chunk results and their concatenation are held at the end
+    in_flight = min(n_workers, math.ceil(n_rows / chunk_size))
+    return (
+        baseline
+        + 2 * n_rows * n_cohorts * costs["table_bytes"]
+        + in_flight * chunk_size * n_cohorts * costs["cohorts"]["bytes"]
+    )
+
+
+def plan_resources(
+    shape,
+    dtype="float64",
+    nan_ratio=0.0,
+    memory=None,
+    n_cpus=None,
+    calibration=None,
+    memory_fraction=0.75,
+    render_cohorts=None,
+    dpi=400,
+):
+    """Choose the execution settings of a run.
+
+    The peak memory and runtime of every stage are estimated from the
+    per-cohort costs of :func:`calibrate`. The settings are then
+    chosen in order:
+
+    * ``n_workers`` balances the calibrated cohort runtime against
+      the start of the process pool
+    * ``dtype`` is ``float64`` unless only ``float32`` differences
+      fit in the budget. Signs of differences that vanish in
+      ``float32`` may then change, the choice is reported in
+      :attr:`ResourcePlan.notes`.
+    * ``chunk_size`` is the largest number of entities per chunk
+      whose temporaries, for every worker, fit in what is left of the
+      budget
+    * ``render_mode`` is ``figure`` when one figure of
+      ``render_cohorts`` circles fits in the budget and in the Agg
+      canvas limits, ``tiles`` otherwise
+
+    Parameters
+    ----------
+    shape : tuple
+        Number of entities and number of periods of the panel
+    dtype : numpy dtype
+        Dtype of the input values
+    nan_ratio : float
+        Share of missing input values
+    memory : int
+        Bytes available, see :func:`available_memory` by default
+    n_cpus : int
+        CPUs available, see :func:`available_cpus` by default
+    calibration : dictionary
+        Per-cohort costs, see :func:`calibrate` by default
+    memory_fraction : float
+        Share of ``memory`` the run may use
+    render_cohorts : int
+        Number of cohorts of the rendered diagram, all the cohorts
+        of an entity by default
+    dpi : int
+        Resolution of the rendered diagram
+
+    Returns
+    -------
+    plan : ResourcePlan
+    """
+    n_rows, n_periods = int(shape[0]), int(shape[1])
+    if n_rows < 1 or n_periods < 3:
+        raise ValueError("shape should hold at least one entity and 3 periods")
+    if not 0 <= nan_ratio <= 1:
+        raise ValueError("nan_ratio should be between 0 and 1")
+    if memory is None:
+        memory = available_memory()
+        if memory is None:
+            raise ValueError("Available memory is unknown, pass memory")
+    n_cpus = available_cpus() if n_cpus is None else int(n_cpus)
+    calibration = calibrate() if calibration is None else calibration
+    budget = int(memory * memory_fraction)
+    n_cohorts = n_periods - 2
+    total = n_rows * n_cohorts
+    input_bytes = n_rows * n_periods * np.dtype(dtype).itemsize
+    render_cohorts = n_cohorts if render_cohorts is None else int(render_cohorts)
+    notes = []
+
+    # workers: serial / w + startup * w is smallest at sqrt(serial / startup),
+    # unless sending the chunks and their cohorts outweighs the gain
+    serial = total * calibration["float64"]["cohorts"]["seconds"]
+    transfer = total * calibration["float64"]["transfer_seconds"]
+    startup = max(calibration["worker_startup_seconds"], 1e-3)
+    n_workers = int(max(1, min(n_cpus, n_rows, round(math.sqrt(serial / startup)))))
+    if serial / n_workers + transfer + startup * n_workers >= serial:
+        n_workers = 1
+        notes.append("single worker, a pool would not pay for its start and transfers")
+
+    # dtype and chunk size
+    for compute_dtype in COMPUTE_DTYPES:
+        costs = calibration[compute_dtype]
+        per_row = n_cohorts * costs["cohorts"]["bytes"]
+        fixed = _cohort_stage(n_rows, n_cohorts, costs, 0, 1, input_bytes)
+        room = budget - fixed
+        chunk_size = int(
+            min(math.ceil(n_rows / n_workers), room // (per_row * n_workers))
+        )
+        if chunk_size >= 1:
+            break
+        notes.append(f"{compute_dtype} cohorts do not fit in the memory budget")
+    else:
+        # the cohort table alone exceeds the budget, leave a quarter of the
+        # budget to the temporaries of the chunks
+        chunk_size = int(
+            max(
+                1,
+                min(math.ceil(n_rows / n_workers), budget // (4 * per_row * n_workers)),
+            )
+        )
+        notes.append("no setting fits in the memory budget")
+    if compute_dtype == "float32":
+        notes.append("float32 differences, signs of tiny differences may change")
+    costs = calibration[compute_dtype]
+    table_bytes = total * costs["table_bytes"]
+    baseline = input_bytes + table_bytes
+
+    # rendering
+    width, height = _pixels(render_cohorts, dpi)
+    figure_bytes = width * height * BYTES_PER_PIXEL
+    if baseline + figure_bytes <= budget and max(width, height) <= AGG_MAX_PIXELS:
+        render_mode, cohorts_per_tile, rendered = "figure", None, render_cohorts
+    else:
+        per_cohort = figure_bytes / max(render_cohorts, 1)
+        cohorts_per_tile = int(
+            max(
+                1,
+                min(
+                    _TILE_COHORTS,
+                    render_cohorts,
+                    (budget - baseline) // per_cohort,
+                    AGG_MAX_PIXELS // _pixels(1, dpi)[0],
+                ),
+            )
+        )
+        render_mode, rendered = "tiles", cohorts_per_tile
+        notes.append(
+            f"a figure of {render_cohorts} cohorts takes "
+            f"{figure_bytes / 2 ** 20:.0f} MiB and {width:.0f} pixels, "
+            "rendered as tiles"
+        )
+    seconds_per_megapixel = calibration.get("render_seconds_per_megapixel")
+    if seconds_per_megapixel is None:
+        render_seconds = np.nan
+        notes.append("matplotlib is not installed, rendering was not calibrated")
+    else:
+        render_seconds = width * height / 10 ** 6 * seconds_per_megapixel
+
+    cohort_seconds = total * costs["cohorts"]["seconds"]
+    estimates = pd.DataFrame(
+        {
+            "peak_memory_bytes": [
+                _cohort_stage(
+                    n_rows, n_cohorts, costs, n_workers, chunk_size, input_bytes
+                ),
+                baseline + total * costs["radii"]["bytes"],
+                baseline + total * costs["transitions"]["bytes"],
+                baseline + figure_bytes / max(render_cohorts, 1) * rendered,
+            ],
+            "seconds": [
+                cohort_seconds / n_workers
+                + (startup * n_workers if n_workers > 1 else 0),
+                total * costs["radii"]["seconds"],
+                total * costs["transitions"]["seconds"],
+                render_seconds,
+            ],
+        },
+        index=pd.Index(STAGES, name="stage"),
+    )
+    if nan_ratio > 0.5:
+        notes.append(
+            "more than half of the values are missing and taken as zero, "
+            "a RaggedPanel keeps only the observed periods"
+        )
+
+    plan = ResourcePlan(
+        inputs={
+            "n_rows": n_rows,
+            "n_periods": n_periods,
+            "dtype": str(np.dtype(dtype)),
+            "nan_ratio": float(nan_ratio),
+            "memory": int(memory),
+            "memory_budget": budget,
+            "n_cpus": n_cpus,
+            "render_cohorts": render_cohorts,
+        },
+        settings={
+            "chunk_size": chunk_size,
+            "dtype": compute_dtype,
+            "n_workers": n_workers,
+            "render_mode": render_mode,
+            "cohorts_per_tile": cohorts_per_tile,
+            "dpi": dpi,
+        },
+        estimates=estimates,
+        notes=notes,
+    )
+    logger.info(f"Resource plan: {plan.settings}")
+    return plan
+
+
+def _chunk_cohorts(frame, dtype, first_cohort):
+    return cohorts_of(frame, dtype=dtype, first_cohort=first_cohort)
+
+
+def planned_cohorts(data, chunk_size, dtype="float64", n_workers=1, first_cohort=0):
+    """Cohort details of a wide panel, computed in chunks of entities.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame or Pandas Series
+        Wide format panel, see :func:`caterpillard.model.cohorts_of`
+    chunk_size : int
+        Number of entities per chunk
+    dtype : numpy dtype
+        Compute dtype
+    n_workers : int or None
+        Number of worker processes, see
+        :func:`caterpillard.parallel.map_chunks`
+    first_cohort : int
+        Number of cohorts before the first period of ``data``
+
+    Returns
+    -------
+    cohort_df : Pandas DataFrame
+    """
+    if isinstance(data, pd.Series):
+        return cohorts_of(data, dtype=dtype, first_cohort=first_cohort)
+    bounds = np.cumsum([0] + chunk_sizes(len(data), chunk_size))
+    tasks = [
+        (data.iloc[start:stop], dtype, first_cohort)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+    logger.debug(f"Cohorts of {len(data)} entities in {len(tasks)} chunks")
+    return pd.concat(map_chunks(_chunk_cohorts, tasks, n_workers=n_workers))
@@ -0,0 +1,228 @@
+import contextlib
+import functools
+import inspect
+import logging
+import os
+import time
+import tracemalloc
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Returned by CaterpillarDiagram._stage when profiling is disabled
+NULL_STAGE = contextlib.nullcontext()
+
+# summary key, metric name, type and help text of every exported
+# metric, counters end in _total as Prometheus expects
+_METRICS = [
+    ("calls", "calls_total", "counter", "Number of times each stage ran"),
+    ("wall_seconds", "wall_seconds_total", "counter", "Wall time spent in each stage"),
+    (
+        "cpu_seconds",
+        "cpu_seconds_total",
+        "counter",
+        "CPU time of the process spent in each stage",
+    ),
+    (
+        "peak_memory_bytes",
+        "peak_memory_bytes",
+        "gauge",
+        "Largest peak memory increase of each stage",
+    ),
+    ("rows", "rows_total", "counter", "Rows processed by each stage"),
+]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Profiler:
+    """Per-stage instrumentation of a Caterpillar Diagram run.
+
+    Every stage records its wall time, the CPU time of the process,
+    the increase of peak (Python traced) memory over the memory in use
+    when the stage started and the number of rows processed. Stages
+    can be nested, the peak memory of a stage includes the stages run
+    inside it.
+
+    Records are available as :attr:`records`, aggregated by
+    :meth:`summary` or exported in the Prometheus text format by
+    :meth:`to_prometheus`. ``on_start`` is called with the stage name
+    and ``on_end`` with the record of every stage as it completes.
+    """
+
+    def __init__(self, on_start=None, on_end=None, memory=True) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        on_start : callable
+            Called with the name of every stage when it starts
+        on_end : callable
+            Called with the record of every stage when it ends
+        memory : bool
+            Trace memory allocations with ``tracemalloc``, which
+            slows down allocation-heavy stages
+        """
+        self.on_start = on_start
+        self.on_end = on_end
+        self.memory = memory
+        self.records = []
+        self._frames = []
+        self._started_tracing = False
+
+    def _enter_memory(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        if self._frames:
+            # keep the peak reached so far by the enclosing stage
+            self._frames[-1]["peak"] = max(self._frames[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        self._frames.append({"start": current, "peak": current})
+
+    def _exit_memory(self):
+        frame = self._frames.pop()
+        peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+        if self._frames:
+            self._frames[-1]["peak"] = max(self._frames[-1]["peak"], peak)
+        elif self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return peak - frame["start"]
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """Record the stage run inside the ``with`` block.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage
+        rows : int
+            Rows processed, can also be set on the yielded record
+
+        Yields
+        ------
+        record : dictionary
+        """
+        record = {"stage": name, "rows": rows, "status": "ok"}
+        if self.on_start is not None:
+            self.on_start(name)
+        if self.memory:
+            self._enter_memory()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        except BaseException as e:
+            record["status"] = f"error: {type(e).__name__}"
+            raise
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall
+            record["cpu_seconds"] = time.process_time() - cpu
+            record["peak_memory_bytes"] = self._exit_memory() if self.memory else None
+            self.records.append(record)
+            logger.debug(f"Stage {name}: {record['wall_seconds']:.6f}s")
+            if self.on_end is not None:
+                self.on_end(record)
+
+    def summary(self):
+        """Records aggregated by stage name.
+
+        Returns
+        -------
+        summary : dictionary
+            ``calls``, total ``wall_seconds``, ``cpu_seconds`` and
+            ``rows``, and the largest ``peak_memory_bytes`` of every
+            stage, in order of first run
+        """
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(
+                record["stage"],
+                {
+                    "calls": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "peak_memory_bytes": None,
+                    "rows": None,
+                },
+            )
+            entry["calls"] += 1
+            entry["wall_seconds"] += record["wall_seconds"]
+            entry["cpu_seconds"] += record["cpu_seconds"]
+            if record["peak_memory_bytes"] is not None:
+                entry["peak_memory_bytes"] = max(
+                    entry["peak_memory_bytes"] or 0, record["peak_memory_bytes"]
+                )
+            if record["rows"] is not None:
+                entry["rows"] = (entry["rows"] or 0) + record["rows"]
+        return summary
+
+    def to_prometheus(self, prefix="caterpillard_stage"):
+        """Summary in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = []
+        for metric, suffix, kind, help_text in _METRICS:
+            name = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, entry in summary.items():
+                if entry[metric] is not None:
+                    lines.append(f'{name}{{stage="{_label(stage)}"}} {entry[metric]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="caterpillard_stage"):
+        """Write :meth:`to_prometheus` atomically, for a textfile collector"""
+        tmp = Path(f"{path}.tmp")
+        tmp.write_text(self.to_prometheus(prefix=prefix))
+        os.replace(tmp, path)
+
+
+def profiled(name, rows=None):
+    """Record a method of :class:`caterpillar.CaterpillarDiagram` as a stage.
+
+    The method runs unchanged when the instance has no profiler, so
+    disabled instrumentation costs a single attribute lookup.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage
+    rows : callable
+        Called with the instance after the method returned, gives
+        the number of rows processed
+    """
+
+    def decorator(method):
+        # the constructor receives the profiler as an argument, possibly
+        # positional, at this position of args (after self)
+        parameters = list(inspect.signature(method).parameters.values())
+        position = next(
+            (
+                i - 1
+                for i, parameter in enumerate(parameters)
+                if parameter.name == "profiler"
+                and parameter.kind is parameter.POSITIONAL_OR_KEYWORD
+            ),
+            None,
+        )
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self, "profiler", None) or kwargs.get("profiler")
+            if profiler is None and position is not None and len(args) > position:
+                profiler = args[position]
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            with profiler.stage(name) as record:
+                result = method(self, *args, **kwargs)
+                if rows is not None:
+                    record["rows"] = rows(self)
+            return result
+
+        return wrapper
+
+    return decorator
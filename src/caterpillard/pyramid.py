@@ -0,0 +1,146 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import transition_codes
+from caterpillard.kernels import assign_radius, radius_thresholds
+from caterpillard.markov import COLORS
+from caterpillard.model import cohorts_of
+
+logger = logging.getLogger(__name__)
+
+AGGREGATIONS = ["sum", "mean", "last"]
+
+
+def aggregate(values, factor, how="sum"):
+    """Aggregate blocks of ``factor`` consecutive periods.
+
+    The period axis is the last axis and is reshaped into blocks in
+    one step, a trailing incomplete block is dropped.
+
+    Parameters
+    ----------
+    values : array-like
+        Values with the time-axis as the last axis
+    factor : int
+        Number of periods in every block
+    how : str
+        ``sum`` (flows), ``mean`` or ``last`` (stocks)
+
+    Returns
+    -------
+    aggregated : numpy.ndarray
+        Array of shape ``(..., T // factor)``
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"how should be one of {AGGREGATIONS}")
+    values = np.asarray(values, dtype=np.float64)
+    n_blocks = values.shape[-1] // factor
+    blocks = values[..., : n_blocks * factor].reshape(
+        *values.shape[:-1], n_blocks, factor
+    )
+    if how == "sum":
+        return blocks.sum(axis=-1)
+    if how == "mean":
+        return blocks.mean(axis=-1)
+    return blocks[..., -1]
+
+
+class TemporalPyramid:
+    """Caterpillar cohorts of a panel at several time resolutions.
+
+    The period axis is aggregated once into every coarser level,
+    each level from the finest level whose factor divides its own
+    (for instance years from quarters), and the cohorts, pooled
+    radii and transition counts of every level are evaluated in the
+    same pass. A level is labelled by the first period of each of
+    its blocks.
+
+    Levels are stored in :attr:`levels`, keyed by name, as
+    dictionaries with the aggregated ``data``, the ``cohort_df``
+    (same columns as ``CaterpillarDiagram.complete_cohort_df``), the
+    ``radius_thresholds``, the ``transition_mat`` counted within
+    each entity and ``n_cohorts``.
+    """
+
+    def __init__(self, data, factors, how="sum") -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        data : Pandas DataFrame or Pandas Series
+            Wide format panel at the finest resolution, missing
+            values are taken as zero
+        factors : dictionary
+            Number of finest periods in a period of every level, for
+            instance ``{"monthly": 1, "quarterly": 3, "yearly": 12}``
+        how : str
+            ``sum``, ``mean`` or ``last``, see :func:`aggregate`
+        """
+        if not isinstance(data, (pd.DataFrame, pd.Series)):
+            raise TypeError("data should be a Pandas DataFrame or Series")
+        for name, factor in factors.items():
+            if type(factor) is not int or factor < 1:
+                raise ValueError(f"Factor of level '{name}' should be a positive int")
+        self.how = how
+        self.factors = dict(factors)
+
+        individual = isinstance(data, pd.Series)
+        values = np.atleast_2d(data.fillna(value=0).to_numpy(dtype=np.float64))
+        aggregated = {1: values}
+        self.levels = {}
+        for name, factor in sorted(self.factors.items(), key=lambda item: item[1]):
+            if factor not in aggregated:
+                # reuse the coarsest level already aggregated that divides it
+                source = max(f for f in aggregated if factor % f == 0)
+                aggregated[factor] = aggregate(
+                    aggregated[source], factor // source, how=how
+                )
+            level_values = aggregated[factor]
+            if level_values.shape[1] < 3:
+                raise ValueError(f"Level '{name}' has less than 3 periods")
+
+            labels = (data.index if individual else data.columns)[
+                : level_values.shape[1] * factor : factor
+            ]
+            if individual:
+                level_data = pd.Series(level_values[0], index=labels, name=data.name)
+            else:
+                level_data = pd.DataFrame(
+                    level_values, index=data.index, columns=labels
+                )
+            self.levels[name] = self._level(level_data)
+            logger.info(
+                f"Level {name}: {level_values.shape[1]} periods, "
+                f"{len(self.levels[name]['cohort_df'])} cohorts"
+            )
+
+    @staticmethod
+    def _level(data):
+        cohort_df = cohorts_of(data)
+        thresholds = {}
+        for diff in ["d11", "d12"]:
+            abs_diff = cohort_df[diff].abs().to_numpy()
+            thresholds[diff] = pd.Series(radius_thresholds(abs_diff))
+            radius = assign_radius(abs_diff, thresholds[diff])
+            if np.isfinite(radius).all():
+                radius = radius.astype(np.int64)
+            cohort_df[f"{diff}_radius"] = radius
+        cohort_df["final_cohort_radius"] = (
+            cohort_df["d11_radius"].to_numpy(dtype=np.float64)
+            + cohort_df["d12_radius"].to_numpy(dtype=np.float64)
+        ) / 2
+
+        _, from_code, to_code = transition_codes(cohort_df)
+        counts = np.bincount(from_code * 7 + to_code, minlength=49).reshape(7, 7)
+        return {
+            "data": data,
+            "cohort_df": cohort_df,
+            "radius_thresholds": thresholds,
+            "transition_mat": pd.DataFrame(counts, index=COLORS, columns=COLORS),
+            "n_cohorts": data.shape[-1] - 2,
+        }
+
+    def __getitem__(self, name):
+        return self.levels[name]
@@ -0,0 +1,286 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.kernels import classify, color_names, level_names
+
+logger = logging.getLogger(__name__)
+
+GAP_OPTIONS = ["split", "bridge", "zero"]
+
+
+class RaggedPanel:
+    """Long-format panel stored as ragged segments, one per entity.
+
+    The observations of entity ``i`` are
+    ``values[offsets[i]:offsets[i + 1]]`` observed at the periods
+    ``period_axis[positions[offsets[i]:offsets[i + 1]]]`` (CSR
+    layout). Periods that an entity was never observed in take no
+    memory, and no wide pivot is ever built.
+
+    Gaps between the observed periods of an entity are handled
+    according to ``gap``:
+
+    ============ ==========================================================
+    ``gap``      cohorts
+    ============ ==========================================================
+    ``split``    only three consecutive observed periods form a cohort
+    ``bridge``   gaps are ignored, consecutive observations form a cohort
+    ``zero``     missing periods inside the observed span are taken as zero
+    ============ ==========================================================
+    """
+
+    def __init__(self, entities, offsets, positions, values, period_axis, gap="split"):
+        """Constructor
+
+        Parameters
+        ----------
+        entities : array-like
+            Entity identifier of every segment
+        offsets : array-like
+            Start of every segment plus the end of the last one
+        positions : array-like
+            Position of every observation on ``period_axis``
+        values : array-like
+            Observed values
+        period_axis : array-like
+            Ordered labels of all periods
+        gap : str
+            Handling of missing periods, ``split``, ``bridge`` or ``zero``
+        """
+        if gap not in GAP_OPTIONS:
+            raise ValueError(f"gap should be one of {GAP_OPTIONS}")
+
+        self.entities = np.asarray(entities)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.positions = np.asarray(positions, dtype=np.int32)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.period_axis = pd.Index(period_axis)
+        self.gap = gap
+
+        if len(self.offsets) != len(self.entities) + 1:
+            raise ValueError("offsets must have one element more than entities")
+        if len(self.positions) != len(self.values):
+            raise ValueError("positions and values must have the same length")
+
+    @classmethod
+    def from_long(
+        cls,
+        data,
+        entity="entity",
+        period="period",
+        value="value",
+        period_axis=None,
+        gap="split",
+    ):
+        """Build a ragged panel from a long-format DataFrame.
+
+        Rows with a missing value are treated as unobserved periods.
+
+        Parameters
+        ----------
+        data : Pandas DataFrame
+            Long-format input with one row per (entity, period)
+        entity, period, value : str
+            Column names of the entity, period and value
+        period_axis : array-like
+            Complete ordered list of periods. By default the sorted
+            unique periods of ``data`` are used, so a period that no
+            entity was observed in does not count as a gap.
+        gap : str
+            Handling of missing periods, ``split``, ``bridge`` or ``zero``
+
+        Returns
+        -------
+        panel : RaggedPanel
+        """
+        if not isinstance(data, pd.DataFrame):
+            raise TypeError("Input parameter 'data' should be Pandas DataFrame")
+        missing = [col for col in [entity, period, value] if col not in data.columns]
+        if missing:
+            raise ValueError(f"Columns not found in long format data: {missing}")
+
+        data = data.loc[data[value].notna(), [entity, period, value]]
+        if period_axis is None:
+            period_axis = np.sort(data[period].unique())
+        period_axis = pd.Index(period_axis)
+        if not period_axis.is_unique:
+            raise ValueError("period_axis must not contain duplicates")
+
+        positions = period_axis.get_indexer(data[period])
+        if (positions < 0).any():
+            raise ValueError("Some periods are not part of period_axis")
+
+        entity_codes, entities = pd.factorize(data[entity])
+        order = np.lexsort((positions, entity_codes))
+        entity_codes = entity_codes[order]
+        positions = positions[order]
+
+        same = entity_codes[1:] == entity_codes[:-1]
+        if (same & (positions[1:] == positions[:-1])).any():
+            raise ValueError("Duplicate (entity, period) observations found")
+
+        offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entity_codes, minlength=len(entities)), out=offsets[1:])
+
+        return cls(
+            entities=np.asarray(entities),
+            offsets=offsets,
+            positions=positions,
+            values=data[value].to_numpy(dtype=np.float64)[order],
+            period_axis=period_axis,
+            gap=gap,
+        )
+
+    def __len__(self):
+        return len(self.entities)
+
+    @property
+    def n_periods(self):
+        """Number of periods on the period axis"""
+        return len(self.period_axis)
+
+    @property
+    def n_observations(self):
+        """Number of stored observations"""
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        """Memory taken by the ragged arrays in bytes"""
+        return self.offsets.nbytes + self.positions.nbytes + self.values.nbytes
+
+    def tail(self, n_periods):
+        """Panel restricted to the last ``n_periods`` of the period axis.
+
+        The period axis is kept as is, so cohorts keep the labels and
+        periods they have in the complete panel.
+        """
+        keep = self.positions >= self.n_periods - n_periods
+        owner = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        counts = np.bincount(owner[keep], minlength=len(self))
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return RaggedPanel(
+            self.entities,
+            offsets,
+            self.positions[keep],
+            self.values[keep],
+            self.period_axis,
+            gap=self.gap,
+        )
+
+    def segment(self, i):
+        """Positions and values of the ``i``-th entity"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.positions[start:end], self.values[start:end]
+
+    def _expanded(self):
+        """Observations with missing periods inside each span set to zero."""
+        # entities without observations, for instance after tail(),
+        # have an empty span
+        observed = np.diff(self.offsets) > 0
+        first = np.zeros(len(self), dtype=np.int64)
+        last = np.full(len(self), -1, dtype=np.int64)
+        first[observed] = self.positions[self.offsets[:-1][observed]]
+        last[observed] = self.positions[self.offsets[1:][observed] - 1]
+        lengths = last - first + 1
+
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        owner = np.repeat(np.arange(len(self)), lengths)
+        positions = (np.arange(offsets[-1]) - offsets[owner] + first[owner]).astype(
+            np.int32
+        )
+
+        owner_obs = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        values = np.zeros(offsets[-1], dtype=np.float64)
+        values[offsets[owner_obs] + self.positions - first[owner_obs]] = self.values
+        return offsets, positions, values
+
+    def _cohort_starts(self):
+        """Owner, positions and values of the observations used for the
+        cohorts, and the position of the first period of every cohort
+        """
+        if self.gap == "zero":
+            offsets, positions, values = self._expanded()
+        else:
+            offsets, positions, values = self.offsets, self.positions, self.values
+
+        owner = np.repeat(np.arange(len(self)), np.diff(offsets))
+        start = np.arange(len(values) - 2)
+        valid = owner[start] == owner[start + 2]
+        if self.gap == "split":
+            step = np.diff(positions)
+            valid &= (step[start] == 1) & (step[start + 1] == 1)
+        return owner, positions, values, start[valid]
+
+    @staticmethod
+    def _first_differences(values, start):
+        return values[start + 1] - values[start], values[start + 2] - values[start + 1]
+
+    def first_differences(self):
+        """First differences of every cohort, without classifying them.
+
+        Returns
+        -------
+        d11, d12 : numpy.ndarray
+            :math:`d_{11}` and :math:`d_{12}` of the cohorts, in the
+            order of :meth:`cohorts`
+        """
+        _, _, values, start = self._cohort_starts()
+        return self._first_differences(values, start)
+
+    def cohorts(self):
+        """Cohort details of every entity.
+
+        The DoD approach is applied to each segment without ever
+        filling the periods in which an entity was not observed
+        (except with ``gap="zero"``).
+
+        Returns
+        -------
+        cohort_df : Pandas DataFrame
+            Same columns as
+            ``CaterpillarDiagram.complete_cohort_df`` produced by
+            :meth:`caterpillar.CaterpillarDiagram.color_schema`, plus
+            the ``start_period`` and ``end_period`` of the cohort and
+            a ``segment`` number that changes whenever two cohorts
+            are not consecutive.
+        """
+        owner, positions, values, start = self._cohort_starts()
+        d11, d12 = self._first_differences(values, start)
+        d2 = d12 - d11
+        n_color = classify(d11, d12, d2)
+        if (n_color == 0).any():
+            raise ValueError("Fatal:\tSign combination Not Captured\n")
+
+        owner = owner[start]
+        new_segment = np.ones(len(start), dtype=bool)
+        new_segment[1:] = owner[1:] != owner[:-1]
+        if self.gap == "split":
+            new_segment[1:] |= positions[start[1:]] != positions[start[:-1]] + 1
+        first_row = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+        rank = np.arange(len(start)) - np.repeat(
+            first_row, np.diff(np.r_[first_row, len(start)])
+        )
+
+        cohort_df = pd.DataFrame(
+            {
+                "d11": d11,
+                "d12": d12,
+                "d2": d2,
+                "data_index": self.entities[owner],
+                "Cohort": [f"Cohort{p + 1}" for p in positions[start]],
+                "color": color_names(n_color),
+                "level": level_names(n_color),
+                "n_color": n_color.astype(np.int64),
+                "start_period": self.period_axis[positions[start]],
+                "end_period": self.period_axis[positions[start + 2]],
+                "segment": np.cumsum(new_segment) - 1,
+            },
+            index=rank,
+        )
+        logger.debug(f"Ragged cohorts: {len(cohort_df)} from {len(self)} entities")
+        return cohort_df
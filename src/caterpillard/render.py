@@ -0,0 +1,294 @@
+import io
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from matplotlib import font_manager, rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+
+logger = logging.getLogger(__name__)
+
+FONT_FAMILY = "Palatino Linotype"
+STYLE_COHORT = dict(size=7, color="black", rotation=90)
+STYLE_RADII = dict(size=5, color="black", rotation=0)
+# Vertical extent of a tile, the circles and the cohort labels below
+TILE_YLIM = (-22, 10)
+
+
+@lru_cache(maxsize=None)
+def _font_family():
+    # Resolved once, matplotlib would otherwise log a warning for every
+    # text drawn when the font is not installed
+    if any(font.name == FONT_FAMILY for font in font_manager.fontManager.ttflist):
+        return FONT_FAMILY
+    logger.info(f"Font family '{FONT_FAMILY}' not found, using the default")
+    return rcParams["font.family"]
+
+
+def figure_size(n_cohorts):
+    """Figure size (in inches) of a diagram with ``n_cohorts`` circles"""
+    return (n_cohorts / 5 * 7, 9)
+
+
+def render_figure(geometry, figure=None):
+    """Draw a Caterpillar Diagram on a matplotlib figure.
+
+    Only the object-oriented ``Figure`` API with an Agg canvas is
+    used, the figure is never registered with pyplot. It is released
+    as soon as it is no longer referenced and figures drawn in
+    different threads do not share any state.
+
+    Parameters
+    ----------
+    geometry : dictionary
+        ``cx``, ``lx_s``, ``lx_e``, ``radii`` and ``colors`` of the
+        diagram, see :func:`caterpillard.geometry.caterpillar_geometry`
+    figure : matplotlib Figure
+        Figure to clear and draw on. A new figure is created when
+        ``None``.
+
+    Returns
+    -------
+    figure : matplotlib Figure
+    """
+    n = len(geometry["radii"])
+
+    if figure is None:
+        figure = Figure(figsize=figure_size(n))
+        FigureCanvasAgg(figure)
+    else:
+        figure.clear()
+        figure.set_size_inches(figure_size(n))
+        if not isinstance(figure.canvas, FigureCanvasAgg):
+            FigureCanvasAgg(figure)
+
+    ax = figure.add_subplot()
+    _draw_cohorts(ax, geometry, 0, n)
+    ax.autoscale_view()
+    ax.set_aspect(1)
+    ax.grid(False)
+    ax.set_axis_off()
+    return figure
+
+
+def _draw_cohorts(ax, geometry, start, stop):
+    """Draw the circles ``start`` to ``stop`` and the lines touching them"""
+    # only the cohorts of the tile are converted, not the whole strip
+    cx = [float(x) for x in geometry["cx"][start:stop]]
+    radii = [float(r) for r in geometry["radii"][start:stop]]
+    colors = list(geometry["colors"][start:stop])
+    n = len(geometry["radii"])
+
+    ax.set_facecolor("white")
+    cy = ly = 0
+    style_cohort = dict(STYLE_COHORT, fontfamily=_font_family())
+    style_radii = dict(STYLE_RADII, fontfamily=_font_family())
+    for i, x, radius, color in zip(range(start, stop), cx, radii, colors):
+        ax.text(x - 0.5, -18, f"Cohort {i+1}", **style_cohort)
+        ax.text(x - 1, cy + 1, f"R={radius}", **style_radii)
+        ax.add_patch(Circle((x, cy), radius, facecolor=color, edgecolor="None"))
+    # the lines leaving the strip are clipped at the edge of the tile
+    first, last = max(start - 1, 0), min(stop, n - 1)
+    for x_start, x_end in zip(
+        geometry["lx_s"][first:last], geometry["lx_e"][first:last]
+    ):
+        ax.plot(
+            [x_start, x_end], [ly, ly], color="black", linewidth=0.5, linestyle="-",
+        )
+
+
+def render_bytes(geometry, format="png", dpi=400, figure=None):
+    """Render a Caterpillar Diagram to an in-memory image.
+
+    Parameters
+    ----------
+    geometry : dictionary
+        Geometry of the diagram
+    format : str
+        Image format understood by ``Figure.savefig``
+    dpi : int
+        Resolution of the image
+    figure : matplotlib Figure
+        Figure to reuse, see :func:`render_figure`
+
+    Returns
+    -------
+    image : bytes
+    """
+    figure = render_figure(geometry, figure=figure)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=format, dpi=dpi)
+    return buffer.getvalue()
+
+
+def tile_bounds(geometry, cohorts_per_tile):
+    """Split the cohort strip into tiles of ``cohorts_per_tile`` circles.
+
+    Consecutive tiles share an edge in the middle of the line
+    between their circles, so the tiles put side by side give the
+    whole diagram.
+
+    Returns
+    -------
+    bounds : list of tuple
+        First and last (excluded) cohort and the ``x`` range of every
+        tile, in the coordinates of the whole diagram
+    """
+    cx = np.asarray(geometry["cx"], dtype=np.float64)
+    radii = np.asarray(geometry["radii"], dtype=np.float64)
+    mid = (np.asarray(geometry["lx_s"]) + np.asarray(geometry["lx_e"])) / 2
+    n = len(cx)
+    bounds = []
+    for start in range(0, n, cohorts_per_tile):
+        stop = min(start + cohorts_per_tile, n)
+        x_start = cx[0] - radii[0] if start == 0 else mid[start - 1]
+        x_end = cx[-1] + radii[-1] if stop == n else mid[stop - 1]
+        bounds.append((start, stop, float(x_start), float(x_end)))
+    return bounds
+
+
+def render_tiles(
+    geometry, directory, cohorts_per_tile=25, format="png", dpi=400, prefix="tile"
+):
+    """Render a long Caterpillar Diagram as a row of tiles.
+
+    Every tile holds at most ``cohorts_per_tile`` circles drawn at
+    their ``cx`` in the whole diagram, all tiles share the same scale
+    as :func:`render_figure` and one figure is cleared and reused for
+    every tile. Each tile is written as soon as it is drawn, so the
+    peak memory depends on ``cohorts_per_tile`` but not on the
+    number of cohorts.
+
+    An ``index.json`` describing every tile (file, cohorts, ``x``
+    range and size in pixels) is written next to the tiles, so a
+    viewer can load them on demand.
+
+    Tiles with the same ``prefix`` already in ``directory`` are
+    removed first, so only the tiles of the index are left.
+
+    Parameters
+    ----------
+    geometry : dictionary
+        Geometry of the diagram
+    directory : str
+        Output directory, created when missing
+    cohorts_per_tile : int
+        Number of circles in a tile
+    format : str
+        Image format understood by ``Figure.savefig``
+    dpi : int
+        Resolution of the tiles
+    prefix : str
+        Prefix of the tile file names
+
+    Returns
+    -------
+    index : dictionary
+        Content of ``index.json``
+    """
+    if type(cohorts_per_tile) is not int or cohorts_per_tile < 1:
+        raise ValueError("cohorts_per_tile should be a positive integer")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # tiles of an earlier, longer rendering would be left behind
+    for stale in directory.glob(f"{prefix}_*"):
+        if stale.is_file() and stale.stem[len(prefix) + 1 :].isdigit():
+            stale.unlink()
+
+    bounds = tile_bounds(geometry, cohorts_per_tile)
+    n = len(geometry["radii"])
+    extent = bounds[-1][3] - bounds[0][2] if bounds else 0
+    # same horizontal scale as the untiled figure
+    scale = figure_size(n)[0] / extent if extent else 0
+    height = (TILE_YLIM[1] - TILE_YLIM[0]) * scale
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    tiles = []
+    for k, (start, stop, x_start, x_end) in enumerate(bounds):
+        figure.clear()
+        figure.set_size_inches((x_end - x_start) * scale, height)
+        ax = figure.add_axes([0, 0, 1, 1])
+        _draw_cohorts(ax, geometry, start, stop)
+        ax.set_xlim(x_start, x_end)
+        ax.set_ylim(*TILE_YLIM)
+        ax.set_axis_off()
+        file_name = f"{prefix}_{k:05d}.{format}"
+        figure.savefig(directory / file_name, format=format, dpi=dpi)
+        width_px, height_px = (figure.get_size_inches() * dpi).round().astype(int)
+        tiles.append(
+            {
+                "file": file_name,
+                "first_cohort": start + 1,
+                "last_cohort": stop,
+                "x_start": x_start,
+                "x_end": x_end,
+                "width_px": int(width_px),
+                "height_px": int(height_px),
+            }
+        )
+        logger.debug(f"Tile {file_name} written")
+    figure.clear()
+
+    index = {
+        "n_cohorts": n,
+        "cohorts_per_tile": cohorts_per_tile,
+        "format": format,
+        "dpi": dpi,
+        "x_start": bounds[0][2] if bounds else 0.0,
+        "x_end": bounds[-1][3] if bounds else 0.0,
+        "y_start": TILE_YLIM[0],
+        "y_end": TILE_YLIM[1],
+        "tiles": tiles,
+    }
+    tmp = directory / "index.json.tmp"
+    tmp.write_text(json.dumps(index, indent=2))
+    os.replace(tmp, directory / "index.json")
+    return index
+
+
+class Renderer:
+    """Reusable diagram renderer for long-running processes.
+
+    Every thread draws on its own figure, which is created on first
+    use and then cleared and reused for every following diagram, so
+    repeated renders neither allocate new figures nor share state
+    between threads.
+    """
+
+    def __init__(self, format="png", dpi=400) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        format : str
+            Image format understood by ``Figure.savefig``
+        dpi : int
+            Resolution of the images
+        """
+        self.format = format
+        self.dpi = dpi
+        self._local = threading.local()
+
+    def render(self, geometry):
+        """Render ``geometry`` to bytes with the figure of this thread"""
+        figure = getattr(self._local, "figure", None)
+        if figure is None:
+            logger.debug(f"Figure created for thread {threading.get_ident()}")
+        self._local.figure = render_figure(geometry, figure=figure)
+        buffer = io.BytesIO()
+        self._local.figure.savefig(buffer, format=self.format, dpi=self.dpi)
+        return buffer.getvalue()
+
+    def close(self):
+        """Release the figure of the calling thread"""
+        figure = getattr(self._local, "figure", None)
+        if figure is not None:
+            figure.clear()
+        self._local.figure = None
@@ -0,0 +1,170 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import entity_codes, transition_codes
+from caterpillard.kernels import color_names
+from caterpillard.markov import COLORS
+
+logger = logging.getLogger(__name__)
+
+METRICS = ["kl", "js"]
+
+
+def _kl(p, q):
+    # 0 * log(0 / q) is taken as 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(p > 0, p * np.log(p / q), 0.0)
+    return terms.sum(axis=-1)
+
+
+def recent_distribution(cohort_df, window=10):
+    """Empirical color distribution of the last cohorts of every entity.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+    window : int
+        Number of last cohorts of every entity taken into account
+
+    Returns
+    -------
+    entities : Pandas Index
+        ``data_index`` values in order of first appearance
+    distribution : numpy.ndarray
+        Array of shape ``(len(entities), 7)``, rows sum to one
+    current : numpy.ndarray
+        Color code (0 for red to 6 for grey) of the last cohort of
+        every entity
+    """
+    entity, entities = entity_codes(cohort_df)
+    code = cohort_df["n_color"].to_numpy(dtype=np.int64) - 1
+
+    # position of every cohort counted from the end of its entity
+    first = np.r_[True, entity[1:] != entity[:-1]][: len(entity)]
+    end = np.flatnonzero(np.r_[entity[1:] != entity[:-1], True][: len(entity)])
+    from_end = end[np.cumsum(first) - 1] - np.arange(len(entity))
+
+    keep = (from_end < window) & (code >= 0)
+    counts = np.bincount(
+        entity[keep] * 7 + code[keep], minlength=len(entities) * 7
+    ).reshape(-1, 7)
+    total = counts.sum(axis=1, keepdims=True)
+    distribution = counts / np.where(total == 0, 1, total)
+    return entities, distribution, code[end]
+
+
+def surprise_scores(
+    cohort_df, trans_mat_prob, stationary=None, window=10, metric="kl", eps=1e-12
+):
+    """Surprise of the latest color transition of every entity.
+
+    Every score is evaluated for all entities in one vectorized pass
+    over the integer color codes.
+
+    * ``surprise`` is ``-log P(last transition)`` under
+      ``trans_mat_prob``
+    * ``divergence`` compares the color distribution of the last
+      ``window`` cohorts of an entity with the long-run distribution
+      of the chain started from its current color, the row of
+      ``stationary`` for that color
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+    trans_mat_prob : Pandas DataFrame
+        Transition probabilities, rows and columns labelled by color
+    stationary : Pandas DataFrame
+        Stationary matrix, rows and columns labelled by color. The
+        ``divergence`` is only evaluated when given.
+    window : int
+        Number of last cohorts used for the empirical distribution
+    metric : str
+        ``kl`` (Kullback-Leibler) or ``js`` (Jensen-Shannon)
+        divergence
+    eps : float
+        Floor for zero probabilities, keeps the scores finite
+
+    Returns
+    -------
+    scores : Pandas DataFrame
+        ``from_color``, ``to_color``, ``probability``, ``surprise``
+        and ``divergence`` indexed by ``data_index``. Entities
+        without any transition get missing values.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric should be one of {METRICS}")
+
+    prob = trans_mat_prob.loc[COLORS, COLORS].to_numpy(dtype=np.float64)
+    entity, entities = entity_codes(cohort_df)
+    row, from_code, to_code = transition_codes(cohort_df)
+
+    # the last transition of every entity
+    row_entity = entity[row]
+    last = np.flatnonzero(np.r_[row_entity[1:] != row_entity[:-1], True][: len(row)])
+    # -1 marks entities without any transition
+    last_from = np.full(len(entities), -1)
+    last_to = np.full(len(entities), -1)
+    last_from[row_entity[last]] = from_code[last]
+    last_to[row_entity[last]] = to_code[last]
+    valid = (last_from >= 0) & (last_to >= 0)
+
+    probability = np.where(valid, prob[last_from, last_to], np.nan)
+    scores = pd.DataFrame(
+        {
+            "from_color": np.where(valid, color_names(last_from + 1), None),
+            "to_color": np.where(valid, color_names(last_to + 1), None),
+            "probability": probability,
+            "surprise": -np.log(np.maximum(probability, eps)),
+        },
+        index=pd.Index(entities, name="data_index"),
+    )
+
+    if stationary is not None:
+        _, recent, current = recent_distribution(cohort_df, window=window)
+        stat = stationary.loc[COLORS, COLORS].to_numpy(dtype=np.float64)
+        reference = np.maximum(stat[np.maximum(current, 0)], eps)
+        reference /= reference.sum(axis=1, keepdims=True)
+        if metric == "kl":
+            divergence = _kl(recent, reference)
+        else:
+            mixture = (recent + reference) / 2
+            divergence = (_kl(recent, mixture) + _kl(reference, mixture)) / 2
+        scores["divergence"] = np.where(current >= 0, divergence, np.nan)
+
+    logger.debug(f"Surprise scores evaluated for {len(entities)} entities")
+    return scores
+
+
+def top_k(scores, k, by="surprise"):
+    """The ``k`` highest scores, most surprising first.
+
+    Uses ``np.argpartition`` so only the selected rows are sorted.
+    Missing scores are ranked last.
+
+    Parameters
+    ----------
+    scores : Pandas DataFrame
+        Output of :func:`surprise_scores`
+    k : int
+        Number of entities
+    by : str
+        Column to rank on
+
+    Returns
+    -------
+    top : Pandas DataFrame
+    """
+    values = scores[by].to_numpy(dtype=np.float64)
+    values = np.where(np.isnan(values), -np.inf, values)
+    k = min(k, len(values))
+    if k <= 0:
+        return scores.iloc[:0]
+    chosen = np.argpartition(-values, k - 1)[:k]
+    chosen = chosen[np.argsort(-values[chosen], kind="stable")]
+    return scores.iloc[chosen]
@@ -0,0 +1,246 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import entity_codes
+from caterpillard.markov import COLORS
+
+logger = logging.getLogger(__name__)
+
+# Every color code takes 3 bits, 21 codes fill a 64-bit word
+BITS = 3
+CODES_PER_WORD = 64 // BITS
+# Code of the positions before the first cohort of short entities
+MISSING = 7
+_LOW_BITS = np.uint64(sum(1 << (BITS * j) for j in range(CODES_PER_WORD)))
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(*words.shape[:-1], -1)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def sequence_codes(cohort_df, length):
+    """Last ``length`` color codes of every entity, aligned to the right.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+    length : int
+        Number of last cohorts kept per entity
+
+    Returns
+    -------
+    entities : Pandas Index
+        ``data_index`` values in order of first appearance
+    codes : numpy.ndarray
+        Array of shape ``(len(entities), length)`` with color codes
+        from 0 (red) to 6 (grey). Entities with fewer cohorts are
+        padded on the left with ``MISSING``.
+    """
+    entity, entities = entity_codes(cohort_df)
+    code = cohort_df["n_color"].to_numpy(dtype=np.int64) - 1
+
+    first = np.r_[True, entity[1:] != entity[:-1]][: len(entity)]
+    end = np.flatnonzero(np.r_[entity[1:] != entity[:-1], True][: len(entity)])
+    from_end = end[np.cumsum(first) - 1] - np.arange(len(entity))
+
+    keep = (from_end < length) & (code >= 0)
+    codes = np.full((len(entities), length), MISSING, dtype=np.uint8)
+    codes[entity[keep], length - 1 - from_end[keep]] = code[keep]
+    return entities, codes
+
+
+def pack(codes):
+    """Pack rows of 3-bit color codes into 64-bit words.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Array of shape ``(N, length)`` with values from 0 to 7
+
+    Returns
+    -------
+    packed : numpy.ndarray
+        ``uint64`` array of shape ``(N, ceil(length / 21))``
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    n_words = -(-codes.shape[1] // CODES_PER_WORD)
+    padded = np.full(
+        (codes.shape[0], n_words * CODES_PER_WORD), MISSING, dtype=np.uint64
+    )
+    padded[:, : codes.shape[1]] = codes
+    shifts = np.arange(CODES_PER_WORD, dtype=np.uint64) * np.uint64(BITS)
+    fields = padded.reshape(codes.shape[0], n_words, CODES_PER_WORD) << shifts
+    return np.bitwise_or.reduce(fields, axis=-1)
+
+
+def hamming(packed, query):
+    """Number of positions where the packed sequences differ from ``query``"""
+    diff = packed ^ query
+    # a position differs when any of its 3 bits differs
+    differs = (diff | (diff >> np.uint64(1)) | (diff >> np.uint64(2))) & _LOW_BITS
+    return _popcount(differs)
+
+
+class SimilarityIndex:
+    """Nearest-neighbour index over caterpillar color sequences.
+
+    The last ``length`` color codes of every entity are packed as
+    3-bit fields into 64-bit words, so a sequence of 21 cohorts takes
+    8 bytes. The distance between two entities is the number of
+    cohorts (aligned on the latest one) with a different color,
+    evaluated with XOR and popcount on the packed words for every
+    entity at once.
+
+    Entities can be added at any time with :meth:`add`, the storage
+    grows geometrically so repeated insertion stays cheap.
+    """
+
+    def __init__(self, length) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        length : int
+            Number of last cohorts compared
+        """
+        if type(length) is not int or length <= 0:
+            raise ValueError("length should be a positive integer")
+        self.length = length
+        self.n_words = -(-length // CODES_PER_WORD)
+        self.keys = []
+        self._rows = {}
+        self._packed = np.zeros((0, self.n_words), dtype=np.uint64)
+
+    @classmethod
+    def from_cohorts(cls, cohort_df, length=None):
+        """Build an index over every entity of ``cohort_df``.
+
+        Parameters
+        ----------
+        cohort_df : Pandas DataFrame
+            Cohort details, for instance
+            ``CaterpillarDiagram.complete_cohort_df``
+        length : int
+            Number of last cohorts compared, the longest entity by
+            default
+        """
+        if length is None:
+            entity = entity_codes(cohort_df)[0]
+            length = int(np.bincount(entity).max()) if len(entity) else 1
+        index = cls(length)
+        index.add(cohort_df)
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        """Memory taken by the packed sequences"""
+        return len(self) * self.n_words * 8
+
+    def add(self, cohort_df):
+        """Insert the entities of ``cohort_df`` into the index.
+
+        Raises
+        ------
+        ValueError
+            When an entity is already indexed
+        """
+        entities, codes = sequence_codes(cohort_df, self.length)
+        duplicated = [key for key in entities if key in self._rows]
+        if duplicated:
+            raise ValueError(f"Entities already indexed: {duplicated[:5]}")
+
+        n_old, n_new = len(self.keys), len(entities)
+        if n_old + n_new > len(self._packed):
+            capacity = max(n_old + n_new, 2 * len(self._packed))
+            grown = np.zeros((capacity, self.n_words), dtype=np.uint64)
+            grown[:n_old] = self._packed[:n_old]
+            self._packed = grown
+        self._packed[n_old : n_old + n_new] = pack(codes)
+        for row, key in enumerate(entities, start=n_old):
+            self._rows[key] = row
+        self.keys.extend(entities)
+        logger.debug(f"{n_new} entities added, {len(self.keys)} indexed")
+
+    def _query_codes(self, sequence):
+        codes = np.array(
+            [
+                COLORS.index(item) if isinstance(item, str) else int(item) - 1
+                for item in sequence
+            ],
+            dtype=np.uint8,
+        )[-self.length :]
+        padded = np.full(self.length, MISSING, dtype=np.uint8)
+        padded[self.length - len(codes) :] = codes
+        return padded
+
+    def codes(self, data_index):
+        """Unpacked color codes of an indexed entity"""
+        words = self._packed[self._rows[data_index]]
+        shifts = np.arange(CODES_PER_WORD, dtype=np.uint64) * np.uint64(BITS)
+        fields = (words[:, None] >> shifts) & np.uint64(7)
+        return fields.ravel()[: self.length].astype(np.uint8)
+
+    def query(self, sequence=None, data_index=None, k=10, exact=False):
+        """Entities with the most similar color sequences.
+
+        Parameters
+        ----------
+        sequence : list
+            Color names or color numbers (1 to 7), oldest first.
+            Only the last ``length`` are used.
+        data_index : int or str
+            Query with the sequence of an indexed entity instead,
+            the entity itself is left out of the result
+        k : int
+            Number of neighbours
+        exact : bool
+            Compare the unpacked color codes one by one instead of
+            the packed words. Much slower, meant for validation.
+
+        Returns
+        -------
+        neighbours : Pandas DataFrame
+            ``distance`` (number of differing cohorts) indexed by
+            ``data_index``, closest first
+        """
+        if (sequence is None) == (data_index is None):
+            raise ValueError("Provide either a sequence or a data_index")
+        query = (
+            self.codes(data_index)
+            if data_index is not None
+            else self._query_codes(sequence)
+        )
+
+        n = len(self.keys)
+        if exact:
+            distance = np.array(
+                [np.count_nonzero(self.codes(key) != query) for key in self.keys],
+                dtype=np.int64,
+            )
+        else:
+            distance = hamming(self._packed[:n], pack(query[None, :])[0])
+        if data_index is not None:
+            # the entity itself is never its own neighbour
+            distance[self._rows[data_index]] = np.iinfo(np.int64).max
+
+        k = min(k, n - (data_index is not None))
+        if k <= 0:
+            chosen = np.zeros(0, dtype=np.int64)
+        else:
+            chosen = np.argpartition(distance, k - 1)[:k]
+            chosen = chosen[np.lexsort((chosen, distance[chosen]))]
+        return pd.DataFrame(
+            {"distance": distance[chosen]},
+            index=pd.Index([self.keys[i] for i in chosen], name="data_index"),
+        )
@@ -0,0 +1,179 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.parallel import chunk_sizes, map_chunks, spawn_seeds
+
+logger = logging.getLogger(__name__)
+
+
+def _cumulative_rows(prob):
+    """Row-wise cumulative distribution used for inverse-CDF sampling.
+
+    Rows are renormalised so that the last cumulative value is
+    exactly one. Rows without any probability mass (colors that
+    never transitioned in the observed data) are flagged so that
+    the simulation keeps the path in its current color.
+    """
+    row_sum = prob.sum(axis=1)
+    absorbing = row_sum <= 0
+    cum = np.cumsum(prob, axis=1)
+    cum[~absorbing] /= row_sum[~absorbing, None]
+    cum[~absorbing, -1] = 1.0
+    return cum, absorbing
+
+
+def _simulate_chunk(cum, absorbing, start_cum, n_paths, n_steps, target, seed):
+    """Advance ``n_paths`` paths for ``n_steps`` steps.
+
+    Only aggregated counts are returned, the paths themselves are
+    discarded after every step.
+    """
+    rng = np.random.default_rng(seed)
+    n_states = cum.shape[0]
+
+    states = np.minimum(
+        (rng.random(n_paths)[:, None] >= start_cum).sum(axis=1), n_states - 1
+    )
+    occupancy = np.zeros((n_steps + 1, n_states), dtype=np.int64)
+    occupancy[0] = np.bincount(states, minlength=n_states)
+
+    first_hit = np.zeros(n_steps + 1, dtype=np.int64)
+    hit = target[states] if target is not None else None
+    if hit is not None:
+        first_hit[0] = hit.sum()
+
+    for step in range(1, n_steps + 1):
+        u = rng.random(n_paths)
+        nxt = np.minimum((u[:, None] >= cum[states]).sum(axis=1), n_states - 1)
+        states = np.where(absorbing[states], states, nxt)
+        occupancy[step] = np.bincount(states, minlength=n_states)
+        if hit is not None:
+            new_hit = target[states] & ~hit
+            first_hit[step] = new_hit.sum()
+            hit |= new_hit
+
+    return occupancy, first_hit
+
+
+def simulate_paths(
+    trans_mat_prob,
+    start,
+    n_steps,
+    n_paths=10 ** 5,
+    target=None,
+    seed=None,
+    chunk_size=2 ** 18,
+    n_workers=1,
+):
+    """Monte Carlo simulation of future color paths.
+
+    Paths are advanced in batches of ``chunk_size``. Each step draws
+    one uniform number per path and looks it up in the cumulative
+    row of the path's current color (inverse-CDF sampling), so a
+    whole batch moves forward with a handful of NumPy operations.
+    Only per-step counts are kept, which bounds the memory to
+    ``O(chunk_size)`` regardless of ``n_paths``.
+
+    Every batch receives its own child of
+    ``numpy.random.SeedSequence(seed)``, so results for a given
+    ``seed`` and ``chunk_size`` are identical for any ``n_workers``.
+
+    Colors whose row in ``trans_mat_prob`` is all zero have never
+    been observed transitioning anywhere; paths reaching them stay
+    in that color.
+
+    Parameters
+    ----------
+    trans_mat_prob : Pandas DataFrame
+        Transition probability matrix, for instance
+        ``CaterpillarDiagram.trans_mat_prob``
+    start : str or array-like
+        Starting color, or a probability distribution over the
+        colors from which the starting color of every path is drawn
+    n_steps : int
+        Number of future periods to simulate
+    n_paths : int
+        Number of simulated paths
+    target : str or list of str
+        Color(s) for which the probability of being reached within
+        each number of steps is reported
+    seed : int or numpy.random.SeedSequence
+        Seed for reproducible results
+    chunk_size : int
+        Number of paths advanced together in one batch
+    n_workers : int
+        Number of worker processes. ``None`` uses every CPU.
+
+    Returns
+    -------
+    summary : dict
+        ``occupancy`` is a DataFrame with the probability of being
+        in each color after every step, ``hitting_probability`` is a
+        Series with the probability of having reached ``target``
+        within each number of steps (only when ``target`` is given)
+        and ``n_paths`` is the number of simulated paths.
+    """
+    if isinstance(trans_mat_prob, pd.DataFrame):
+        labels = list(trans_mat_prob.columns)
+        prob = trans_mat_prob.to_numpy(dtype=np.float64)
+    else:
+        prob = np.asarray(trans_mat_prob, dtype=np.float64)
+        labels = list(range(prob.shape[1]))
+
+    if prob.ndim != 2 or prob.shape[0] != prob.shape[1]:
+        raise ValueError("Transition probability matrix must be square")
+    if not isinstance(n_steps, int) or n_steps <= 0:
+        raise ValueError("n_steps must be a positive integer")
+    if not isinstance(n_paths, int) or n_paths <= 0:
+        raise ValueError("n_paths must be a positive integer")
+
+    if isinstance(start, str):
+        if start not in labels:
+            raise ValueError(f"Unknown starting color: {start}")
+        start_prob = np.zeros(len(labels))
+        start_prob[labels.index(start)] = 1.0
+    else:
+        start_prob = np.asarray(start, dtype=np.float64)
+        if start_prob.shape != (len(labels),) or start_prob.sum() <= 0:
+            raise ValueError("start must be a color or a distribution over colors")
+    start_cum = np.cumsum(start_prob / start_prob.sum())
+    start_cum[-1] = 1.0
+
+    target_mask = None
+    if target is not None:
+        targets = [target] if isinstance(target, str) else list(target)
+        unknown = [t for t in targets if t not in labels]
+        if unknown:
+            raise ValueError(f"Unknown target color(s): {unknown}")
+        target_mask = np.isin(labels, targets)
+
+    cum, absorbing = _cumulative_rows(prob)
+    sizes = chunk_sizes(n_paths, chunk_size)
+    seeds = spawn_seeds(seed, len(sizes))
+    tasks = [
+        (cum, absorbing, start_cum, size, n_steps, target_mask, child)
+        for size, child in zip(sizes, seeds)
+    ]
+    logger.debug(f"Simulating {n_paths} paths in {len(tasks)} chunks")
+    results = map_chunks(_simulate_chunk, tasks, n_workers=n_workers)
+
+    occupancy = sum(r[0] for r in results)
+    summary = {
+        "occupancy": pd.DataFrame(
+            occupancy / n_paths,
+            index=pd.RangeIndex(n_steps + 1, name="step"),
+            columns=labels,
+        ),
+        "n_paths": n_paths,
+    }
+    if target_mask is not None:
+        first_hit = sum(r[1] for r in results)
+        summary["hitting_probability"] = pd.Series(
+            np.cumsum(first_hit) / n_paths,
+            index=pd.RangeIndex(n_steps + 1, name="step"),
+            name="hitting_probability",
+        )
+
+    return summary
@@ -0,0 +1,309 @@
+import json
+import logging
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.markov import COLORS
+
+logger = logging.getLogger(__name__)
+
+# Columns of complete_cohort_df kept in the store, in order. Columns
+# missing from a cohort table are stored as NULL.
+COHORT_COLUMNS = [
+    "d11",
+    "d12",
+    "d2",
+    "Cohort",
+    "color",
+    "level",
+    "n_color",
+    "d11_radius",
+    "d12_radius",
+    "final_cohort_radius",
+    "segment",
+    "start_period",
+    "end_period",
+]
+# data_index of the single entity of an individual analysis, columns
+# of a primary key cannot be NULL
+INDIVIDUAL = ""
+# Only present after caterpillar_size or for ragged panels
+_OPTIONAL_COLUMNS = [
+    "d11_radius",
+    "d12_radius",
+    "final_cohort_radius",
+    "segment",
+    "start_period",
+    "end_period",
+]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cohorts (
+    run_id INTEGER NOT NULL,
+    data_index,
+    position INTEGER NOT NULL,
+    {", ".join(COHORT_COLUMNS)},
+    PRIMARY KEY (run_id, data_index, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS matrices (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, name)
+) WITHOUT ROWID;
+"""
+
+# Matrices of a CaterpillarDiagram written by ResultStore.write_diagram
+DIAGRAM_MATRICES = {
+    "transition_mat": "transition_mat",
+    "trans_mat_prob": "trans_mat_prob",
+    "stationary_mat": "stationary_mat_final_df",
+}
+
+
+def _python(values):
+    # sqlite3 only binds the Python scalar types
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+def _column(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # datetime64 values would be bound as integer nanoseconds
+        return _python(series.astype(str).to_numpy())
+    return _python(series.to_numpy())
+
+
+class ResultStore:
+    """Persistent, indexed store of Caterpillar Diagram results.
+
+    Results are kept in a single SQLite file. Every run holds its
+    cohort rows, named 7x7 matrices (transition counts, transition
+    probabilities, stationary matrix) and JSON metadata.
+
+    Cohorts are stored in a ``WITHOUT ROWID`` table clustered on
+    ``(run_id, data_index, position)``, so the cohorts of one entity
+    are read with a single B-tree search, in ``O(log n)``, from
+    contiguous pages. Writes go through batched ``executemany`` calls
+    inside one transaction per run.
+    """
+
+    def __init__(self, path, batch_size=50000) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        path : str
+            SQLite file, created when missing
+        batch_size : int
+            Number of cohort rows inserted per ``executemany`` call
+        """
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+        # stores written by an earlier version lack the newer columns
+        known = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(cohorts)")
+        }
+        for column in COHORT_COLUMNS:
+            if column not in known:
+                self.connection.execute(f"ALTER TABLE cohorts ADD COLUMN {column}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the connection to the SQLite file"""
+        self.connection.close()
+
+    def _run_id(self, run_id):
+        if run_id is not None:
+            return run_id
+        (latest,) = self.connection.execute("SELECT max(run_id) FROM runs").fetchone()
+        if latest is None:
+            raise KeyError("The store holds no run")
+        return latest
+
+    def write(self, cohort_df, matrices=None, metadata=None):
+        """Store the results of one run.
+
+        Parameters
+        ----------
+        cohort_df : Pandas DataFrame
+            Cohort details, for instance
+            ``CaterpillarDiagram.complete_cohort_df``. The index is
+            stored as the ``position`` of the cohort in its entity.
+            Columns other than ``data_index`` and
+            :data:`COHORT_COLUMNS` are not stored, a warning lists
+            them.
+        matrices : dictionary
+            7x7 DataFrames or arrays keyed by name
+        metadata : dictionary
+            JSON serializable details of the run
+
+        Returns
+        -------
+        run_id : int
+        """
+        n = len(cohort_df)
+        discarded = [
+            column
+            for column in cohort_df.columns
+            if column != "data_index" and column not in COHORT_COLUMNS
+        ]
+        if discarded:
+            logger.warning(f"Columns not stored in the result store: {discarded}")
+        if "data_index" in cohort_df:
+            data_index = _column(cohort_df["data_index"])
+        else:
+            data_index = [INDIVIDUAL] * n
+        columns = [
+            _column(cohort_df[column]) if column in cohort_df else [None] * n
+            for column in COHORT_COLUMNS
+        ]
+        rows = zip(data_index, _python(np.asarray(cohort_df.index)), *columns)
+        placeholders = ", ".join(["?"] * (len(COHORT_COLUMNS) + 3))
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (created, metadata) VALUES (?, ?)",
+                (
+                    datetime.now(timezone.utc).isoformat(),
+                    json.dumps(metadata or {}, default=str),
+                ),
+            )
+            run_id = cursor.lastrowid
+            while True:
+                batch = [(run_id, *row) for _, row in zip(range(self.batch_size), rows)]
+                if not batch:
+                    break
+                self.connection.executemany(
+                    f"INSERT INTO cohorts VALUES ({placeholders})", batch
+                )
+            for name, matrix in (matrices or {}).items():
+                self.connection.execute(
+                    "INSERT INTO matrices VALUES (?, ?, ?)",
+                    (
+                        run_id,
+                        name,
+                        json.dumps(np.asarray(matrix, dtype=np.float64).tolist()),
+                    ),
+                )
+        logger.info(f"Run {run_id} stored with {n} cohorts")
+        return run_id
+
+    def write_diagram(self, cd, metadata=None):
+        """Store the cohorts, matrices and settings of a diagram.
+
+        Parameters
+        ----------
+        cd : CaterpillarDiagram
+            Diagram after at least
+            :meth:`caterpillar.CaterpillarDiagram.color_schema`
+        metadata : dictionary
+            Additional details of the run
+
+        Returns
+        -------
+        run_id : int
+        """
+        matrices = {
+            name: getattr(cd, attribute).loc[COLORS, COLORS]
+            for name, attribute in DIAGRAM_MATRICES.items()
+            if getattr(cd, attribute, None) is not None
+        }
+        details = {
+            "relative": cd.relative,
+            "n_cohorts": cd.n_cohorts,
+            "horizon": cd.horizon,
+            "output_path": str(cd.output_path),
+        }
+        details.update(metadata or {})
+        return self.write(cd.complete_cohort_df, matrices=matrices, metadata=details)
+
+    def runs(self):
+        """Stored runs with their creation time and metadata"""
+        rows = self.connection.execute(
+            "SELECT run_id, created, metadata FROM runs ORDER BY run_id"
+        ).fetchall()
+        return pd.DataFrame(
+            [(run_id, created, json.loads(meta)) for run_id, created, meta in rows],
+            columns=["run_id", "created", "metadata"],
+        ).set_index("run_id")
+
+    def metadata(self, run_id=None):
+        """Metadata of a run, the latest by default"""
+        row = self.connection.execute(
+            "SELECT metadata FROM runs WHERE run_id = ?", (self._run_id(run_id),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown run {run_id}")
+        return json.loads(row[0])
+
+    def entities(self, run_id=None):
+        """``data_index`` of every entity of a run, in sorted order"""
+        rows = self.connection.execute(
+            "SELECT DISTINCT data_index FROM cohorts WHERE run_id = ?",
+            (self._run_id(run_id),),
+        ).fetchall()
+        return [None if row[0] == INDIVIDUAL else row[0] for row in rows]
+
+    def cohorts(self, data_index=None, run_id=None):
+        """Cohorts of one entity, read through the primary key.
+
+        Parameters
+        ----------
+        data_index : int or str
+            Entity, ``None`` for an individual analysis. Numpy scalars
+            are accepted.
+        run_id : int
+            Run, the latest by default
+
+        Returns
+        -------
+        cohort_df : Pandas DataFrame
+            Cohorts of the entity in order, indexed by their position
+        """
+        if data_index is None:
+            key = INDIVIDUAL
+        elif isinstance(data_index, np.generic):
+            # numpy scalars would be bound as BLOB and never match
+            key = data_index.item()
+        else:
+            key = data_index
+        rows = self.connection.execute(
+            f"SELECT position, {', '.join(COHORT_COLUMNS)} FROM cohorts "
+            "WHERE run_id = ? AND data_index = ? ORDER BY position",
+            (self._run_id(run_id), key),
+        ).fetchall()
+        cohort_df = pd.DataFrame.from_records(
+            rows, columns=["position"] + COHORT_COLUMNS
+        ).set_index("position")
+        cohort_df.index.name = None
+        if data_index is not None:
+            cohort_df.insert(3, "data_index", data_index)
+        missing = [c for c in _OPTIONAL_COLUMNS if cohort_df[c].isna().all()]
+        return cohort_df.drop(columns=missing)
+
+    def matrix(self, name, run_id=None):
+        """Stored 7x7 matrix, labelled by color"""
+        row = self.connection.execute(
+            "SELECT data FROM matrices WHERE run_id = ? AND name = ?",
+            (self._run_id(run_id), name),
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"No matrix '{name}' in run {run_id}")
+        return pd.DataFrame(json.loads(row[0]), index=COLORS, columns=COLORS)
@@ -0,0 +1,278 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import entity_codes, transition_codes
+from caterpillard.kernels import LEVELS, assign_radius, classify
+from caterpillard.markov import COLORS
+from caterpillard.ragged import RaggedPanel
+
+logger = logging.getLogger(__name__)
+
+# Color and level names indexed by n_color, None for observations that
+# do not complete a cohort yet
+_COLOR_NAMES = np.array([None] + COLORS, dtype=object)
+_LEVEL_NAMES = np.array([None] + LEVELS, dtype=object)
+
+# Columns of every emitted batch, named as in complete_cohort_df
+COLUMNS = [
+    "data_index",
+    "d11",
+    "d12",
+    "d2",
+    "color",
+    "level",
+    "n_color",
+    "d11_radius",
+    "d12_radius",
+    "final_cohort_radius",
+]
+
+
+class StreamingClassifier:
+    """Per-observation Caterpillar Diagram classifier for event feeds.
+
+    Observations arrive as ``(entity, value)`` pairs and the cohort
+    completed by every observation is classified as soon as it
+    arrives, with the rules of
+    :meth:`caterpillar.CaterpillarDiagram.schema` and the radius of
+    :meth:`caterpillar.CaterpillarDiagram.caterpillar_assign_radius`
+    under frozen thresholds.
+
+    The state is fixed per entity: the last two values, the number of
+    values seen and the last color, stored in compact arrays indexed
+    by a slot assigned to every entity on its first observation. The
+    arrays grow geometrically. The color transitions of every entity
+    are added in place to :attr:`transition_counts`.
+
+    :meth:`update_batch` processes micro-batches with vectorized
+    operations only, several observations of the same entity in one
+    batch are applied in their order of arrival.
+    """
+
+    def __init__(self, thresholds, capacity=1024) -> None:
+        """Constructor
+
+        Parameters
+        ----------
+        thresholds : dictionary
+            Frozen ``d11`` and ``d12`` radius thresholds, each with
+            ``min``, ``25%``, ``50%`` and ``75%`` values, for instance
+            the pooled ``CaterpillarDiagram.radius_thresholds``
+        capacity : int
+            Number of entities the state is allocated for
+        """
+        for diff in ["d11", "d12"]:
+            if diff not in thresholds or isinstance(thresholds[diff], pd.DataFrame):
+                raise ValueError(f"Pooled '{diff}' thresholds are required")
+        self.thresholds = {
+            diff: {
+                key: float(thresholds[diff][key])
+                for key in ["min", "25%", "50%", "75%"]
+            }
+            for diff in ["d11", "d12"]
+        }
+        self.entities = []
+        self._slots = {}
+        self._last = np.zeros(capacity, dtype=np.float64)
+        self._prev = np.zeros(capacity, dtype=np.float64)
+        self._n_seen = np.zeros(capacity, dtype=np.int64)
+        self._last_color = np.zeros(capacity, dtype=np.int8)
+        self.transition_counts = np.zeros((7, 7), dtype=np.int64)
+
+    @classmethod
+    def from_diagram(cls, cd, capacity=1024):
+        """Continue the stream of an analysed Caterpillar Diagram.
+
+        The thresholds are the ``radius_thresholds`` of ``cd``, the
+        state of every entity is seeded from the last two periods of
+        its input data and from its last cohort, and the transition
+        counts from its cohorts.
+
+        Parameters
+        ----------
+        cd : CaterpillarDiagram
+            Diagram after :meth:`caterpillar.CaterpillarDiagram.caterpillar_size`
+
+        Returns
+        -------
+        classifier : StreamingClassifier
+        """
+        if isinstance(cd.data, RaggedPanel):
+            raise TypeError("Seeding from a RaggedPanel is not supported")
+        classifier = cls(cd.radius_thresholds, capacity=capacity)
+
+        data = cd.data.fillna(value=0)
+        if isinstance(data, pd.Series):
+            # individual analysis, the single entity has no data_index
+            data = data.to_frame().T.set_axis([None])
+        entities = list(data.index)
+        slot = classifier._slots_of(entities)
+        values = data.to_numpy(dtype=np.float64)
+        classifier._last[slot] = values[:, -1]
+        classifier._prev[slot] = values[:, -2]
+        classifier._n_seen[slot] = values.shape[1]
+
+        cohort_df = cd.complete_cohort_df
+        entity, labels = entity_codes(cohort_df)
+        end = np.flatnonzero(np.r_[entity[1:] != entity[:-1], True][: len(entity)])
+        classifier._last_color[classifier._slots_of(list(labels))] = cohort_df[
+            "n_color"
+        ].to_numpy()[end]
+        _, from_code, to_code = transition_codes(cohort_df)
+        classifier.transition_counts += np.bincount(
+            from_code * 7 + to_code, minlength=49
+        ).reshape(7, 7)
+        return classifier
+
+    def __len__(self):
+        return len(self.entities)
+
+    @property
+    def nbytes(self):
+        """Memory taken by the per-entity state"""
+        return (
+            self._last.nbytes
+            + self._prev.nbytes
+            + self._n_seen.nbytes
+            + self._last_color.nbytes
+        )
+
+    @property
+    def transition_mat(self):
+        """Transition counts as a DataFrame"""
+        return pd.DataFrame(self.transition_counts, index=COLORS, columns=COLORS)
+
+    def _slots_of(self, entities):
+        """Slot of every entity, new entities get the next free slots"""
+        code, uniques = pd.factorize(np.asarray(entities), use_na_sentinel=False)
+        slots = np.fromiter(
+            (self._slots.get(key, -1) for key in uniques),
+            dtype=np.int64,
+            count=len(uniques),
+        )
+        new = np.flatnonzero(slots < 0)
+        if len(new):
+            n_old = len(self.entities)
+            slots[new] = np.arange(n_old, n_old + len(new))
+            for key, slot in zip(uniques[new], slots[new]):
+                self._slots[key] = int(slot)
+            self.entities.extend(uniques[new])
+            self._reserve(n_old + len(new))
+        return slots[code]
+
+    def _reserve(self, n_entities):
+        if n_entities <= len(self._last):
+            return
+        capacity = max(n_entities, 2 * len(self._last))
+        for name in ["_last", "_prev", "_n_seen", "_last_color"]:
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[: len(old)] = old
+            setattr(self, name, grown)
+
+    def _process(self, slot, values):
+        """Classify the observations and update the state in place"""
+        n = len(slot)
+        # observations of an entity become contiguous, in arrival order
+        order = np.argsort(slot, kind="stable")
+        s, v = slot[order], values[order]
+        position = np.arange(n)
+        first = np.r_[True, s[1:] != s[:-1]][:n]
+        last = np.r_[s[1:] != s[:-1], True][:n]
+        rank = position - np.maximum.accumulate(np.where(first, position, 0))
+        back1, back2 = np.maximum(position - 1, 0), np.maximum(position - 2, 0)
+
+        # the two previous values come from the batch or from the state
+        prev1 = np.where(rank >= 1, v[back1], self._last[s])
+        prev2 = np.where(
+            rank >= 2,
+            v[back2],
+            np.where(rank == 1, self._last[s], self._prev[s]),
+        )
+        valid = self._n_seen[s] + rank >= 2
+        d11 = np.where(valid, prev1 - prev2, np.nan)
+        d12 = np.where(valid, v - prev1, np.nan)
+        d2 = d12 - d11
+        n_color = classify(d11, d12, d2)
+
+        previous_color = np.where(rank >= 1, n_color[back1], self._last_color[s])
+        counted = (n_color > 0) & (previous_color > 0)
+        self.transition_counts += np.bincount(
+            (previous_color[counted] - 1) * 7 + (n_color[counted] - 1), minlength=49
+        ).reshape(7, 7)
+
+        end = s[last]
+        self._prev[end] = prev1[last]
+        self._last[end] = v[last]
+        self._n_seen[end] += np.diff(np.r_[-1, np.flatnonzero(last)])
+        self._last_color[end] = np.where(
+            n_color[last] > 0, n_color[last], self._last_color[end]
+        )
+
+        d11_radius = assign_radius(np.abs(d11), self.thresholds["d11"])
+        d12_radius = assign_radius(np.abs(d12), self.thresholds["d12"])
+        result = {
+            "d11": d11,
+            "d12": d12,
+            "d2": d2,
+            "n_color": n_color,
+            "d11_radius": d11_radius,
+            "d12_radius": d12_radius,
+            "final_cohort_radius": (d11_radius + d12_radius) / 2,
+        }
+        # back to the order of arrival
+        inverse = np.empty(n, dtype=np.int64)
+        inverse[order] = position
+        return {key: value[inverse] for key, value in result.items()}
+
+    def update_batch(self, entities, values):
+        """Classify a micro-batch of observations.
+
+        Parameters
+        ----------
+        entities : array-like
+            Entity (``data_index``) of every observation
+        values : array-like
+            Observed values, missing values are taken as zero as in
+            :meth:`caterpillar.CaterpillarDiagram.data_summary`
+
+        Returns
+        -------
+        cohorts : Pandas DataFrame
+            One row per observation, in order of arrival, with the
+            columns of ``CaterpillarDiagram.complete_cohort_df``.
+            Observations that do not complete a cohort yet (the
+            first two of an entity) have ``n_color`` 0 and missing
+            color, differences and radii.
+        """
+        values = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+        if len(values) != len(entities):
+            raise ValueError("entities and values should have the same length")
+        result = self._process(self._slots_of(entities), values)
+        result["data_index"] = np.asarray(entities)
+        result["color"] = _COLOR_NAMES[result["n_color"]]
+        result["level"] = _LEVEL_NAMES[result["n_color"]]
+        return pd.DataFrame(result, columns=COLUMNS)
+
+    def update(self, entity, value):
+        """Classify a single observation.
+
+        Returns
+        -------
+        cohort : dictionary
+            Same fields as a row of :meth:`update_batch`
+        """
+        slot = self._slots.get(entity)
+        if slot is None:
+            slot = self._slots_of([entity])[0]
+        value = 0.0 if value is None or np.isnan(value) else float(value)
+        result = self._process(
+            np.array([slot], dtype=np.int64), np.array([value], dtype=np.float64)
+        )
+        cohort = {key: column[0].item() for key, column in result.items()}
+        cohort["data_index"] = entity
+        cohort["color"] = _COLOR_NAMES[cohort["n_color"]]
+        cohort["level"] = _LEVEL_NAMES[cohort["n_color"]]
+        return {key: cohort[key] for key in COLUMNS}
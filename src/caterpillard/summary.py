@@ -0,0 +1,161 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.grouping import entity_codes
+from caterpillard.kernels import color_names
+from caterpillard.markov import COLORS
+
+logger = logging.getLogger(__name__)
+
+
+def entity_summary(cohort_df, window=10):
+    """Compact summary with one row per entity.
+
+    Every column is evaluated for all entities at once from the
+    integer entity and color codes, with ``np.bincount`` and index
+    arithmetic instead of a group-by.
+
+    Parameters
+    ----------
+    cohort_df : Pandas DataFrame
+        Cohort details, for instance
+        ``CaterpillarDiagram.complete_cohort_df``
+    window : int
+        Number of last cohorts counted in the ``<color>_recent``
+        columns
+
+    Returns
+    -------
+    summary : Pandas DataFrame
+        Indexed by ``data_index`` with columns
+
+        * ``n_cohorts`` and ``last_cohort``
+        * ``latest_color`` and ``run_length``, the number of last
+          consecutive cohorts (within a segment) with that color
+        * ``<color>_count`` and ``<color>_recent``, the number of
+          cohorts of every color over all and the last ``window``
+          cohorts
+        * ``mean_radius`` and ``last_radius`` when the cohorts have
+          a ``final_cohort_radius``
+    """
+    entity, entities = entity_codes(cohort_df)
+    code = cohort_df["n_color"].to_numpy(dtype=np.int64) - 1
+    n, n_entities = len(code), len(entities)
+    position = np.arange(n)
+
+    new_entity = np.r_[True, entity[1:] != entity[:-1]][:n]
+    end = np.flatnonzero(np.r_[entity[1:] != entity[:-1], True][:n])
+    from_end = end[np.cumsum(new_entity) - 1] - position
+
+    # a run restarts at every new entity, segment or color
+    new_run = new_entity | np.r_[True, code[1:] != code[:-1]][:n]
+    if "segment" in cohort_df:
+        segment = cohort_df["segment"].to_numpy()
+        new_run[1:] |= segment[1:] != segment[:-1]
+    run_start = np.maximum.accumulate(np.where(new_run, position, 0))
+
+    valid = code >= 0
+    counts = np.bincount(
+        entity[valid] * 7 + code[valid], minlength=n_entities * 7
+    ).reshape(-1, 7)
+    recent = valid & (from_end < window)
+    recent_counts = np.bincount(
+        entity[recent] * 7 + code[recent], minlength=n_entities * 7
+    ).reshape(-1, 7)
+
+    summary = pd.DataFrame(
+        {
+            "n_cohorts": np.diff(np.r_[0, end + 1]),
+            "last_cohort": cohort_df["Cohort"].to_numpy()[end],
+            "latest_color": color_names(code[end] + 1),
+            "run_length": end - run_start[end] + 1,
+        },
+        index=pd.Index(entities, name="data_index"),
+    )
+    for i, color in enumerate(COLORS):
+        summary[f"{color}_count"] = counts[:, i]
+    for i, color in enumerate(COLORS):
+        summary[f"{color}_recent"] = recent_counts[:, i]
+
+    if "final_cohort_radius" in cohort_df:
+        radius = cohort_df["final_cohort_radius"].to_numpy(dtype=np.float64)
+        finite = np.isfinite(radius)
+        total = np.bincount(
+            entity[finite], weights=radius[finite], minlength=n_entities
+        )
+        n_finite = np.bincount(entity[finite], minlength=n_entities)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            summary["mean_radius"] = total / n_finite
+        summary["last_radius"] = radius[end]
+
+    logger.debug(f"Summary evaluated for {n_entities} entities")
+    return summary
+
+
+def _matches(column, condition):
+    if callable(condition):
+        return np.asarray(condition(column), dtype=bool)
+    if isinstance(condition, tuple):
+        low, high = condition
+        mask = np.ones(len(column), dtype=bool)
+        if low is not None:
+            mask &= column >= low
+        if high is not None:
+            mask &= column <= high
+        return mask
+    if isinstance(condition, (list, set, frozenset)):
+        return np.isin(column, list(condition))
+    return column == condition
+
+
+def select(summary, by=None, k=None, ascending=False, **filters):
+    """Filter and rank the entities of :func:`entity_summary`.
+
+    Parameters
+    ----------
+    summary : Pandas DataFrame
+        Output of :func:`entity_summary`
+    by : str
+        Column to rank on
+    k : int
+        Keep only the first ``k`` entities of the ranking, selected
+        with ``np.argpartition``
+    ascending : bool
+        Rank the smallest values first
+    filters : dict
+        Column conditions combined with *and*. A condition is a
+        value (equality), a ``(low, high)`` tuple of inclusive
+        bounds where ``None`` leaves a side open, a list or set of
+        accepted values, or a callable returning a boolean mask.
+
+    Returns
+    -------
+    selection : Pandas DataFrame
+        For instance ``select(summary, latest_color="red")`` gives
+        the entities currently red and ``select(summary,
+        by="mean_radius", k=10, green_recent=(3, None))`` the ten
+        largest mean radii among the entities with at least three
+        green cohorts in the last ``window`` cohorts.
+    """
+    mask = np.ones(len(summary), dtype=bool)
+    for column, condition in filters.items():
+        if column not in summary:
+            raise ValueError(f"Unknown summary column '{column}'")
+        mask &= _matches(summary[column].to_numpy(), condition)
+    rows = np.flatnonzero(mask)
+
+    if by is not None:
+        values = summary[by].to_numpy(dtype=np.float64)[rows]
+        values = values if ascending else -values
+        # missing values are ranked last
+        values = np.where(np.isnan(values), np.inf, values)
+        if k is not None and k < len(rows):
+            chosen = np.argpartition(values, max(k - 1, 0))[: max(k, 0)]
+        else:
+            chosen = np.arange(len(rows))
+        rows = rows[chosen[np.argsort(values[chosen], kind="stable")]]
+    elif k is not None:
+        rows = rows[:k]
+    return summary.iloc[rows]
@@ -0,0 +1,80 @@
+from xml.sax.saxutils import escape
+
+# Vertical position of the cohort labels, as in
+# :meth:`caterpillar.CaterpillarDiagram.generate`
+LABEL_Y = -18
+MARGIN = 2
+
+
+def _num(value):
+    return f"{float(value):.6g}"
+
+
+def render_svg(geometry, labels=True, scale=10):
+    """Draw a Caterpillar Diagram as an SVG document.
+
+    Only the standard library is used, so the diagram can be drawn
+    without importing matplotlib. Coordinates are the data units of
+    the geometry with the y-axis pointing upwards, as in the
+    matplotlib figure.
+
+    Parameters
+    ----------
+    geometry : dictionary
+        ``cx``, ``lx_s``, ``lx_e``, ``radii`` and ``colors`` of the
+        diagram, see :func:`caterpillard.geometry.caterpillar_geometry`
+    labels : bool
+        Draw the cohort and radius labels
+    scale : float
+        Pixels per data unit of the rendered image
+
+    Returns
+    -------
+    svg : str
+    """
+    cx, radii, colors = geometry["cx"], geometry["radii"], geometry["colors"]
+    if len(cx) == 0:
+        return '<svg xmlns="http://www.w3.org/2000/svg" width="0" height="0"/>'
+
+    max_radius = max(radii)
+    x_min = cx[0] - radii[0] - MARGIN
+    x_max = cx[-1] + radii[-1] + MARGIN
+    y_top = max_radius + MARGIN
+    y_bottom = (-LABEL_Y if labels else max_radius) + MARGIN
+    width, height = x_max - x_min, y_top + y_bottom
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" '
+        f'width="{_num(width * scale)}" height="{_num(height * scale)}" '
+        f'viewBox="{_num(x_min)} {_num(-y_top)} {_num(width)} {_num(height)}">',
+        f'<rect x="{_num(x_min)}" y="{_num(-y_top)}" width="{_num(width)}" '
+        f'height="{_num(height)}" fill="white"/>',
+    ]
+    for start, end in zip(geometry["lx_s"], geometry["lx_e"]):
+        parts.append(
+            f'<line x1="{_num(start)}" y1="0" x2="{_num(end)}" y2="0" '
+            f'stroke="black" stroke-width="0.1"/>'
+        )
+    for i, (x, radius, color) in enumerate(zip(cx, radii, colors)):
+        parts.append(
+            f'<circle cx="{_num(x)}" cy="0" r="{_num(radius)}" '
+            f'fill="{escape(str(color))}"/>'
+        )
+        if labels:
+            parts.append(
+                f'<text x="{_num(x - 1)}" y="-1" font-size="1" '
+                f'font-family="Palatino Linotype, serif">R={radius}</text>'
+            )
+            parts.append(
+                f'<text transform="translate({_num(x - 0.5)} {-LABEL_Y}) '
+                f'rotate(-90)" font-size="1.4" '
+                f'font-family="Palatino Linotype, serif">Cohort {i + 1}</text>'
+            )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def write_svg(geometry, path, labels=True, scale=10):
+    """Write :func:`render_svg` output to ``path``"""
+    with open(path, "w") as f:
+        f.write(render_svg(geometry, labels=labels, scale=scale))
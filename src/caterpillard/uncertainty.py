@@ -0,0 +1,126 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from caterpillard.markov import COLORS, stationary_power, transition_probabilities
+from caterpillard.parallel import chunk_sizes, map_chunks, spawn_seeds
+
+logger = logging.getLogger(__name__)
+
+
+def _resample_chunk(counts, n_replicates, method, prior, n_sim_iter, seed):
+    """Draw ``n_replicates`` transition matrices and their stationary matrices."""
+    rng = np.random.default_rng(seed)
+    shape = (n_replicates,) + counts.shape
+
+    if method == "dirichlet":
+        # Normalised independent gamma draws are Dirichlet distributed
+        draws = rng.standard_gamma(np.broadcast_to(counts + prior, shape))
+    else:
+        draws = rng.multinomial(
+            counts.sum(axis=1).astype(np.int64),
+            transition_probabilities(counts),
+            size=shape[:2],
+        )
+
+    prob = transition_probabilities(draws)
+    return prob, stationary_power(prob, n_sim_iter)
+
+
+def resample_transition_matrices(
+    transition_mat,
+    n_replicates=2000,
+    ci=0.95,
+    method="dirichlet",
+    prior=0.5,
+    n_sim_iter=10 ** 4,
+    seed=None,
+    chunk_size=1000,
+    n_workers=1,
+):
+    """Percentile bands for the transition and stationary matrices.
+
+    Thousands of transition matrices are drawn at once from the
+    count matrix, either from the Dirichlet posterior of every row
+    (``method="dirichlet"``, counts plus a symmetric ``prior``) or by
+    a parametric bootstrap that redraws the observed number of
+    transitions out of every color (``method="bootstrap"``). The
+    stationary matrices of all replicates of a chunk are evaluated
+    in one batched call to
+    :func:`caterpillard.markov.stationary_power`.
+
+    Chunks of ``chunk_size`` replicates are seeded from
+    ``numpy.random.SeedSequence(seed)`` and may run in a process
+    pool without changing the results.
+
+    Parameters
+    ----------
+    transition_mat : Pandas DataFrame
+        Transition counts, for instance
+        ``CaterpillarDiagram.transition_mat``
+    n_replicates : int
+        Number of resampled transition matrices
+    ci : float
+        Width of the percentile band, between 0 and 1
+    method : str
+        ``dirichlet`` or ``bootstrap``
+    prior : float
+        Dirichlet concentration added to every count. Only used
+        when ``method`` is ``dirichlet``.
+    n_sim_iter : int
+        Number of iterations for the stationary matrices
+    seed : int
+        Seed for reproducible results
+    chunk_size : int
+        Number of replicates drawn together
+    n_workers : int
+        Number of worker processes. ``None`` uses every CPU.
+
+    Returns
+    -------
+    bands : dictionary
+        ``transition`` and ``stationary`` each map ``lower``,
+        ``median`` and ``upper`` to a DataFrame with one percentile
+        per cell.
+    """
+    if method not in ["dirichlet", "bootstrap"]:
+        raise ValueError("method should be either 'dirichlet' or 'bootstrap'")
+    if not 0 < ci < 1:
+        raise ValueError("ci should lie between 0 and 1")
+    if not isinstance(n_replicates, int) or n_replicates <= 0:
+        raise ValueError("n_replicates must be a positive integer")
+    if not isinstance(n_sim_iter, int) or n_sim_iter < 1:
+        raise ValueError("n_sim_iter must be a positive integer")
+    if method == "dirichlet" and prior < 0:
+        raise ValueError("prior must be non-negative")
+
+    if isinstance(transition_mat, pd.DataFrame):
+        labels = list(transition_mat.columns)
+    else:
+        labels = COLORS
+    counts = np.asarray(transition_mat, dtype=np.float64)
+
+    sizes = chunk_sizes(n_replicates, chunk_size)
+    seeds = spawn_seeds(seed, len(sizes))
+    tasks = [
+        (counts, size, method, prior, n_sim_iter, child)
+        for size, child in zip(sizes, seeds)
+    ]
+    logger.debug(f"Drawing {n_replicates} transition matrices ({method})")
+    results = map_chunks(_resample_chunk, tasks, n_workers=n_workers)
+
+    tail = (1 - ci) / 2 * 100
+    percentiles = [tail, 50, 100 - tail]
+    bands = {}
+    for position, name in enumerate(["transition", "stationary"]):
+        replicates = np.concatenate([r[position] for r in results], axis=0)
+        lower, median, upper = np.percentile(replicates, percentiles, axis=0)
+        bands[name] = {
+            key: pd.DataFrame(value, index=labels, columns=labels)
+            for key, value in zip(
+                ["lower", "median", "upper"], [lower, median, upper]
+            )
+        }
+
+    return bands
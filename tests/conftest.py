@@ -0,0 +1,48 @@
+import pytest
+import pandas as pd
+import importlib.resources
+from caterpillard import CaterpillarDiagram
+
+
+@pytest.fixture
+def test_data():
+    test_file_path_str = str(
+        importlib.resources.files("tests").joinpath("test_data.csv")
+    )
+    data = pd.read_csv((test_file_path_str), index_col=[0])
+    return data
+
+
+# Stages run by the diagram fixture after data_summary and color_schema
+DIAGRAM_STAGES = ("caterpillar_size", "schema_transitions", "stationary_matrix")
+
+
+@pytest.fixture
+def make_diagram(test_data, tmp_path):
+    """
+    Factory of relative diagrams, run through ``color_schema`` and
+    the given stages
+    """
+
+    def make(data=20, stages=DIAGRAM_STAGES, output_path=None, thresholds=None):
+        if isinstance(data, int):
+            data = test_data.iloc[:data]
+        cd = CaterpillarDiagram(
+            data=data, relative=True, output_path=str(output_path or tmp_path)
+        )
+        cd.data_summary()
+        cd.color_schema()
+        if "caterpillar_size" in stages:
+            cd.caterpillar_size(thresholds=thresholds)
+        if "schema_transitions" in stages:
+            cd.schema_transitions()
+        if "stationary_matrix" in stages:
+            cd.stationary_matrix(n_sim_iter=50)
+        return cd
+
+    return make
+
+
+@pytest.fixture
+def diagram(make_diagram):
+    return make_diagram()
@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+from caterpillard import CaterpillarDiagram
+from caterpillard.backtest import RollingBacktest
+from caterpillard.grouping import transition_codes
+from caterpillard.markov import transition_probabilities
+from caterpillard.model import cohorts_of
+import os
+
+
+def test_cut_offs_match_rebuilt_chains(test_data):
+    data = test_data.iloc[:40]
+    backtest = RollingBacktest(data, max_horizon=3, first_origin=2)
+    codes = cohorts_of(data)["n_color"].to_numpy().reshape(len(data), -1) - 1
+
+    for k in [2, 7, data.shape[1] - 6]:
+        origin = data.columns[k + 2]
+        # chain rebuilt from the data known at the cut-off
+        _, from_code, to_code = transition_codes(cohorts_of(data.iloc[:, : k + 3]))
+        counts = np.bincount(from_code * 7 + to_code, minlength=49).reshape(7, 7)
+        np.testing.assert_array_equal(backtest.transition_mat(origin), counts)
+
+        prob = transition_probabilities(counts)
+        prob[prob.sum(axis=1) == 0] = np.eye(7)[prob.sum(axis=1) == 0]
+        for h in [1, 2, 3]:
+            forecast = np.linalg.matrix_power(prob, h)[codes[:, k]]
+            actual = codes[:, k + h]
+            scores = backtest.by_origin.loc[(h, origin)]
+            assert scores["accuracy"] == pytest.approx(
+                (forecast.argmax(axis=1) == actual).mean()
+            )
+            p_actual = np.clip(forecast[np.arange(len(data)), actual], 1e-15, 1)
+            assert scores["log_loss"] == pytest.approx(-np.log(p_actual).mean())
+
+
+def test_summary_and_confusion(test_data):
+    data = test_data.iloc[:40]
+    backtest = RollingBacktest(data, max_horizon=2)
+    n_cohorts = data.shape[1] - 2
+    assert list(backtest.summary.index) == [1, 2]
+    for h in [1, 2]:
+        n_origins = n_cohorts - 1 - h
+        assert backtest.summary.loc[h, "n"] == 40 * n_origins
+        assert backtest.confusion[h].to_numpy().sum() == 40 * n_origins
+        hits = np.trace(backtest.confusion[h].to_numpy())
+        assert backtest.summary.loc[h, "accuracy"] == pytest.approx(
+            hits / (40 * n_origins)
+        )
+        assert backtest.summary.loc[h, "accuracy"] == pytest.approx(
+            backtest.by_origin.loc[h, "accuracy"].mean()
+        )
+    smoothed = RollingBacktest(data, max_horizon=2, alpha=1.0)
+    assert np.isfinite(smoothed.summary["log_loss"]).all()
+    with pytest.raises(ValueError):
+        RollingBacktest(data, first_origin=0)
+
+
+def test_diagram_backtest(test_data, tmp_path):
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:10], relative=True, output_path=str(tmp_path), horizon=10
+    )
+    summary = cd.backtest(max_horizon=2)
+    assert summary.loc[1, "n"] == 10 * 8
+    assert cd.rolling_backtest.origins[0] == test_data.columns[-9]
+    assert os.path.exists(tmp_path / "backtest_summary.csv")
+
+    series = CaterpillarDiagram(
+        test_data.iloc[0], relative=False, output_path=str(tmp_path)
+    )
+    assert series.backtest(max_horizon=1).loc[1, "n"] == test_data.shape[1] - 4
@@ -264,3 +264,50 @@ def test_input_dataseries_numeric():
             data=test_data.astype(str), relative=False, output_path=None,
         )
 
+
+def test_per_entity_radius_matches_individual(test_data, tmp_path):
+    """
+    Radii with per-entity thresholds must match an individual
+    analysis of every row
+    """
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:5], relative=True, output_path=str(tmp_path),
+    )
+    cd.color_schema()
+    cd.caterpillar_size(per_entity=True)
+    assert list(cd.radius_thresholds["d11"].index) == list(test_data.index[:5])
+
+    for data_index in test_data.index[:5]:
+        single = CaterpillarDiagram(
+            data=test_data.loc[data_index], relative=False, output_path=str(tmp_path),
+        )
+        single.color_schema()
+        single.caterpillar_size()
+        ccd = cd.complete_cohort_df
+        chosen = ccd[ccd["data_index"] == data_index]
+        for col in ["d11_radius", "d12_radius", "final_cohort_radius"]:
+            np.testing.assert_array_equal(
+                chosen[col].to_numpy(), single.complete_cohort_df[col].to_numpy()
+            )
+
+
+def test_pooled_radius_matches_vectorized(test_data, tmp_path):
+    """
+    The vectorized radius kernel must reproduce the pooled radii
+    """
+    from caterpillard.kernels import assign_radius, radius_thresholds
+
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:10], relative=True, output_path=str(tmp_path),
+    )
+    cd.color_schema()
+    cd.caterpillar_size()
+    for col in ["d11", "d12"]:
+        abs_diff = cd.complete_cohort_df[col].abs().to_numpy()
+        thresholds = radius_thresholds(abs_diff)
+        for key, value in thresholds.items():
+            assert value == pytest.approx(cd.radius_thresholds[col][key])
+        np.testing.assert_array_equal(
+            assign_radius(abs_diff, thresholds),
+            cd.complete_cohort_df[f"{col}_radius"].to_numpy(),
+        )
@@ -0,0 +1,69 @@
+import os
+import json
+import shutil
+import pytest
+from pathlib import Path
+from caterpillard.cli import main, SUCCESS_MARKER
+import importlib.resources
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    test_file_path_str = str(
+        importlib.resources.files("tests").joinpath("test_data.csv")
+    )
+    paths = []
+    for name in ["a", "b"]:
+        (tmp_path / name).mkdir()
+        paths.append(tmp_path / name / "panel.csv")
+        shutil.copy(test_file_path_str, paths[-1])
+    return paths
+
+
+def run(capsys, *argv):
+    code = main([str(arg) for arg in argv])
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return code, records
+
+
+def test_cli_separate_outputs_and_resume(input_files, tmp_path, capsys):
+    """
+    Inputs sharing a file name must get separate output directories
+    and completed inputs must be skipped on a second run
+    """
+    out = tmp_path / "out"
+    argv = [str(tmp_path / "*" / "panel.csv"), "-o", out, "-j", 2]
+    argv += ["--n-sim-iter", 5, "--n-last-cohorts", 5]
+    code, records = run(capsys, *argv)
+
+    assert code == 0
+    assert [r["status"] for r in records] == ["ok", "ok"]
+    assert len({r["output"] for r in records}) == 2
+    for record in records:
+        assert "color_schema" in record["stages"]
+        assert (Path(record["output"]) / SUCCESS_MARKER).exists()
+
+    code, records = run(capsys, *argv)
+    assert [r["status"] for r in records] == ["skipped", "skipped"]
+
+
+def test_cli_reports_errors(tmp_path, capsys):
+    bad = tmp_path / "bad.csv"
+    bad.write_text("country,1970\n4,1\n")
+    code, records = run(capsys, bad, "-o", tmp_path / "out")
+    assert code == 1
+    assert records[0]["status"] == "error"
+    assert not (tmp_path / "out" / "bad" / SUCCESS_MARKER).exists()
+
+
+def _dead_worker(input_path, out_dir, **kwargs):
+    os._exit(1)
+
+
+def test_cli_reports_dead_workers(input_files, tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr("caterpillard.cli.run_pipeline", _dead_worker)
+    code, records = run(capsys, *input_files, "-o", tmp_path / "out", "-j", 2)
+    assert code == 1
+    assert [r["status"] for r in records] == ["error", "error"]
+    assert {r["input"] for r in records} == {str(path) for path in input_files}
+    assert all("BrokenProcessPool" in r["error"] for r in records)
@@ -0,0 +1,85 @@
+import pytest
+import numpy as np
+from caterpillard import CaterpillarDiagram
+from caterpillard.clustering import (
+    entity_transition_probabilities,
+    k_medoids,
+    pairwise_distances,
+)
+import os
+
+
+def _reference(p, q, metric):
+    p, q = p.reshape(7, 7), q.reshape(7, 7)
+    if metric == "hellinger":
+        return np.sqrt(((np.sqrt(p) - np.sqrt(q)) ** 2).sum() / 14)
+    m = (p + q) / 2
+    divergence = 0.0
+    for a in [p, q]:
+        mask = a > 0
+        divergence += (a[mask] * np.log2(a[mask] / m[mask])).sum()
+    return np.sqrt(divergence / 14)
+
+
+@pytest.mark.parametrize("metric", ["js", "hellinger"])
+def test_blocked_distances_match_reference(metric):
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 4, size=(30, 7, 7)).astype(np.float64)
+    probabilities = (counts / np.maximum(counts.sum(axis=2, keepdims=True), 1)).reshape(
+        -1, 49
+    )
+    # small budget, so the rows are split into many blocks
+    distances = pairwise_distances(probabilities, metric=metric, memory_budget=10 ** 5)
+    expected = np.array(
+        [[_reference(p, q, metric) for q in probabilities] for p in probabilities]
+    )
+    np.testing.assert_allclose(distances, expected, atol=1e-6)
+    np.testing.assert_allclose(distances, distances.T, atol=1e-6)
+
+    nearest, nearest_distances = pairwise_distances(
+        probabilities, metric=metric, k=4, memory_budget=10 ** 5, n_workers=2
+    )
+    np.fill_diagonal(expected, np.inf)
+    np.testing.assert_allclose(
+        nearest_distances, np.sort(expected, axis=1)[:, :4], atol=1e-6
+    )
+    assert (nearest != np.arange(30)[:, None]).all()
+
+
+def test_k_medoids_separates_groups():
+    points = np.r_[np.zeros(5), np.full(5, 10.0)] + np.arange(10) * 0.1
+    distances = np.abs(points[:, None] - points[None, :])
+    labels, medoids, inertia = k_medoids(distances, 2, seed=1)
+    assert len(set(labels[:5])) == 1 and len(set(labels[5:])) == 1
+    assert labels[0] != labels[9]
+    assert inertia == pytest.approx(distances[np.arange(10), medoids[labels]].sum())
+    with pytest.raises(ValueError):
+        k_medoids(distances, 11)
+
+
+def test_diagram_clusters_and_neighbours(test_data, tmp_path):
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:40],
+        relative=True,
+        output_path=str(tmp_path),
+    )
+    cd.data_summary()
+    cd.color_schema()
+    entities, probabilities = entity_transition_probabilities(cd.complete_cohort_df)
+    assert list(entities) == list(test_data.index[:40])
+    rows = probabilities.reshape(-1, 7, 7).sum(axis=2)
+    assert np.isin(np.round(rows, 12), [0, 1]).all()
+
+    clusters = cd.cluster_entities(3, metric="hellinger", seed=0)
+    assert clusters.nunique() == 3
+    assert set(cd.cluster_medoids) <= set(entities)
+    assert cd.entity_distance_mat.shape == (40, 40)
+    assert os.path.exists(tmp_path / "entity_clusters.csv")
+
+    nearest = cd.nearest_entities(k=3, metric="hellinger")
+    assert len(nearest) == 40 * 3
+    first = nearest[nearest["data_index"] == entities[0]]
+    expected = cd.entity_distance_mat.loc[entities[0]].drop(entities[0])
+    np.testing.assert_allclose(
+        first["distance"], np.sort(expected.to_numpy())[:3], atol=1e-6
+    )
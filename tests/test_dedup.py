@@ -0,0 +1,67 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram
+from caterpillard.dedup import dedup_stats, row_groups, unique_apply
+
+
+def test_row_groups():
+    values = np.array(
+        [
+            [1.0, 2.0, 4.0],
+            [5.0, 5.0, 5.0],
+            [1.0, 2.0, 4.0],
+            [0.0, 0.0, 0.0],
+            [-0.0, 1.0, 1.0],
+            [0.0, 1.0, 1.0],
+            [np.inf, np.inf, np.inf],
+            [1.0, 2.0, 4.0],
+        ]
+    )
+    representative, constant = row_groups(values)
+    np.testing.assert_array_equal(representative, [0, 1, 0, 1, 4, 5, 6, 0])
+    np.testing.assert_array_equal(
+        constant, [False, True, False, True, False, False, False, False]
+    )
+    stats = dedup_stats(representative, constant)
+    assert stats["n_unique"] == 5
+    assert stats["n_constant"] == 2
+    assert stats["dedup_ratio"] == pytest.approx(3 / 8)
+
+
+def test_deduplicated_schema_is_identical(test_data, tmp_path):
+    data = pd.concat([test_data.iloc[:30]] + [test_data.iloc[:10]] * 3)
+    data.index = [f"entity{i}" for i in range(len(data))]
+    data.iloc[3] = np.nan
+    data.iloc[8] = 2.5
+
+    diagrams = []
+    for deduplicate in [True, False]:
+        cd = CaterpillarDiagram(data, relative=True, output_path=str(tmp_path))
+        cd.color_schema(deduplicate=deduplicate)
+        cd.caterpillar_size()
+        cd.schema_transitions()
+        diagrams.append(cd)
+    fast, slow = diagrams
+
+    pd.testing.assert_frame_equal(fast.complete_cohort_df, slow.complete_cohort_df)
+    pd.testing.assert_frame_equal(fast.transition_mat, slow.transition_mat)
+    assert fast.transition_count == slow.transition_count
+    # distinct series counted once per entity sharing them, with the
+    # keys in the same order as a count over every cohort
+    for within_entities in [False, True]:
+        fast.schema_transitions(within_entities=within_entities)
+        expected = fast._transition_count(within_entities)
+        assert list(fast.transition_count.items()) == list(expected.items())
+    # the copies of the two overwritten rows form their own groups
+    assert fast.dedup_stats["n_unique"] == 31
+    assert fast.dedup_stats["n_constant"] == 2
+    assert slow.dedup_stats["dedup_ratio"] == 0
+    grey = fast.complete_cohort_df[fast.complete_cohort_df["data_index"] == "entity3"]
+    assert (grey["color"] == "grey").all()
+
+
+def test_unique_apply_matches_apply():
+    series = pd.Series([0.5, -1.0, 0.5, np.nan, 3.0, -1.0], index=[0, 1, 0, 1, 2, 2])
+    func = lambda x: -1 if np.isnan(x) else int(abs(x) * 2)
+    pd.testing.assert_series_equal(unique_apply(series, func), series.apply(func))
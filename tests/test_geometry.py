@@ -0,0 +1,53 @@
+import subprocess
+import sys
+import numpy as np
+from caterpillard.geometry import entity_geometries, geometry_of, save_geometries
+from caterpillard.svg import render_svg, write_svg
+
+
+def test_geometry_matches_generate(diagram):
+    data_index = int(diagram.complete_cohort_df["data_index"].iloc[0])
+    geometry = diagram.geometry(data_index=data_index, n_last_cohorts=5)
+    diagram.generate(data_index=data_index, n_last_cohorts=5)
+
+    np.testing.assert_allclose(geometry["cx"], diagram.cx)
+    np.testing.assert_allclose(geometry["lx_s"], diagram.lx_s)
+    np.testing.assert_allclose(geometry["lx_e"], diagram.lx_e)
+
+
+def test_entity_geometries_match_single(diagram, tmp_path):
+    geometries = entity_geometries(diagram.complete_cohort_df, n_last_cohorts=4)
+    for i, data_index in enumerate(geometries["data_index"]):
+        single = diagram.geometry(data_index=int(data_index), n_last_cohorts=4)
+        batch = geometry_of(geometries, i)
+        np.testing.assert_allclose(batch["cx"], single["cx"])
+        np.testing.assert_allclose(batch["lx_e"], single["lx_e"])
+        assert batch["colors"] == single["colors"]
+
+    save_geometries(geometries, tmp_path / "geometry.npz")
+    loaded = np.load(tmp_path / "geometry.npz")
+    np.testing.assert_array_equal(loaded["offsets"], geometries["offsets"])
+
+
+def test_svg_has_every_cohort(diagram, tmp_path):
+    data_index = int(diagram.complete_cohort_df["data_index"].iloc[0])
+    geometry = diagram.geometry(data_index=data_index)
+    svg = render_svg(geometry)
+
+    assert svg.count("<circle") == diagram.n_cohorts
+    assert svg.count("<line") == diagram.n_cohorts - 1
+    assert f"Cohort {diagram.n_cohorts}" in svg
+
+    write_svg(geometry, tmp_path / "caterpillar.svg")
+    assert (tmp_path / "caterpillar.svg").read_text() == svg
+
+
+def test_geometry_does_not_import_matplotlib():
+    code = (
+        "import sys, caterpillard.caterpillar, caterpillard.geometry, "
+        "caterpillard.svg; print('matplotlib' in sys.modules)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "False"
@@ -0,0 +1,63 @@
+import numpy as np
+from caterpillard.grouping import group_transition_counts, rollup
+from caterpillard.markov import stationary_power, transition_probabilities
+
+
+def test_group_counts_match_single_entity(diagram):
+    """
+    Counts of a one-entity group must equal the transitions of that
+    entity alone
+    """
+    cohorts = diagram.complete_cohort_df
+    group_by = {idx: idx for idx in cohorts["data_index"].unique()}
+    keys, counts = group_transition_counts(cohorts, group_by)
+
+    for key, count in zip(keys, counts):
+        codes = cohorts.loc[cohorts["data_index"] == key, "n_color"].to_numpy() - 1
+        expected = np.zeros((7, 7), dtype=int)
+        np.add.at(expected, (codes[:-1], codes[1:]), 1)
+        np.testing.assert_array_equal(count, expected)
+
+
+def test_rollup_reuses_child_counts():
+    counts = np.arange(3 * 49).reshape(3, 7, 7)
+    keys = [("north", "a"), ("north", "b"), ("south", "a")]
+    parent_keys, parent_counts = rollup(keys, counts)
+    assert parent_keys == [("north",), ("south",), ()]
+    np.testing.assert_array_equal(parent_counts[0], counts[0] + counts[1])
+    np.testing.assert_array_equal(parent_counts[2], counts.sum(axis=0))
+
+
+def test_grouped_pipeline(diagram):
+    index = diagram.complete_cohort_df["data_index"].unique()
+    group_by = {
+        idx: ("north" if i % 2 else "south", i % 3) for i, idx in enumerate(index)
+    }
+    diagram.schema_transitions(group_by=group_by)
+    diagram.stationary_matrix(n_sim_iter=20)
+
+    assert ("north",) in diagram.group_transition_mats
+    total = diagram.group_transition_mats[()]
+    assert total.to_numpy().sum() == len(diagram.complete_cohort_df) - len(index)
+
+    key = next(iter(group_by.values()))
+    expected = stationary_power(
+        transition_probabilities(diagram.group_transition_mats[key]), 20
+    )
+    np.testing.assert_allclose(diagram.group_stationary_mats[key], expected)
+
+
+def test_within_entities_matches_grouped_rollup(diagram):
+    index = diagram.complete_cohort_df["data_index"].unique()
+    group_by = {idx: (i % 2,) for i, idx in enumerate(index)}
+    diagram.schema_transitions(group_by=group_by, within_entities=False)
+    across = diagram.transition_mat.to_numpy().sum()
+    # the legacy count also spans the boundaries between entities
+    assert across == len(diagram.complete_cohort_df) - 1
+
+    diagram.schema_transitions(group_by=group_by)
+    np.testing.assert_array_equal(
+        diagram.transition_mat.to_numpy(dtype=np.int64),
+        diagram.group_transition_mats[()].to_numpy(),
+    )
+    assert across - diagram.transition_mat.to_numpy().sum() == len(index) - 1
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from collections import Counter
+from caterpillard.grouping import group_transition_counts
+from caterpillard.higher_order import HigherOrderChain, context_codes, encode
+from caterpillard.markov import COLORS
+
+
+def test_first_order_matches_transition_counts(diagram):
+    cohorts = diagram.complete_cohort_df
+    chain = HigherOrderChain(order=1).fit(cohorts)
+    table = chain.transition_table(normalize=False)
+    _, counts = group_transition_counts(
+        cohorts, {idx: "all" for idx in cohorts["data_index"].unique()}
+    )
+    expected = pd.DataFrame(counts[0], index=COLORS, columns=COLORS)
+    expected = expected[expected.sum(axis=1) > 0]
+    np.testing.assert_array_equal(table.to_numpy(), expected.to_numpy())
+    assert list(table.index) == list(expected.index)
+
+
+def test_order_three_counts_match_loop(diagram):
+    table = diagram.higher_order_transitions(order=3)
+    counts = Counter()
+    for _, subset in diagram.complete_cohort_df.groupby("data_index"):
+        colors = subset["color"].to_list()
+        for i in range(3, len(colors)):
+            counts["-".join(colors[i - 3 : i]), colors[i]] += 1
+
+    raw = diagram.higher_order_chain.transition_table(normalize=False)
+    assert raw.to_numpy().sum() == sum(counts.values())
+    for (context, following), count in counts.items():
+        assert raw.loc[context, following] == count
+    np.testing.assert_allclose(table.sum(axis=1), 1)
+
+
+def test_backoff_to_lower_order(diagram):
+    chain = HigherOrderChain(order=5).fit(diagram.complete_cohort_df)
+    contexts = set(chain.tables[5][0])
+    unseen = next(
+        history
+        for history in np.random.default_rng(0).integers(0, 7, (1000, 5))
+        if encode(history[None, :])[0] not in contexts
+    )
+    probabilities, used = chain.predict_proba(unseen[None, :])
+    assert used[0] < 5
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1)
+
+    strict = HigherOrderChain(order=5, backoff=False).fit(diagram.complete_cohort_df)
+    probabilities, used = strict.predict_proba(unseen[None, :])
+    assert used[0] == -1 and np.isnan(probabilities).all()
+
+    prediction = chain.predict_next(diagram.complete_cohort_df)
+    assert prediction["order"].between(0, 5).all()
+    np.testing.assert_allclose(prediction[COLORS].sum(axis=1), 1)
+
+
+def test_invalid_cohort_breaks_the_history():
+    cohorts = pd.DataFrame({"data_index": [1] * 6, "n_color": [1, 2, 0, 3, 4, 5]})
+    context, following = context_codes(cohorts, order=2)
+    # only the cohorts after two valid colors past the invalid one
+    np.testing.assert_array_equal(context, encode([[2, 3]]))
+    np.testing.assert_array_equal(following, [4])
@@ -0,0 +1,63 @@
+import pytest
+import json
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram, CaterpillarModel
+
+
+def test_fit_matches_diagram(test_data, diagram):
+    model = CaterpillarModel.fit(test_data.iloc[:20], n_sim_iter=50)
+    for diff in ["d11", "d12"]:
+        for key, value in model.thresholds[diff].items():
+            assert value == pytest.approx(diagram.radius_thresholds[diff][key])
+
+    cohort_df = model.transform(test_data.iloc[:20])
+    expected = diagram.complete_cohort_df
+    for column in ["data_index", "Cohort", "color", "n_color", "final_cohort_radius"]:
+        assert (cohort_df[column].to_numpy() == expected[column].to_numpy()).all()
+    assert model.metadata["n_entities"] == 20
+
+    # both count the transitions within each entity
+    from_diagram = CaterpillarModel.from_diagram(diagram, n_sim_iter=50)
+    pd.testing.assert_frame_equal(from_diagram.trans_mat_prob, model.trans_mat_prob)
+    pd.testing.assert_frame_equal(from_diagram.stationary_mat, model.stationary_mat)
+    assert (
+        from_diagram.metadata["transition_counts"]
+        == model.metadata["transition_counts"]
+    )
+
+
+def test_transform_new_entities_with_frozen_thresholds(test_data, diagram):
+    model = CaterpillarModel.from_diagram(diagram)
+    new = test_data.iloc[20:25]
+    cohort_df = model.transform(new)
+
+    cd = CaterpillarDiagram(data=new, relative=True, output_path=diagram.output_path)
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size(thresholds=model.thresholds)
+    np.testing.assert_array_equal(
+        cohort_df["final_cohort_radius"].to_numpy(),
+        cd.complete_cohort_df["final_cohort_radius"].to_numpy(),
+    )
+
+    scores = model.score(new)
+    assert list(scores.index) == list(new.index)
+    pd.testing.assert_frame_equal(scores, model.score(cohort_df))
+    assert len(model.score(new, k=2)) == 2
+
+
+def test_save_and_load(diagram, tmp_path):
+    model = CaterpillarModel.from_diagram(diagram)
+    path = tmp_path / "model.json"
+    model.save(path)
+    loaded = CaterpillarModel.load(path)
+    assert loaded.thresholds == model.thresholds
+    pd.testing.assert_frame_equal(loaded.trans_mat_prob, model.trans_mat_prob)
+    pd.testing.assert_frame_equal(loaded.stationary_mat, model.stationary_mat)
+
+    content = json.loads(path.read_text())
+    content["version"] += 1
+    path.write_text(json.dumps(content))
+    with pytest.raises(ValueError, match="Unsupported model version"):
+        CaterpillarModel.load(path)
@@ -0,0 +1,106 @@
+from collections import Counter
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram, MultiMetricDiagram
+from caterpillard.grouping import group_transition_counts
+from caterpillard.markov import COLORS
+
+COLUMNS = ["d11", "d12", "d2", "data_index", "Cohort", "color", "n_color"]
+
+
+@pytest.fixture
+def panel(test_data):
+    data = test_data.iloc[:8]
+    metrics = {
+        "incidents": data,
+        "casualties": data ** 2 // 7,
+        "injuries": data.iloc[:, ::-1].set_axis(data.columns, axis=1),
+    }
+    return pd.concat(metrics, axis=1)
+
+
+@pytest.fixture
+def diagram(panel, tmp_path):
+    mm = MultiMetricDiagram(panel, output_path=str(tmp_path))
+    mm.color_schema()
+    mm.caterpillar_size()
+    mm.schema_transitions()
+    return mm
+
+
+def test_metrics_match_separate_diagrams(panel, diagram, tmp_path):
+    for metric in diagram.metrics:
+        cd = CaterpillarDiagram(
+            panel[metric], relative=True, output_path=str(tmp_path / metric)
+        )
+        cd.data_summary()
+        cd.color_schema()
+        cd.caterpillar_size()
+        expected = cd.complete_cohort_df
+        result = diagram.cohort_dfs[metric]
+        pd.testing.assert_frame_equal(
+            result[COLUMNS], expected[COLUMNS], check_dtype=False
+        )
+        np.testing.assert_allclose(
+            result["final_cohort_radius"], expected["final_cohort_radius"]
+        )
+        assert (tmp_path / f"complete_cohort_details_{metric}.csv").exists()
+
+
+def test_transitions_per_metric(diagram):
+    for metric in diagram.metrics:
+        cohorts = diagram.cohort_dfs[metric]
+        _, counts = group_transition_counts(
+            cohorts, {idx: 0 for idx in cohorts["data_index"].unique()}
+        )
+        np.testing.assert_array_equal(
+            diagram.transition_mats[metric].to_numpy(), counts[0]
+        )
+
+    stationary = diagram.stationary_matrix(n_sim_iter=20)
+    assert set(stationary) == set(diagram.metrics)
+
+
+def test_joint_chain(diagram):
+    joint = diagram.joint_transitions()
+    n_entities, _, n_cohorts = diagram.n_color.shape
+    assert joint["count"].sum() == n_entities * (n_cohorts - 1)
+    np.testing.assert_allclose(joint.groupby("from_state")["probability"].sum(), 1)
+
+    # first transition of the first entity, colors of every metric
+    colors = [
+        "|".join(diagram.cohort_dfs[m]["color"].iloc[i] for m in diagram.metrics)
+        for i in range(2)
+    ]
+    row = joint[(joint["from_state"] == colors[0]) & (joint["to_state"] == colors[1])]
+    assert len(row) == 1 and row["count"].iloc[0] >= 1
+
+
+def test_metric_diagram_generates(diagram):
+    cd = diagram.diagram("casualties")
+    cd.generate(data_index=int(diagram.entities[0]), n_last_cohorts=4)
+    assert len(cd.cx) == 4
+
+
+def test_single_metric_class_rejects_panel(panel):
+    with pytest.raises(TypeError):
+        CaterpillarDiagram(panel, relative=True)
+
+
+def test_joint_chain_many_metrics(test_data, tmp_path):
+    # 7 ** 28 pair codes of 14 metrics do not fit in int64
+    data = test_data.iloc[:6]
+    panel = pd.concat({f"m{i}": data * (i + 1) % 11 for i in range(14)}, axis=1)
+    mm = MultiMetricDiagram(panel, output_path=str(tmp_path))
+    mm.color_schema()
+    joint = mm.joint_transitions()
+
+    colors = np.asarray(COLORS)[mm.n_color - 1]
+    expected = Counter(
+        ("|".join(entity[:, i]), "|".join(entity[:, i + 1]))
+        for entity in colors
+        for i in range(colors.shape[2] - 1)
+    )
+    result = dict(zip(zip(joint["from_state"], joint["to_state"]), joint["count"]))
+    assert result == expected
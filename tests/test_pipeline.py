@@ -0,0 +1,55 @@
+import pytest
+from caterpillard.pipeline import CaterpillarPipeline, StageError
+
+
+@pytest.fixture
+def pipeline(test_data, tmp_path):
+    return CaterpillarPipeline(
+        test_data.iloc[:10], relative=True, output_path=str(tmp_path), n_sim_iter=20
+    )
+
+
+def test_stationary_skips_radii(pipeline):
+    """
+    Requesting the stationary matrix must not compute the radii
+    """
+    stationary = pipeline.stationary_matrix
+    assert stationary.shape == (7, 7)
+    assert sorted(pipeline.computed) == ["cohorts", "stationary", "transitions"]
+
+
+def test_diagram_resolves_dependencies(pipeline):
+    """
+    The diagram can be requested directly, without calling
+    data_summary or caterpillar_size first
+    """
+    fig = pipeline.diagram(data_index=4, n_last_cohorts=5)
+    assert fig is not None
+    assert "summary" in pipeline.computed
+    assert "final_cohort_radius" in pipeline.cohort_details
+    assert "final_cohort_radius" not in pipeline["cohorts"]["complete_cohort_df"]
+
+
+def test_param_change_invalidates_downstream(pipeline):
+    pipeline.get("stationary")
+    cohorts = pipeline["cohorts"]["complete_cohort_df"]
+
+    pipeline.set_params(n_sim_iter=30)
+    assert "stationary" not in pipeline.computed
+    assert "transitions" in pipeline.computed
+
+    pipeline.get("stationary")
+    assert pipeline["cohorts"]["complete_cohort_df"] is cohorts
+
+
+def test_data_change_invalidates_everything(pipeline, test_data):
+    pipeline.get("stationary")
+    pipeline.set_data(test_data.iloc[10:20])
+    assert pipeline.computed == []
+
+
+def test_stage_errors_are_raised(pipeline):
+    with pytest.raises(StageError):
+        pipeline.diagram(data_index=None)
+    with pytest.raises(ValueError):
+        pipeline.get("histogram")
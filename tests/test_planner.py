@@ -0,0 +1,99 @@
+import pytest
+import json
+import numpy as np
+from caterpillard import CaterpillarDiagram
+from caterpillard.planner import calibrate, plan_resources, planned_cohorts
+import os
+
+
+def _costs(cohort_bytes, table_bytes):
+    stage = {"seconds": 1e-7, "bytes": cohort_bytes}
+    return {
+        "cohorts": stage,
+        "radii": stage,
+        "transitions": stage,
+        "table_bytes": table_bytes,
+        "transfer_seconds": 1e-8,
+    }
+
+
+# fixed costs, so the choices do not depend on the machine
+CALIBRATION = {
+    "float64": _costs(200, 250),
+    "float32": _costs(150, 240),
+    "render_seconds_per_megapixel": 0.4,
+    "worker_startup_seconds": 0.05,
+}
+
+
+def test_settings_follow_the_budget():
+    roomy = plan_resources(
+        (200000, 60), memory=16 * 2 ** 30, n_cpus=8, calibration=CALIBRATION
+    )
+    assert roomy.settings["dtype"] == "float64"
+    assert roomy.settings["n_workers"] > 1
+    assert roomy.settings["render_mode"] == "figure"
+    assert roomy.fits
+    n_chunks = np.ceil(200000 / roomy.settings["chunk_size"])
+    assert n_chunks >= roomy.settings["n_workers"]
+
+    tight = plan_resources(
+        (200000, 60), memory=8 * 2 ** 30, n_cpus=8, calibration=CALIBRATION
+    )
+    assert tight.settings["chunk_size"] < roomy.settings["chunk_size"]
+    assert tight.peak_memory_bytes <= tight.inputs["memory_budget"]
+
+    small = plan_resources(
+        (1000, 60), memory=16 * 2 ** 30, n_cpus=8, calibration=CALIBRATION
+    )
+    assert small.settings["n_workers"] == 1
+
+    # wider than an Agg canvas
+    long = plan_resources(
+        (10, 500), memory=16 * 2 ** 30, n_cpus=1, calibration=CALIBRATION
+    )
+    assert long.settings["render_mode"] == "tiles"
+    assert 1 <= long.settings["cohorts_per_tile"] <= 25
+
+    content = json.loads(json.dumps(tight.to_dict()))
+    assert set(content["estimates"]) == {"cohorts", "radii", "transitions", "render"}
+    with pytest.raises(ValueError):
+        plan_resources((10, 2), memory=2 ** 30, calibration=CALIBRATION)
+
+
+def test_planned_cohorts_match_color_schema(test_data, tmp_path):
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:30], relative=True, output_path=str(tmp_path)
+    )
+    cd.color_schema()
+    for dtype in ["float64", "float32"]:
+        cohort_df = planned_cohorts(
+            test_data.iloc[:30], chunk_size=7, dtype=dtype, n_workers=2
+        )
+        for column in ["data_index", "Cohort", "color", "level", "n_color"]:
+            assert (
+                cohort_df[column].to_numpy() == cd.complete_cohort_df[column].to_numpy()
+            ).all()
+        np.testing.assert_allclose(
+            cohort_df["d2"].to_numpy(), cd.complete_cohort_df["d2"].to_numpy()
+        )
+
+
+@pytest.mark.parametrize("memory", [2 ** 34, 2 ** 20])
+def test_execute_plan(test_data, tmp_path, memory):
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:10], relative=True, output_path=str(tmp_path), horizon=12
+    )
+    calibration = calibrate(n_rows=32)
+    plan = cd.plan_resources(memory=memory, n_cpus=1, calibration=calibration)
+    assert plan.inputs["n_periods"] == 14
+    assert plan.inputs["render_cohorts"] == 12
+    cd.execute_plan(data_index=int(test_data.index[3]), n_sim_iter=20)
+
+    assert cd.complete_cohort_df["Cohort"].iloc[0] == f"Cohort{test_data.shape[1] - 13}"
+    assert len(cd.complete_cohort_df) == 10 * 12
+    assert os.path.exists(tmp_path / "cohort_df.csv")
+    if plan.settings["render_mode"] == "tiles":
+        assert cd.tile_index["n_cohorts"] == 12
+    else:
+        assert len(cd.cx) == 12
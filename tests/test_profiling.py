@@ -0,0 +1,110 @@
+import pytest
+import sys
+import timeit
+from caterpillard import CaterpillarDiagram
+from caterpillard.profiling import Profiler, profiled
+
+
+def test_every_stage_is_recorded(test_data, tmp_path):
+    events = []
+    profiler = Profiler(
+        on_start=lambda name: events.append(("start", name)),
+        on_end=lambda record: events.append(("end", record["stage"])),
+    )
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:5],
+        relative=True,
+        output_path=str(tmp_path),
+        profiler=profiler,
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size()
+    cd.schema_transitions()
+    cd.stationary_matrix(n_sim_iter=10)
+    cd.generate(data_index=int(test_data.index[0]), n_last_cohorts=4)
+
+    summary = profiler.summary()
+    assert list(summary) == [
+        "__init__",
+        "data_summary",
+        "write cohort_df.csv",
+        "color_schema",
+        "write complete_cohort_details.csv",
+        "caterpillar_size",
+        "schema_transitions",
+        "stationary_matrix",
+        "write caterpillar.jpeg",
+        "generate",
+    ]
+    n_cohorts = len(cd.complete_cohort_df)
+    assert summary["__init__"]["rows"] == 5
+    assert summary["color_schema"]["rows"] == n_cohorts
+    assert summary["write cohort_df.csv"]["rows"] == n_cohorts
+    assert summary["generate"]["rows"] == 4
+    for entry in summary.values():
+        assert entry["calls"] == 1
+        assert entry["wall_seconds"] >= 0 and entry["peak_memory_bytes"] >= 0
+
+    # writes are nested inside their stage
+    assert events.index(("start", "color_schema")) < events.index(
+        ("end", "write cohort_df.csv")
+    ) < events.index(("end", "color_schema"))
+    assert (
+        summary["color_schema"]["peak_memory_bytes"]
+        >= summary["write cohort_df.csv"]["peak_memory_bytes"]
+    )
+
+
+def test_positional_profiler(test_data, tmp_path):
+    profiler = Profiler()
+    CaterpillarDiagram(test_data.iloc[:5], True, str(tmp_path), profiler)
+    assert list(profiler.summary()) == ["__init__"]
+
+
+def test_prometheus_text(tmp_path):
+    profiler = Profiler(memory=False)
+    with profiler.stage("write x.csv", rows=3):
+        pass
+    with pytest.raises(SystemExit):
+        with profiler.stage("write x.csv", rows=4):
+            raise SystemExit("failed")
+
+    assert profiler.records[-1]["status"] == "error: SystemExit"
+    path = tmp_path / "metrics.prom"
+    profiler.write_prometheus(path)
+    text = path.read_text()
+    assert '# TYPE caterpillard_stage_calls_total counter' in text
+    assert 'caterpillard_stage_calls_total{stage="write x.csv"} 2' in text
+    assert 'caterpillard_stage_rows_total{stage="write x.csv"} 7' in text
+    assert "caterpillard_stage_peak_memory_bytes{" not in text
+
+
+def test_disabled_overhead_is_negligible(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("stage entered while profiling is disabled")
+
+    monkeypatch.setattr(Profiler, "stage", fail)
+
+    class Instrumented:
+        profiler = None
+
+        @profiled("step")
+        def step(self):
+            # a small stage of a few tens of microseconds
+            return sum(range(2000))
+
+    instrumented = Instrumented()
+    plain = Instrumented.step.__wrapped__
+
+    def timing(func):
+        return min(timeit.repeat(func, number=1000, repeat=7))
+
+    # coverage tracing would slow down the wrapper only
+    trace = sys.gettrace()
+    sys.settrace(None)
+    try:
+        ratio = timing(instrumented.step) / timing(lambda: plain(instrumented))
+    finally:
+        sys.settrace(trace)
+    assert ratio < 1.2
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram
+from caterpillard.pyramid import TemporalPyramid, aggregate
+
+
+def test_aggregate_levels(test_data):
+    values = test_data.to_numpy(dtype=np.float64)
+    np.testing.assert_allclose(aggregate(aggregate(values, 2), 3), aggregate(values, 6))
+    np.testing.assert_allclose(
+        aggregate(values, 4, how="mean")[:, 0], values[:, :4].mean(axis=1)
+    )
+    np.testing.assert_array_equal(aggregate(values, 4, how="last")[:, 1], values[:, 7])
+    assert aggregate(values, 4).shape == (len(values), values.shape[1] // 4)
+    with pytest.raises(ValueError):
+        aggregate(values, 2, how="median")
+
+
+def test_levels_match_resampled_diagram(test_data, tmp_path):
+    data = test_data.iloc[:15]
+    pyramid = TemporalPyramid(data, {"base": 1, "pair": 2, "six": 6})
+    for name, factor in pyramid.factors.items():
+        n_blocks = data.shape[1] // factor
+        resampled = (
+            data.iloc[:, : n_blocks * factor]
+            .T.groupby(np.arange(n_blocks * factor) // factor)
+            .sum()
+            .T
+        )
+        resampled.columns = data.columns[: n_blocks * factor : factor]
+        cd = CaterpillarDiagram(resampled, relative=True, output_path=str(tmp_path))
+        cd.data_summary()
+        cd.color_schema()
+        cd.caterpillar_size()
+
+        level = pyramid[name]
+        assert level["n_cohorts"] == cd.n_cohorts
+        pd.testing.assert_frame_equal(level["data"], resampled, check_dtype=False)
+        for column in ["data_index", "color", "final_cohort_radius"]:
+            assert (
+                level["cohort_df"][column].to_numpy()
+                == cd.complete_cohort_df[column].to_numpy()
+            ).all()
+
+
+def test_generate_switches_resolution(test_data, tmp_path):
+    cd = CaterpillarDiagram(
+        test_data.iloc[:10], relative=True, output_path=str(tmp_path)
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size()
+    pyramid = cd.build_pyramid({"quarterly": 3, "yearly": 12})
+    assert (tmp_path / "complete_cohort_details_yearly.csv").exists()
+
+    cd.generate(data_index=5, resolution="quarterly", keep_figure=False)
+    assert len(cd.cx) == pyramid["quarterly"]["n_cohorts"]
+    cd.generate(data_index=5, n_last_cohorts=2, resolution="yearly", keep_figure=False)
+    assert len(cd.cx) == 2
+    cd.generate(data_index=5, keep_figure=False)
+    assert len(cd.cx) == cd.n_cohorts
+    with pytest.raises(SystemExit):
+        cd.geometry(data_index=5, resolution="weekly")
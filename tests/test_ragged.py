@@ -0,0 +1,92 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram
+from caterpillard.ragged import RaggedPanel
+
+LEGACY_COLUMNS = ["d11", "d12", "d2", "data_index", "Cohort", "color", "level"]
+
+
+@pytest.fixture
+def gappy_data():
+    # entity 1 misses period 4, entity 2 is observed in three periods only
+    return pd.DataFrame(
+        {
+            "entity": [1, 1, 1, 1, 1, 1, 2, 2, 2],
+            "period": [1, 2, 3, 5, 6, 7, 5, 6, 7],
+            "value": [1.0, 3.0, 2.0, 8.0, 5.0, 5.0, 0.0, 1.0, 3.0],
+        }
+    )
+
+
+def test_dense_long_matches_wide(test_data, tmp_path):
+    """
+    Long format input without gaps must give the same cohorts
+    as the wide format input
+    """
+    wide = test_data.iloc[:15]
+    long = wide.rename_axis("entity").reset_index().melt(
+        id_vars="entity", var_name="period", value_name="value"
+    )
+
+    cd = CaterpillarDiagram(data=wide, relative=True, output_path=str(tmp_path))
+    cd.color_schema()
+    panel = RaggedPanel.from_long(long.sample(frac=1, random_state=0))
+    cohorts = panel.cohorts()
+
+    cohorts = cohorts.sort_values("data_index", kind="stable")
+    pd.testing.assert_frame_equal(
+        cohorts[LEGACY_COLUMNS].reset_index(drop=True),
+        cd.complete_cohort_df[LEGACY_COLUMNS].reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert (cohorts["n_color"].values == cd.complete_cohort_df["n_color"].values).all()
+
+
+@pytest.mark.parametrize("gap, n_cohorts", [("split", 3), ("bridge", 5), ("zero", 6)])
+def test_gap_handling(gappy_data, gap, n_cohorts):
+    panel = RaggedPanel.from_long(gappy_data, gap=gap, period_axis=range(1, 8))
+    cohorts = panel.cohorts()
+    assert len(cohorts) == n_cohorts
+    if gap == "split":
+        assert cohorts["Cohort"].to_list() == ["Cohort1", "Cohort5", "Cohort5"]
+        assert cohorts["segment"].to_list() == [0, 1, 2]
+
+
+def test_from_long_pipeline(gappy_data, tmp_path):
+    """
+    Transitions must not be counted across gaps or entities
+    """
+    cd = CaterpillarDiagram.from_long(
+        gappy_data, period_axis=range(1, 8), output_path=str(tmp_path)
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size()
+    cd.schema_transitions()
+    assert cd.n_cohorts == 5
+    assert cd.transition_mat.to_numpy().sum() == 0
+    cd.generate(data_index=2)
+    assert len(cd.cx) == 1
+
+
+def test_duplicate_observations(gappy_data):
+    with pytest.raises(ValueError):
+        RaggedPanel.from_long(pd.concat([gappy_data, gappy_data.iloc[:1]]))
+
+
+@pytest.mark.parametrize("gap", ["split", "bridge", "zero"])
+def test_tail_without_observations(gap):
+    """
+    Entities not observed in the last periods must not break the cohorts
+    """
+    data = pd.DataFrame(
+        {
+            "entity": [1, 1, 1, 1, 1, 2, 2],
+            "period": [1, 2, 3, 4, 5, 1, 2],
+            "value": [1.0, 3.0, 2.0, 8.0, 5.0, 0.0, 1.0],
+        }
+    )
+    cohorts = RaggedPanel.from_long(data, gap=gap).tail(3).cohorts()
+    assert cohorts["data_index"].to_list() == [1]
+    assert cohorts["Cohort"].to_list() == ["Cohort3"]
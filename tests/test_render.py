@@ -0,0 +1,143 @@
+import pytest
+import gc
+import json
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from caterpillard import CaterpillarDiagram
+from caterpillard.render import Renderer, render_bytes
+
+# Number of renders of the soak run, set CATERPILLARD_SOAK_RENDERS to
+# lower it for a quick run or deselect it with -m "not slow"
+SOAK_RENDERS = int(os.environ.get("CATERPILLARD_SOAK_RENDERS", 10000))
+
+
+@pytest.fixture
+def geometries(test_data, tmp_path):
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:8], relative=True, output_path=str(tmp_path),
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size()
+    return [
+        cd.geometry(data_index=int(data_index), n_last_cohorts=3)
+        for data_index in cd.complete_cohort_df["data_index"].unique()
+    ]
+
+
+def _rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def test_generate_leaves_no_pyplot_figures(test_data, tmp_path):
+    import matplotlib.pyplot as plt
+
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:4], relative=True, output_path=str(tmp_path),
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size()
+    data_index = int(cd.complete_cohort_df["data_index"].iloc[0])
+    before = plt.get_fignums()
+    cd.generate(data_index=data_index, n_last_cohorts=3, keep_figure=False)
+
+    assert cd.caterpillar_fig is None
+    assert plt.get_fignums() == before
+    assert (tmp_path / "caterpillar.jpeg").exists()
+    assert cd.render(data_index=data_index, n_last_cohorts=3, dpi=20)[:4] == (
+        b"\x89PNG"
+    )
+
+
+def test_thread_pool_output_matches_sequential(geometries):
+    expected = [render_bytes(geometry, dpi=20) for geometry in geometries]
+    renderer = Renderer(dpi=20)
+    tasks = geometries * 4
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        images = list(pool.map(renderer.render, tasks))
+
+    assert images == expected * 4
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="Linux only")
+def test_soak_memory_is_flat(geometries):
+    renderer = Renderer(dpi=20)
+    for geometry in geometries * 5:
+        renderer.render(geometry)
+    gc.collect()
+    baseline = _rss()
+
+    for i in range(SOAK_RENDERS):
+        renderer.render(geometries[i % len(geometries)])
+    gc.collect()
+
+    assert _rss() - baseline < 20 * 2 ** 20
+    renderer.close()
+
+
+def test_tiles_cover_the_strip(test_data, tmp_path):
+    from PIL import Image
+    from caterpillard.geometry import caterpillar_geometry
+    from caterpillard.render import figure_size, render_tiles
+
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:3], relative=True, output_path=str(tmp_path),
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size()
+    index = cd.generate_tiles(data_index=4, cohorts_per_tile=10, format="png", dpi=50)
+    directory = tmp_path / "caterpillar_tiles"
+    assert json.loads((directory / "index.json").read_text()) == index
+
+    tiles = index["tiles"]
+    assert len(tiles) == -(-cd.n_cohorts // 10)
+    assert tiles[0]["first_cohort"] == 1 and tiles[-1]["last_cohort"] == cd.n_cohorts
+    for left, right in zip(tiles[:-1], tiles[1:]):
+        assert left["x_end"] == right["x_start"]
+        assert left["last_cohort"] + 1 == right["first_cohort"]
+    for tile in tiles:
+        with Image.open(directory / tile["file"]) as image:
+            assert abs(image.size[0] - tile["width_px"]) <= 1
+            assert abs(image.size[1] - tile["height_px"]) <= 1
+    # the tiles together are as wide as the untiled figure
+    width = sum(tile["width_px"] for tile in tiles)
+    assert abs(width - figure_size(cd.n_cohorts)[0] * 50) <= len(tiles)
+
+    # tile size does not depend on the length of the strip
+    geometry = cd.geometry(data_index=4)
+    long = caterpillar_geometry(np.tile(geometry["radii"], 20), geometry["colors"] * 20)
+    long_index = render_tiles(long, tmp_path / "long", cohorts_per_tile=10, dpi=50)
+    assert max(t["width_px"] for t in long_index["tiles"]) <= 2 * max(
+        t["width_px"] for t in tiles
+    )
+
+    # a shorter rendering in the same directory leaves no stale tile
+    (tmp_path / "long" / "notes.txt").write_text("kept")
+    short_index = render_tiles(geometry, tmp_path / "long", cohorts_per_tile=10, dpi=50)
+    files = sorted(path.name for path in (tmp_path / "long").iterdir())
+    assert files == sorted(
+        [tile["file"] for tile in short_index["tiles"]] + ["index.json", "notes.txt"]
+    )
+
+
+def test_tile_converts_only_its_cohorts():
+    from matplotlib.figure import Figure
+    from caterpillard.render import _draw_cohorts
+
+    # cohorts outside the tile cannot be converted to float
+    n, start, stop = 50, 20, 30
+    geometry = {
+        key: [None] * start + list(np.arange(start, stop) * 10.0) + [None] * (n - stop)
+        for key in ["cx", "radii", "lx_s", "lx_e"]
+    }
+    geometry["colors"] = ["red"] * n
+    geometry["lx_s"][start - 1] = geometry["lx_e"][start - 1] = 0.0
+    ax = Figure().add_subplot()
+    _draw_cohorts(ax, geometry, start, stop)
+    assert len(ax.patches) == stop - start
+    assert len(ax.lines) == stop - start + 1
@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+from caterpillard.scoring import surprise_scores, top_k
+
+
+def _kl(p, q):
+    return np.sum(p[p > 0] * np.log(p[p > 0] / q[p > 0]))
+
+
+def test_surprise_matches_loop(diagram):
+    scores = diagram.surprise()
+    prob = diagram.trans_mat_prob.astype(float)
+    for data_index, subset in diagram.complete_cohort_df.groupby("data_index"):
+        before, after = subset["color"].iloc[-2], subset["color"].iloc[-1]
+        p = prob.loc[before, after]
+        assert scores.loc[data_index, "from_color"] == before
+        assert scores.loc[data_index, "to_color"] == after
+        assert scores.loc[data_index, "surprise"] == pytest.approx(
+            -np.log(max(p, 1e-12))
+        )
+
+
+def test_divergence_matches_loop(diagram):
+    scores = surprise_scores(
+        diagram.complete_cohort_df,
+        diagram.trans_mat_prob,
+        stationary=diagram.stationary_mat_final_df,
+        window=5,
+        metric="js",
+    )
+    stationary = diagram.stationary_mat_final_df.astype(float)
+    for data_index, subset in diagram.complete_cohort_df.groupby("data_index"):
+        recent = (
+            subset["color"].iloc[-5:].value_counts(normalize=True)
+            .reindex(stationary.columns, fill_value=0)
+            .to_numpy()
+        )
+        reference = np.maximum(stationary.loc[subset["color"].iloc[-1]], 1e-12)
+        reference = (reference / reference.sum()).to_numpy()
+        mixture = (recent + reference) / 2
+        expected = (_kl(recent, mixture) + _kl(reference, mixture)) / 2
+        assert scores.loc[data_index, "divergence"] == pytest.approx(expected)
+
+
+def test_top_k_matches_full_sort(diagram):
+    scores = diagram.surprise()
+    for by in ["surprise", "divergence"]:
+        top = top_k(scores, 5, by=by)
+        expected = scores[by].sort_values(ascending=False).iloc[:5]
+        np.testing.assert_allclose(top[by].to_numpy(), expected.to_numpy())
+
+    assert len(diagram.surprise(k=3)) == 3
+    assert len(top_k(scores, 10 ** 6)) == len(scores)
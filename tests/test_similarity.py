@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard.similarity import SimilarityIndex
+
+
+def test_distance_matches_color_lists(diagram):
+    index = diagram.similarity_index(length=25)
+    cohorts = diagram.complete_cohort_df
+    colors = {
+        key: subset["color"].to_list()[-25:]
+        for key, subset in cohorts.groupby("data_index", sort=False)
+    }
+    query = cohorts["data_index"].iloc[0]
+    result = index.query(data_index=query, k=len(colors))
+
+    assert query not in result.index
+    for key, distance in result["distance"].items():
+        expected = sum(a != b for a, b in zip(colors[key], colors[query]))
+        assert distance == expected
+    assert result["distance"].is_monotonic_increasing
+
+
+def test_packed_matches_exact(diagram):
+    index = diagram.similarity_index()
+    sequence = ["red", "green", "grey", "blue", "yellow"] * 5
+    packed = index.query(sequence=sequence, k=10)
+    exact = index.query(sequence=sequence, k=10, exact=True)
+    pd.testing.assert_frame_equal(packed, exact)
+
+
+def test_incremental_add(diagram):
+    cohorts = diagram.complete_cohort_df
+    keys = cohorts["data_index"].unique()
+    full = SimilarityIndex.from_cohorts(cohorts, length=30)
+    grown = SimilarityIndex(30)
+    for part in np.array_split(keys, 4):
+        grown.add(cohorts[cohorts["data_index"].isin(part)])
+
+    assert len(grown) == len(full)
+    pd.testing.assert_frame_equal(
+        grown.query(data_index=keys[3], k=8), full.query(data_index=keys[3], k=8)
+    )
+    with pytest.raises(ValueError):
+        grown.add(cohorts[cohorts["data_index"] == keys[0]])
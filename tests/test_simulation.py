@@ -0,0 +1,63 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram
+from caterpillard.simulation import simulate_paths
+
+COLORS = ["red", "orange", "yellow", "cyan", "blue", "green", "grey"]
+
+
+@pytest.fixture
+def cycle_prob():
+    prob = np.roll(np.eye(7), 1, axis=1)
+    return pd.DataFrame(prob, index=COLORS, columns=COLORS)
+
+
+def test_simulate_deterministic_chain(cycle_prob):
+    """
+    A deterministic cycle red -> orange -> ... must be
+    reproduced exactly by the simulation
+    """
+    summary = simulate_paths(
+        cycle_prob, start="red", n_steps=3, n_paths=1000, target="cyan", seed=1
+    )
+    assert summary["occupancy"].loc[3, "cyan"] == 1.0
+    assert summary["hitting_probability"].to_list() == [0.0, 0.0, 0.0, 1.0]
+
+
+def test_simulate_seed_stable_across_workers(test_data, tmp_path):
+    """
+    Results for a seed must not depend on the number of workers
+    """
+    cd = CaterpillarDiagram(
+        data=test_data.iloc[:10], relative=True, output_path=str(tmp_path),
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.schema_transitions()
+    cd.stationary_matrix(n_sim_iter=10)
+
+    kwargs = dict(start="grey", n_steps=5, n_paths=5000, target="red", seed=7)
+    serial = simulate_paths(cd.trans_mat_prob, chunk_size=1000, n_workers=1, **kwargs)
+    pooled = simulate_paths(cd.trans_mat_prob, chunk_size=1000, n_workers=2, **kwargs)
+
+    pd.testing.assert_frame_equal(serial["occupancy"], pooled["occupancy"])
+    np.testing.assert_allclose(serial["occupancy"].sum(axis=1), 1.0)
+    assert cd.simulate(**kwargs)["hitting_probability"].is_monotonic_increasing
+
+
+def test_simulate_unknown_color(cycle_prob):
+    with pytest.raises(ValueError):
+        simulate_paths(cycle_prob, start="purple", n_steps=3)
+
+
+def test_simulate_early_invoke(test_data, tmp_path):
+    """
+    This test will check whether an error gets raised due
+    to an early invoking of simulate method
+    """
+    with pytest.raises(SystemExit):
+        cd = CaterpillarDiagram(
+            data=test_data.iloc[:10], relative=True, output_path=str(tmp_path),
+        )
+        assert cd.simulate(start="red", n_steps=5)
@@ -0,0 +1,85 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram, RaggedPanel
+from caterpillard.store import ResultStore
+
+
+def test_entity_roundtrip(diagram, tmp_path):
+    run_id = diagram.save_results(metadata={"source": "test"})
+    with ResultStore(tmp_path / "results.sqlite") as store:
+        assert store.entities() == sorted(
+            diagram.complete_cohort_df["data_index"].unique()
+        )
+        for data_index in [4, 12]:
+            expected = diagram.complete_cohort_df[
+                diagram.complete_cohort_df["data_index"] == data_index
+            ]
+            pd.testing.assert_frame_equal(
+                store.cohorts(data_index, run_id=run_id), expected, check_dtype=False
+            )
+        for name, attribute in [
+            ("transition_mat", "transition_mat"),
+            ("stationary_mat", "stationary_mat_final_df"),
+        ]:
+            np.testing.assert_allclose(
+                store.matrix(name).to_numpy(),
+                getattr(diagram, attribute).to_numpy(dtype=np.float64),
+            )
+        metadata = store.metadata()
+        assert metadata["source"] == "test"
+        assert metadata["n_cohorts"] == diagram.n_cohorts
+
+
+def test_single_entity_read_uses_the_primary_key(diagram, tmp_path):
+    with ResultStore(tmp_path / "store.sqlite", batch_size=7) as store:
+        first = store.write_diagram(diagram)
+        second = store.write_diagram(diagram)
+        assert list(store.runs().index) == [first, second]
+        assert len(store.cohorts(4, run_id=first)) == diagram.n_cohorts
+        pd.testing.assert_frame_equal(
+            store.cohorts(np.int64(4), run_id=first), store.cohorts(4, run_id=first)
+        )
+        (plan,) = store.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM cohorts "
+            "WHERE run_id = ? AND data_index = ? ORDER BY position",
+            (second, 4),
+        ).fetchall()
+        assert "USING PRIMARY KEY" in plan[-1]
+        with pytest.raises(KeyError):
+            store.matrix("unknown")
+
+
+def test_individual_and_ragged_cohorts(test_data, tmp_path):
+    long = test_data.iloc[:3].stack().reset_index()
+    long.columns = ["data_index", "period", "value"]
+    long = long.drop(index=[5, 60])
+    panel = RaggedPanel.from_long(long, "data_index", "period", "value")
+    cohort_df = panel.cohorts()
+    series = CaterpillarDiagram(
+        test_data.loc[4], relative=False, output_path=str(tmp_path)
+    )
+    series.data_summary()
+    series.color_schema()
+
+    with ResultStore(tmp_path / "store.sqlite") as store:
+        ragged = store.write(cohort_df)
+        individual = store.write(series.complete_cohort_df)
+        stored = store.cohorts(4, run_id=ragged)
+        for column in ["segment", "start_period", "end_period"]:
+            assert (
+                stored[column].to_numpy() == cohort_df[column].to_numpy()[: len(stored)]
+            ).all()
+        pd.testing.assert_frame_equal(
+            store.cohorts(run_id=individual),
+            series.complete_cohort_df,
+            check_dtype=False,
+        )
+
+
+def test_discarded_columns_are_logged(diagram, tmp_path, caplog):
+    cohort_df = diagram.complete_cohort_df.assign(note="x")
+    with ResultStore(tmp_path / "store.sqlite") as store:
+        with caplog.at_level("WARNING", logger="caterpillard.store"):
+            store.write(cohort_df)
+    assert "['note']" in caplog.text
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+from caterpillard.grouping import transition_codes
+from caterpillard.streaming import StreamingClassifier
+
+SIZED = ("caterpillar_size",)
+
+
+def transition_counts(cohort_df):
+    _, from_code, to_code = transition_codes(cohort_df)
+    return np.bincount(from_code * 7 + to_code, minlength=49).reshape(7, 7)
+
+
+def test_stream_matches_diagram(test_data, make_diagram):
+    data = test_data.iloc[:30]
+    cd = make_diagram(data, SIZED)
+    classifier = StreamingClassifier(cd.radius_thresholds)
+    emitted = pd.concat(
+        [classifier.update_batch(data.index, data[period]) for period in data]
+    )
+    assert emitted["color"].isna().sum() == 2 * len(data)
+
+    emitted = emitted[emitted["n_color"] > 0].sort_values("data_index", kind="stable")
+    expected = cd.complete_cohort_df.sort_values("data_index", kind="stable")
+    for column in ["d11", "d12", "d2", "color", "level", "n_color"]:
+        assert (emitted[column].to_numpy() == expected[column].to_numpy()).all()
+    np.testing.assert_allclose(
+        emitted["final_cohort_radius"].to_numpy(dtype=np.float64),
+        expected["final_cohort_radius"].to_numpy(dtype=np.float64),
+    )
+    assert (classifier.transition_counts == transition_counts(expected)).all()
+    assert len(classifier) == len(data)
+
+
+def test_micro_batch_matches_single_updates(test_data, make_diagram):
+    cd = make_diagram(20, SIZED)
+    long = test_data.iloc[:20].stack().reset_index()
+    long.columns = ["data_index", "period", "value"]
+    # interleave the entities, keeping the periods of each in order
+    long = long.sample(frac=1, random_state=0).sort_values("period", kind="stable")
+
+    batched = StreamingClassifier(cd.radius_thresholds, capacity=4)
+    result = batched.update_batch(long["data_index"], long["value"])
+    single = StreamingClassifier(cd.radius_thresholds)
+    expected = pd.DataFrame(
+        [single.update(e, v) for e, v in zip(long["data_index"], long["value"])]
+    )
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        expected,
+        check_dtype=False,
+    )
+    assert (batched.transition_counts == single.transition_counts).all()
+
+    # a batch with several periods per entity at once
+    shuffled = StreamingClassifier(cd.radius_thresholds)
+    long = long.sort_values(["data_index", "period"])
+    shuffled.update_batch(long["data_index"], long["value"])
+    assert (shuffled.transition_counts == single.transition_counts).all()
+
+
+def test_from_diagram_continues_stream(test_data, make_diagram, tmp_path):
+    data = test_data.iloc[:25]
+    history = make_diagram(data.iloc[:, :30], SIZED, tmp_path / "history")
+    classifier = StreamingClassifier.from_diagram(history)
+    for period in data.columns[30:]:
+        emitted = classifier.update_batch(data.index, data[period])
+
+    full = make_diagram(
+        data, SIZED, tmp_path / "full", thresholds=history.radius_thresholds
+    )
+    last = full.complete_cohort_df.groupby("data_index", sort=False).tail(1)
+    last = last.set_index("data_index").loc[emitted["data_index"]]
+    assert (emitted["color"].to_numpy() == last["color"].to_numpy()).all()
+    np.testing.assert_allclose(
+        emitted["final_cohort_radius"].to_numpy(dtype=np.float64),
+        last["final_cohort_radius"].to_numpy(dtype=np.float64),
+    )
+    assert (
+        classifier.transition_counts == transition_counts(full.complete_cohort_df)
+    ).all()
+    full.schema_transitions()
+    np.testing.assert_array_equal(
+        classifier.transition_mat.to_numpy(),
+        full.transition_mat.to_numpy(dtype=np.int64),
+    )
@@ -0,0 +1,66 @@
+import pytest
+import time
+import numpy as np
+import pandas as pd
+from caterpillard.summary import entity_summary, select
+
+
+def test_summary_matches_groupby(diagram, tmp_path):
+    # caterpillar_size does not build the summary
+    assert diagram.entity_summary_df is None
+    assert not (tmp_path / "entity_summary.csv").exists()
+    summary = diagram.summarize_entities()
+    assert (tmp_path / "entity_summary.csv").exists()
+    for data_index, subset in diagram.complete_cohort_df.groupby("data_index"):
+        row = summary.loc[data_index]
+        colors = subset["color"].to_list()
+        run = 1
+        while run < len(colors) and colors[-run - 1] == colors[-1]:
+            run += 1
+        assert row["latest_color"] == colors[-1]
+        assert row["run_length"] == run
+        assert row["n_cohorts"] == len(colors)
+        assert row["green_count"] == colors.count("green")
+        assert row["green_recent"] == colors[-10:].count("green")
+        assert row["mean_radius"] == pytest.approx(
+            subset["final_cohort_radius"].mean()
+        )
+        assert row["last_radius"] == subset["final_cohort_radius"].iloc[-1]
+
+
+def test_select(diagram):
+    red = diagram.query_entities(latest_color="red")
+    summary = diagram.entity_summary_df
+    pd.testing.assert_frame_equal(red, summary[summary["latest_color"] == "red"])
+
+    top = select(summary, by="mean_radius", k=5, green_recent=(3, None))
+    expected = summary[summary["green_recent"] >= 3].sort_values(
+        "mean_radius", ascending=False, kind="stable"
+    )
+    np.testing.assert_allclose(
+        top["mean_radius"], expected["mean_radius"].iloc[:5]
+    )
+    assert (top["green_recent"] >= 3).all()
+
+    low = select(summary, by="run_length", k=3, ascending=True)
+    assert list(low["run_length"]) == sorted(summary["run_length"])[:3]
+    with pytest.raises(ValueError):
+        select(summary, unknown=1)
+
+
+def test_select_is_fast():
+    rng = np.random.default_rng(0)
+    n_entities, n_cohorts = 10 ** 5, 20
+    cohorts = pd.DataFrame(
+        {
+            "data_index": np.repeat(np.arange(n_entities), n_cohorts),
+            "Cohort": np.tile(np.arange(n_cohorts), n_entities),
+            "n_color": rng.integers(1, 8, n_entities * n_cohorts),
+            "final_cohort_radius": rng.integers(1, 5, n_entities * n_cohorts) * 2,
+        }
+    )
+    summary = entity_summary(cohorts)
+    tic = time.perf_counter()
+    top = select(summary, by="mean_radius", k=10, latest_color={"red", "grey"})
+    assert time.perf_counter() - tic < 0.5
+    assert len(top) == 10 and top["latest_color"].isin(["red", "grey"]).all()
@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram
+from caterpillard.markov import stationary_power, transition_probabilities
+from caterpillard.uncertainty import resample_transition_matrices
+
+
+def test_stationary_power_matches_iteration(diagram):
+    """
+    The batched matrix power must agree with the iterative
+    stationary matrix
+    """
+    prob = transition_probabilities(diagram.transition_mat)
+    np.testing.assert_allclose(prob, diagram.trans_mat_prob.astype(float))
+    np.testing.assert_allclose(
+        stationary_power(prob, 50),
+        diagram.stationary_mat_final_df.astype(float),
+        atol=1e-12,
+    )
+
+
+def test_bands_are_ordered(diagram):
+    bands = diagram.stationary_matrix_ci(n_replicates=300, n_sim_iter=50, seed=3)
+    for name in ["transition", "stationary"]:
+        assert (bands[name]["lower"] <= bands[name]["median"] + 1e-12).all().all()
+        assert (bands[name]["median"] <= bands[name]["upper"] + 1e-12).all().all()
+    assert list(bands["stationary"]["lower"].index) == list(diagram.transition_mat)
+
+
+def test_bands_seed_stable_across_workers(diagram):
+    kwargs = dict(
+        n_replicates=400, method="bootstrap", n_sim_iter=50, seed=11, chunk_size=100
+    )
+    serial = resample_transition_matrices(diagram.transition_mat, **kwargs)
+    pooled = resample_transition_matrices(
+        diagram.transition_mat, n_workers=2, **kwargs
+    )
+    pd.testing.assert_frame_equal(
+        serial["stationary"]["upper"], pooled["stationary"]["upper"]
+    )
+
+
+def test_bands_invalid_method(diagram):
+    with pytest.raises(ValueError):
+        diagram.stationary_matrix_ci(method="jackknife")
+
+
+@pytest.mark.parametrize("n_sim_iter", [0, -3])
+def test_invalid_n_sim_iter(diagram, n_sim_iter):
+    with pytest.raises(ValueError):
+        diagram.stationary_matrix_ci(n_sim_iter=n_sim_iter)
+    with pytest.raises(ValueError):
+        stationary_power(np.eye(7), n_sim_iter)
+
+
+def test_n_sim_iter_type(diagram):
+    with pytest.raises(TypeError):
+        diagram.stationary_matrix_ci(n_sim_iter=50.0)
+
+
+def test_bands_early_invoke(test_data, tmp_path):
+    """
+    This test will check whether an error gets raised due
+    to an early invoking of stationary_matrix_ci method
+    """
+    with pytest.raises(SystemExit):
+        cd = CaterpillarDiagram(
+            data=test_data.iloc[:10], relative=True, output_path=str(tmp_path),
+        )
+        assert cd.stationary_matrix_ci()
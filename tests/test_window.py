@@ -0,0 +1,115 @@
+import pytest
+import numpy as np
+import pandas as pd
+from caterpillard import CaterpillarDiagram
+from caterpillard.ragged import RaggedPanel
+
+COLUMNS = ["d11", "d12", "d2", "Cohort", "color", "n_color", "final_cohort_radius"]
+
+
+def _run(data, relative, tmp_path, name, **kwargs):
+    thresholds = kwargs.pop("thresholds", None)
+    cd = CaterpillarDiagram(
+        data=data, relative=relative, output_path=str(tmp_path / name), **kwargs
+    )
+    cd.data_summary()
+    cd.color_schema()
+    cd.caterpillar_size(thresholds=thresholds)
+    return cd
+
+
+def _tail(cohort_df, n):
+    if "data_index" not in cohort_df:
+        return cohort_df.iloc[-n:]
+    return cohort_df.groupby("data_index", sort=False).tail(n)
+
+
+def test_horizon_matches_tail_of_full_run(test_data, tmp_path):
+    data = test_data.iloc[:10]
+    full = _run(data, True, tmp_path, "full")
+    window = _run(data, True, tmp_path, "window", horizon=8, thresholds="history")
+
+    assert window.n_cohorts == 8
+    expected = _tail(full.complete_cohort_df, 8)
+    pd.testing.assert_frame_equal(
+        window.complete_cohort_df[COLUMNS].reset_index(drop=True),
+        expected[COLUMNS].reset_index(drop=True),
+        check_dtype=False,
+    )
+    for diff in ["d11", "d12"]:
+        for key, value in window.radius_thresholds[diff].items():
+            assert value == pytest.approx(full.radius_thresholds[diff][key])
+
+    # without the history thresholds only the window is summarised
+    local = _run(data, True, tmp_path, "local", horizon=8)
+    assert local.radius_thresholds["d11"]["count"] == len(expected)
+
+
+def test_horizon_fills_only_the_window(test_data, tmp_path):
+    data = test_data.iloc[:5].copy()
+    data.iloc[0, 0] = np.nan
+    data.iloc[1, -1] = np.nan
+    full = _run(data, True, tmp_path, "full")
+    window = _run(data, True, tmp_path, "window", horizon=4, thresholds="history")
+    # the stored input is left untouched
+    assert window.data.isna().sum().sum() == 2
+    pd.testing.assert_frame_equal(
+        window.complete_cohort_df[COLUMNS].reset_index(drop=True),
+        _tail(full.complete_cohort_df, 4)[COLUMNS].reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_horizon_individual(test_data, tmp_path):
+    data = test_data.iloc[3]
+    full = _run(data, False, tmp_path, "full")
+    window = _run(data, False, tmp_path, "window", horizon=5, thresholds="history")
+    pd.testing.assert_frame_equal(
+        window.complete_cohort_df[COLUMNS].reset_index(drop=True),
+        _tail(full.complete_cohort_df, 5)[COLUMNS].reset_index(drop=True),
+        check_dtype=False,
+    )
+    window.generate(n_last_cohorts=5)
+    assert len(window.cx) == 5
+
+
+def test_horizon_ragged(test_data, tmp_path):
+    long = (
+        test_data.iloc[:6]
+        .rename_axis("entity")
+        .reset_index()
+        .melt(id_vars="entity", var_name="period", value_name="value")
+    )
+    full = CaterpillarDiagram.from_long(long, output_path=str(tmp_path / "full"))
+    window = CaterpillarDiagram.from_long(
+        long, output_path=str(tmp_path / "window"), horizon=4
+    )
+    full.color_schema()
+    window.color_schema()
+    columns = ["d11", "d12", "Cohort", "color", "start_period", "segment"]
+    np.testing.assert_array_equal(
+        window.complete_cohort_df[columns[:-1]].to_numpy(),
+        _tail(full.complete_cohort_df, 4)[columns[:-1]].to_numpy(),
+    )
+
+
+def test_history_thresholds_ragged(test_data, tmp_path, monkeypatch):
+    long = (
+        test_data.iloc[:6]
+        .rename_axis("entity")
+        .reset_index()
+        .melt(id_vars="entity", var_name="period", value_name="value")
+    )
+    cd = CaterpillarDiagram.from_long(long, output_path=str(tmp_path), horizon=4)
+    cohorts = cd.data.cohorts()
+    # no cohort is classified
+    monkeypatch.setattr(RaggedPanel, "cohorts", None)
+    thresholds = cd.history_thresholds()
+    for diff in ["d11", "d12"]:
+        assert thresholds[diff]["max"] == cohorts[diff].abs().max()
+        assert thresholds[diff]["50%"] == pytest.approx(cohorts[diff].abs().median())
+
+
+def test_horizon_type(test_data):
+    with pytest.raises(TypeError):
+        CaterpillarDiagram(data=test_data, relative=True, horizon=2.5)